@@ -0,0 +1,134 @@
+# core/archive.py
+"""
+Archivo mensual de detecciones crudas.
+
+DetectionMetric sólo necesita las filas recientes (listados, compact); el
+histórico ya está sumado en DetectionRollup. `archive(before)` mueve las
+filas ya agregadas anteriores a `before` a una tabla por mes
+(`core_detectionmetric_archive_YYYYMM`: mismas columnas, sin claves
+ajenas, así el archivo sobrevive al borrado de la experiencia) en lotes
+de `chunk` filas, cada uno INSERT … SELECT + DELETE en una transacción.
+
+En Postgres las tablas mensuales son particiones por rango de
+`core_detectionmetric_archive`: el histórico se consulta entero desde la
+tabla padre y `drop(before)` retira meses completos con DROP TABLE en vez
+de borrar fila a fila. En SQLite son tablas sueltas. Los meses se cortan
+en UTC.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db        import connection, models, transaction
+
+from .models import DetectionMetric
+
+SOURCE  = DetectionMetric._meta.db_table
+PARENT  = f'{SOURCE}_archive'
+COLUMNS = ('id', 'experience_id', 'target_id', 'detected_at', 'rolled_up')
+_TABLE_RE = re.compile(rf'^{PARENT}_(\d{{4}})(\d{{2}})$')
+
+
+def partitioned() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def month_start(ts) -> datetime:
+    ts = ts.astimezone(dt_timezone.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def table_name(month: datetime) -> str:
+    return f'{PARENT}_{month:%Y%m}'
+
+
+def _column_sql() -> str:
+    fields = {f.column: f for f in DetectionMetric._meta.concrete_fields}
+    defs = []
+    for column in COLUMNS:
+        field = models.BigIntegerField() if column == 'id' else fields[column]
+        defs.append(f"{connection.ops.quote_name(column)} {field.db_type(connection)} "
+                    f"{'NULL' if field.null else 'NOT NULL'}")
+    return ', '.join(defs)
+
+
+def ensure_table(month: datetime) -> str:
+    """Crea (si falta) la tabla o partición del mes y devuelve su nombre."""
+    qn, name = connection.ops.quote_name, table_name(month)
+    with connection.cursor() as cursor:
+        if partitioned():
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {qn(PARENT)} ({_column_sql()}) '
+                           f'PARTITION BY RANGE ({qn("detected_at")})')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {qn(PARENT + "_exp_time")} '
+                           f'ON {qn(PARENT)} ({qn("experience_id")}, {qn("detected_at")})')
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(PARENT)} '
+                           f'FOR VALUES FROM (%s) TO (%s)', [month, next_month(month)])
+        else:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {qn(name)} ({_column_sql()}, PRIMARY KEY ({qn("id")}))')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {qn(name + "_exp_time")} '
+                           f'ON {qn(name)} ({qn("experience_id")}, {qn("detected_at")})')
+    return name
+
+
+def tables() -> list:
+    """[(mes 'YYYY-MM', tabla)] de los meses archivados, del más antiguo al más reciente."""
+    found = []
+    for name in connection.introspection.table_names():
+        m = _TABLE_RE.match(name)
+        if m:
+            found.append((f'{m[1]}-{m[2]}', name))
+    return sorted(found)
+
+
+def months() -> list:
+    """[(mes, tabla, filas)]."""
+    out = []
+    with connection.cursor() as cursor:
+        for month, name in tables():
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(name)}')
+            out.append((month, name, cursor.fetchone()[0]))
+    return out
+
+
+def archive(before, chunk: int = 5000) -> dict:
+    """Mueve las detecciones agregadas anteriores a `before`; devuelve {mes: filas}."""
+    qn   = connection.ops.quote_name
+    cols = ', '.join(qn(c) for c in COLUMNS)
+    old  = DetectionMetric.objects.filter(rolled_up=True, detected_at__lt=before)
+    first = old.order_by('detected_at').values_list('detected_at', flat=True).first()
+    moved = {}
+    month = month_start(first) if first else None
+    while month is not None and month < before:
+        end   = min(next_month(month), before)
+        rows  = old.filter(detected_at__gte=month, detected_at__lt=end).order_by('detected_at', 'id')
+        table = None
+        while True:
+            ids = list(rows.values_list('id', flat=True)[:chunk])
+            if not ids:
+                break
+            table = table or ensure_table(month)
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'INSERT INTO {qn(table)} ({cols}) SELECT {cols} FROM {qn(SOURCE)} '
+                        f'WHERE {qn("id")} IN ({", ".join(["%s"] * len(ids))})', ids,
+                    )
+                n = DetectionMetric.objects.filter(id__in=ids).delete()[0]
+            moved[f'{month:%Y-%m}'] = moved.get(f'{month:%Y-%m}', 0) + n
+        month = next_month(month)
+    return moved
+
+
+def drop(before: datetime) -> list:
+    """Borra los meses archivados anteriores al mes de `before`; devuelve los meses borrados."""
+    limit   = f'{month_start(before):%Y-%m}'
+    dropped = []
+    with connection.cursor() as cursor:
+        for month, name in tables():
+            if month < limit:
+                cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+                dropped.append(month)
+    return dropped
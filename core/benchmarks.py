@@ -0,0 +1,445 @@
+# core/benchmarks.py
+"""
+Suite de benchmarks reproducible (manage.py bench_suite).
+
+Siembra experiencias sintéticas (N targets × M assets por target) en la BD
+configurada —SQLite o Postgres vía DATABASE_URL, sin red— con la media en
+un directorio temporal, y mide:
+
+- escenarios: clientes concurrentes en proceso (django.test.Client en un
+  ThreadPoolExecutor, como bench_viewer) contra el visor, los viewsets de
+  la API, publish, la ingesta de DetectionMetric y la subida por trozos;
+  más la generación de marcadores NFT con cada perfil si node y
+  NFTMarkerCreator están instalados;
+- micro: funciones puras o casi (manifiesto, JSON Patch, caché, parsers)
+  repetidas `rounds` veces, con las estadísticas de pytest-benchmark
+  (min/max/mean/stddev/median/ops).
+
+El resultado es un JSON con el commit, la BD y las versiones, de modo que
+`--compare anterior.json` da el cociente escenario a escenario.
+"""
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import django
+from django.conf                    import settings
+from django.contrib.auth.models     import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db                      import connection, connections
+from django.db.models               import Q
+from django.test                    import Client
+from PIL                            import Image
+
+from . import cache, jsonpatch, manifest, markers, media, perf, publishing, viewer_cache
+from .counters import view_counter
+from .metrics  import metric_buffer
+from .models   import Asset, DetectionMetric, Experience, ExperienceAsset, Job, Target, UploadSession
+
+# métricas que se comparan entre ejecuciones y si "más es mejor"
+COMPARABLE = {'requests_per_second': True, 'ops': True, 'mb_per_second': True,
+              'p50_ms': False, 'p99_ms': False, 'median_ms': False, 'seconds': False}
+
+
+# ---------- Medición ----------
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * q) - 1))]
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'requests':            len(ordered),
+        'requests_per_second': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'p50_ms':              round(_percentile(ordered, 0.5) * 1000, 2),
+        'p99_ms':              round(_percentile(ordered, 0.99) * 1000, 2),
+        'errors':              errors,
+    }
+
+
+def hammer(clients: list, per_client: int, request) -> dict:
+    """`request(client, i)` → bool ok, `per_client` veces desde cada cliente a la vez."""
+    def run(client):
+        latencies, errors = [], 0
+        try:
+            for i in range(per_client):
+                t0 = time.perf_counter()
+                try:
+                    ok = request(client, i)
+                except Exception:
+                    ok = False
+                latencies.append(time.perf_counter() - t0)
+                errors += not ok
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        runs = list(pool.map(run, clients))
+    elapsed = time.perf_counter() - start
+    return summarize([l for lat, _ in runs for l in lat], elapsed, sum(e for _, e in runs))
+
+
+def micro(fn, rounds: int = 200, warmup: int = 5) -> dict:
+    """Estadísticas por llamada de `fn()` al estilo pytest-benchmark (en ms)."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    mean = statistics.fmean(times)
+    return {
+        'rounds':    rounds,
+        'min_ms':    round(min(times) * 1000, 4),
+        'max_ms':    round(max(times) * 1000, 4),
+        'mean_ms':   round(mean * 1000, 4),
+        'stddev_ms': round(statistics.pstdev(times) * 1000, 4),
+        'median_ms': round(statistics.median(times) * 1000, 4),
+        'ops':       round(1 / mean, 1) if mean else None,
+    }
+
+
+# ---------- Entorno y comparación ----------
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty  = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', 'core'],
+                                     cwd=settings.BASE_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit':    commit,
+        'dirty':     dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'database':  connection.vendor,
+        'cache':     settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        'python':    platform.python_version(),
+        'django':    django.get_version(),
+        'machine':   f'{platform.system()} {platform.machine()}',
+        'cpus':      os.cpu_count(),
+    }
+
+
+def compare(old: dict, new: dict) -> list:
+    """[(sección, nombre, métrica, antes, ahora, mejora)]; mejora > 1 es más rápido."""
+    rows = []
+    for section in ('scenarios', 'micro'):
+        for name, result in new.get(section, {}).items():
+            before = old.get(section, {}).get(name) or {}
+            for metric, higher_is_better in COMPARABLE.items():
+                a, b = before.get(metric), result.get(metric)
+                if not a or not b:
+                    continue
+                rows.append((section, name, metric, a, b, round(b / a if higher_is_better else a / b, 2)))
+    return rows
+
+
+# ---------- Datos sintéticos ----------
+def fixture_image(path: Path, size: int, seed: int = 0) -> Path:
+    """JPEG determinista con textura (ruido + rejilla) para que el creador encuentre puntos."""
+    img = Image.effect_noise((size, size), 64 + seed % 32).convert('RGB')
+    px  = img.load()
+    step = max(8, size // 24)
+    for x in range(0, size, step):
+        for y in range(size):
+            px[x, y] = (seed * 37 % 256, 0, 0)
+    img.save(path, 'JPEG', quality=90, dpi=(72, 72))
+    return path
+
+
+def _png() -> bytes:
+    buf = BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def seed(n_targets: int, n_assets: int, prefix: str) -> Experience:
+    """Experiencia publicada con `n_targets` targets y `n_assets` contenidos en cada uno."""
+    png = _png()
+    exp = Experience.objects.create(name=f'{prefix}-exp', is_published=True)
+    for i in range(n_targets):
+        target = Target.objects.create(
+            name=f'{prefix}-t{i}',
+            image=SimpleUploadedFile(f'{prefix}-t{i}.png', png),
+            pattfile=f'markers/{prefix}-{i}/marker',
+        )
+        exp.targets.add(target)
+        for j in range(n_assets):
+            asset = Asset.objects.create(
+                name=f'{prefix}-a{i}-{j}', type='model',
+                file=SimpleUploadedFile(f'{prefix}-a{i}-{j}.glb', b'glTF' + os.urandom(2048)),
+            )
+            ExperienceAsset.objects.create(
+                experience=exp, asset=asset, target=target,
+                transform={'pos': [j, 0, 0], 'rot': [0, 0, 0], 'scale': [1, 1, 1]},
+            )
+    return exp
+
+
+def cleanup(prefix: str):
+    exps    = Experience.objects.filter(name__startswith=prefix)
+    targets = Target.objects.filter(name__startswith=prefix)
+    assets  = Asset.objects.filter(name__startswith=prefix)
+    job_ids = [*targets.exclude(marker_job=None).values_list('marker_job', flat=True),
+               *assets.exclude(process_job=None).values_list('process_job', flat=True)]
+    renders = Q()   # trabajos `render` (miniaturas y QR) de lo sembrado
+    for model, qs in (('experience', exps), ('target', targets), ('asset', assets)):
+        renders |= Q(payload__model=model, payload__id__in=list(qs.values_list('pk', flat=True)))
+    job_ids += Job.objects.filter(renders, kind='render').values_list('pk', flat=True)
+    DetectionMetric.objects.filter(experience__in=exps).delete()
+    viewer_cache.invalidate(*exps.values_list('pk', flat=True))
+    exps.delete()
+    targets.delete()
+    assets.delete()
+    Job.objects.filter(pk__in=job_ids).delete()
+    User.objects.filter(username__startswith=prefix).delete()
+
+
+# ---------- Escenarios ----------
+class Suite:
+    """
+    Un banco de pruebas: siembra, ejecuta los escenarios pedidos y limpia.
+    Cada escenario es un método `scenario_<nombre>` que devuelve un dict.
+    """
+    SCENARIOS = ('viewer_warm', 'viewer_cold', 'api_experience_list', 'api_experience_detail',
+                 'api_manifest', 'api_targets', 'api_assets', 'api_scene_ops',
+                 'publish_rebuild', 'publish_unchanged', 'metrics_single', 'metrics_batch',
+                 'upload', 'marker_generation')
+    MICRO     = ('manifest_build', 'manifest_etag', 'jsonpatch_apply', 'orm_cache_hit',
+                 'viewer_cache_load', 'media_parse_range', 'perf_observe')
+
+    def __init__(self, targets=5, assets=3, clients=8, requests=25, rounds=200,
+                 upload_mb=8, images=None, log=None):
+        self.n_targets, self.n_assets = targets, assets
+        self.n_clients, self.per_client, self.rounds = clients, requests, rounds
+        self.upload_mb, self.images = upload_mb, images
+        self.log    = log or (lambda msg: None)
+        self.prefix = f'bench-{uuid.uuid4().hex[:8]}'
+
+    def run(self, only=None) -> dict:
+        wanted  = set(only or ())
+        results = {'environment': environment(), 'scenarios': {}, 'micro': {},
+                   'params': {'targets': self.n_targets, 'assets': self.n_assets,
+                              'clients': self.n_clients, 'requests': self.per_client,
+                              'rounds': self.rounds, 'upload_mb': self.upload_mb}}
+        saved = (view_counter.max_items, view_counter.max_age,
+                 metric_buffer.max_items, metric_buffer.max_age)
+        try:
+            self.log(f'sembrando {self.n_targets} targets × {self.n_assets} assets…')
+            self.exp  = seed(self.n_targets, self.n_assets, self.prefix)
+            self.user = User.objects.create_superuser(f'{self.prefix}-admin', password=None)
+            self.clients = []
+            for _ in range(self.n_clients):
+                client = Client()
+                client.force_login(self.user)
+                self.clients.append(client)
+            for kind, names in (('scenarios', self.SCENARIOS), ('micro', self.MICRO)):
+                for name in names:
+                    if wanted and name not in wanted:
+                        continue
+                    self.log(f'  {name}…')
+                    method = getattr(self, f'{kind}_{name}' if kind == 'micro' else f'scenario_{name}')
+                    results[kind][name] = method()
+        finally:
+            view_counter.flush()
+            metric_buffer.flush()
+            (view_counter.max_items, view_counter.max_age,
+             metric_buffer.max_items, metric_buffer.max_age) = saved
+            cleanup(self.prefix)
+        return results
+
+    def _get(self, url, expect=200):
+        return lambda client, i: client.get(url).status_code == expect
+
+    # --- visor ---
+    def scenario_viewer_warm(self):
+        url = f'/viewer/{self.exp.pk}/'
+        self.clients[0].get(url)
+        return hammer(self.clients, self.per_client, self._get(url))
+
+    def scenario_viewer_cold(self):
+        """HTML y manifiesto invalidados antes de cada visita: el camino de la primera visita."""
+        url = f'/viewer/{self.exp.pk}/'
+
+        def request(client, i):
+            viewer_cache.invalidate(self.exp.pk)
+            cache.touch(Experience, self.exp.pk)
+            return client.get(url).status_code == 200
+        return hammer(self.clients[:1], self.per_client, request)
+
+    # --- API ---
+    def scenario_api_experience_list(self):
+        return hammer(self.clients, self.per_client, self._get('/api/experiences/'))
+
+    def scenario_api_experience_detail(self):
+        return hammer(self.clients, self.per_client, self._get(f'/api/experiences/{self.exp.pk}/'))
+
+    def scenario_api_manifest(self):
+        return hammer(self.clients, self.per_client, self._get(f'/api/experiences/{self.exp.pk}/manifest/'))
+
+    def scenario_api_targets(self):
+        return hammer(self.clients, self.per_client, self._get('/api/targets/'))
+
+    def scenario_api_assets(self):
+        return hammer(self.clients, self.per_client, self._get('/api/assets/'))
+
+    def scenario_api_scene_ops(self):
+        """Un editor moviendo un contenido: lote de ops encadenado por versión."""
+        placement = ExperienceAsset.objects.filter(experience=self.exp).first()
+        if placement is None:
+            return {'skipped': 'sin contenidos (--assets 0)'}
+        url = f'/api/experiences/{self.exp.pk}/ops/'
+        version = Experience.objects.get(pk=self.exp.pk).version
+
+        def request(client, i):
+            nonlocal version
+            body = {'version': version,
+                    'update': [{'id': placement.pk, 'transform': {'pos': [i, 0, 0]}}]}
+            response = client.post(url, body, content_type='application/json')
+            if response.status_code == 200:
+                version = response.json()['version']
+            return response.status_code == 200
+        return hammer(self.clients[:1], self.per_client, request)
+
+    # --- publicación ---
+    def _publish(self, before=None):
+        url = f'/api/experiences/{self.exp.pk}/publish/'
+
+        def request(client, i):
+            if before:
+                before()
+            return client.post(url).status_code == 200
+        return hammer(self.clients[:1], max(1, self.per_client // 5), request)
+
+    def scenario_publish_rebuild(self):
+        """Publicación completa (HTML, paquete offline y QR) en cada vuelta."""
+        return self._publish(lambda: publishing.state_path(self.exp.pk).unlink(missing_ok=True))
+
+    def scenario_publish_unchanged(self):
+        self.clients[0].post(f'/api/experiences/{self.exp.pk}/publish/')
+        return self._publish()
+
+    # --- métricas ---
+    def _ingest(self, url, body, per_request):
+        view_counter.flush()
+        metric_buffer.flush()
+        qs = DetectionMetric.objects.filter(experience=self.exp)
+        qs.delete()
+        result = hammer(self.clients, self.per_client,
+                        lambda client, i: client.post(url, body, content_type='application/json')
+                        .status_code in (200, 201, 202))
+        metric_buffer.flush()
+        result['detections_per_second'] = round(result['requests_per_second'] * per_request, 1)
+        result['stored'] = qs.count()
+        qs.delete()
+        return result
+
+    def scenario_metrics_single(self):
+        return self._ingest('/api/metrics/', {'experience': self.exp.pk}, 1)
+
+    def scenario_metrics_batch(self, batch=50):
+        body = {'detections': [{'experience': self.exp.pk}] * batch}
+        return self._ingest('/api/metrics/batch/', body, batch)
+
+    # --- subida ---
+    def scenario_upload(self):
+        """Subida por trozos de `upload_mb` MB por la API hasta crear el Asset."""
+        client = self.clients[0]
+        data   = os.urandom(self.upload_mb * 1024 ** 2)
+        chunk  = settings.UPLOAD_CHUNK_SIZE
+        start  = time.perf_counter()
+        session = client.post('/api/uploads/', {
+            'kind': UploadSession.ASSET, 'filename': f'{self.prefix}.glb', 'size': len(data),
+            'name': f'{self.prefix}-upload', 'type': 'model',
+        }, content_type='application/json').json()
+        for offset in range(0, len(data), chunk):
+            response = client.put(f"/api/uploads/{session['id']}/chunk/", data[offset:offset + chunk],
+                                  content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+            if response.status_code != 200:
+                return {'error': response.json().get('detail', response.status_code)}
+        response = client.post(f"/api/uploads/{session['id']}/complete/")
+        elapsed = time.perf_counter() - start
+        return {'seconds': round(elapsed, 4), 'mb_per_second': round(self.upload_mb / elapsed, 1),
+                'chunks': -(-len(data) // chunk), 'status': response.status_code}
+
+    # --- marcadores ---
+    def scenario_marker_generation(self):
+        """NFTMarkerCreator sobre imágenes fijas con cada perfil (sin caché de marcadores)."""
+        if not shutil.which('node') or not markers.CREATOR_PACKAGE.exists():
+            return {'skipped': 'node o NFTMarkerCreator no instalados (tools/nft-marker)'}
+        out = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            if self.images:
+                sources = sorted(p for p in Path(self.images).iterdir()
+                                 if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+            else:
+                sources = [fixture_image(tmp / f'fixture-{size}.jpg', size, i)
+                           for i, size in enumerate((480, 1024))]
+            for src in sources:
+                for profile, spec in markers.PROFILES.items():
+                    work = tmp / f'{src.stem}-{profile}'
+                    work.mkdir()
+                    image = markers.prescale(str(src), work, spec['max_px']) if spec['max_px'] else src
+                    start = time.perf_counter()
+                    try:
+                        prefix = markers.generate_nft(str(image), str(work), spec['options'])
+                    except (OSError, subprocess.CalledProcessError) as e:
+                        out[f'{src.stem}:{profile}'] = {'error': str(e)}
+                        continue
+                    elapsed = time.perf_counter() - start
+                    size = sum(prefix.with_suffix(ext).stat().st_size for ext in markers.MARKER_EXTS
+                               if prefix.with_suffix(ext).exists())
+                    out[f'{src.stem}:{profile}'] = {'seconds': round(elapsed, 3), 'bytes': size}
+        return out
+
+    # ---------- Micro ----------
+    def micro_manifest_build(self):
+        exp = Experience.objects.get(pk=self.exp.pk)
+        return micro(lambda: manifest.build(exp), self.rounds // 4 or 1)
+
+    def micro_manifest_etag(self):
+        data = manifest.build(Experience.objects.get(pk=self.exp.pk))
+        return micro(lambda: manifest.etag(data), self.rounds)
+
+    def micro_jsonpatch_apply(self):
+        doc = {'scene': {'items': [{'id': i, 'pos': [0, 0, 0]} for i in range(50)]}}
+        ops = [{'op': 'replace', 'path': f'/scene/items/{i}/pos', 'value': [i, i, i]} for i in range(50)]
+        return micro(lambda: jsonpatch.apply(doc, ops), self.rounds)
+
+    def micro_orm_cache_hit(self):
+        cache.get_object('experience', Experience.objects, self.exp.pk)
+        return micro(lambda: cache.get_object('experience', Experience.objects, self.exp.pk), self.rounds)
+
+    def micro_viewer_cache_load(self):
+        viewer_cache.store(Experience.objects.get(pk=self.exp.pk))
+        return micro(lambda: viewer_cache.load(self.exp.pk), self.rounds)
+
+    def micro_media_parse_range(self):
+        return micro(lambda: media._parse_range('bytes=1000-2000', 10 ** 6), self.rounds * 10)
+
+    def micro_perf_observe(self):
+        registry = perf.Registry()   # aparte: no ensucia /metrics
+        return micro(lambda: registry.observe('yukiar_bench_seconds', (('name', 'bench'),), 0.01),
+                     self.rounds * 10)
+
+
+def run(media_root=None, **kwargs) -> dict:
+    """Suite(**kwargs).run() con MEDIA_ROOT temporal y los trabajos en cola (no en el request)."""
+    from django.test import override_settings
+    with tempfile.TemporaryDirectory(prefix='yukiar-bench-') as tmp, \
+            override_settings(MEDIA_ROOT=media_root or tmp, JOBS_EAGER=False):
+        only = kwargs.pop('only', None)
+        return Suite(**kwargs).run(only)
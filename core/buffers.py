@@ -0,0 +1,159 @@
+# core/buffers.py
+"""
+Acumuladores en memoria que vuelcan a la BD por lotes.
+
+Cada BufferedWriter junta elementos y llama a `write(items)` cuando llega a
+`max_items` o cuando pasan `max_age` segundos desde el primero pendiente.
+`flush_all()` vacía todos los buffers del proceso; se llama al salir
+(atexit) y desde el hook `worker_exit` de gunicorn.conf.py.
+
+Las vistas asíncronas usan `aadd()`: apuntar es sólo memoria y, cuando
+toca volcar, el INSERT/UPDATE va a un hilo aparte sin bloquear el bucle.
+
+Si `write()` falla el lote no se pierde: con un IntegrityError se reintenta
+elemento a elemento y sólo se descartan los que fallan por sí mismos; con
+cualquier otro error (BD caída, bloqueo) vuelve al buffer para el siguiente
+volcado, hasta `max_pending` elementos (se descartan los más antiguos).
+`write()` debe ser atómico para que reintentar no duplique nada.
+"""
+import atexit
+import logging
+import os
+import threading
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.db    import IntegrityError, connections
+
+log = logging.getLogger(__name__)
+
+_registry = weakref.WeakSet()
+
+
+class BufferedWriter:
+    def __init__(self, max_items: int, max_age: float, max_pending: int = None):
+        self.max_items   = max_items
+        self.max_age     = max_age
+        self.max_pending = max_pending or max_items * 10
+        self._lock     = threading.Lock()
+        self._items    = []
+        self._timer    = None
+        self._pid      = os.getpid()
+        _registry.add(self)
+
+    def write(self, items: list):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self._items)
+
+    def _append(self, items) -> bool:
+        """Apunta `items`; True si el buffer se llenó y hay que volcar."""
+        with self._lock:
+            self._check_fork()
+            self._items.extend(items)
+            full = len(self._items) >= self.max_items
+            if not full:
+                self._schedule()
+        return full
+
+    def _schedule(self):
+        # con self._lock tomado
+        if self._timer is None and self.max_age > 0:
+            self._timer = threading.Timer(self.max_age, self._flush_in_thread)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, *items):
+        if self._append(items):
+            try:
+                self.flush()
+            except Exception:
+                pass   # registrado y devuelto al buffer: la petición no falla por ello
+
+    async def aadd(self, *items):
+        if self._append(items):
+            await sync_to_async(self._flush_in_thread, thread_sensitive=False)()
+
+    def _take(self) -> list:
+        with self._lock:
+            items, self._items = self._items, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return items
+
+    def discard(self) -> int:
+        """Vacía el buffer sin escribir nada; devuelve cuántos elementos se tiran."""
+        return len(self._take())
+
+    def flush(self) -> int:
+        items = self._take()
+        if not items:
+            return 0
+        try:
+            self.write(items)
+        except IntegrityError:
+            return self._write_one_by_one(items)
+        except Exception:
+            self._requeue(items)
+            raise
+        return len(items)
+
+    def _write_one_by_one(self, items) -> int:
+        """Reintento tras un IntegrityError: se descartan sólo los elementos inválidos."""
+        written = 0
+        for i, item in enumerate(items):
+            try:
+                self.write([item])
+            except IntegrityError:
+                log.warning("%s: descartado %r", type(self).__name__, item, exc_info=True)
+            except Exception:
+                self._requeue(items[i:])
+                raise
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, items):
+        """Devuelve al principio del buffer lo que no se pudo volcar."""
+        log.exception("%s: no se pudieron volcar %d elementos", type(self).__name__, len(items))
+        with self._lock:
+            self._items[:0] = items
+            dropped = len(self._items) - self.max_pending
+            if dropped > 0:
+                del self._items[:dropped]
+                log.error("%s: buffer lleno, se descartan %d elementos", type(self).__name__, dropped)
+            self._schedule()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            pass   # ya registrado en flush()
+        finally:
+            connections.close_all()   # sólo las de este hilo
+
+    def _check_fork(self):
+        # tras un fork (gunicorn --preload) el hilo del temporizador no existe en el hijo
+        # y lo pendiente pertenece al padre
+        if self._pid != os.getpid():
+            self._pid, self._items, self._timer = os.getpid(), [], None
+
+
+def flush_all():
+    for writer in list(_registry):
+        try:
+            writer.flush()
+        except Exception:
+            pass   # ya registrado en flush(); seguir con el resto
+
+
+def discard_all():
+    """Para los tests: lo pendiente apunta a filas que se van a revertir y no debe
+    llegar a ninguna BD (ni a la real desde el flush_all de atexit)."""
+    for writer in list(_registry):
+        writer.discard()
+
+
+atexit.register(flush_all)
@@ -0,0 +1,140 @@
+# core/bundle.py
+"""
+Paquete offline de una experiencia publicada.
+
+Al publicar se genera MEDIA_ROOT/bundles/<exp_id>/<hash>.zip con el visor
+(index.html con rutas relativas), los ficheros del marcador, los contenidos
+ya optimizados, los scripts del visor y `precache.json`. El zip se escribe
+fichero a fichero desde disco (zipfile lee en bloques), así que la memoria
+no depende del tamaño de los assets, y se renombra al final: nunca hay un
+zip a medias con nombre definitivo.
+
+El mismo listado alimenta el service worker del visor (/viewer/<id>/sw.js).
+Al instalarse sólo descarga `install` (scripts, marcadores y los contenidos
+que el visor precarga); el resto lo guarda la primera vez que el visor lo
+pide al detectar su target. Como el hash forma parte del nombre de la
+caché, una nueva publicación invalida la anterior de golpe.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf                  import settings
+from django.contrib.staticfiles   import finders
+from django.template.loader       import render_to_string
+from django.templatetags.static   import static
+
+from . import manifest, perf
+from .markers      import MARKER_EXTS
+from .viewer_cache import write_atomic, viewer_context
+
+BUNDLE_DIR     = 'bundles'
+VIEWER_STATIC  = ('js/aframe/aframe.min.js', 'js/arjs/aframe-ar-nft.js')
+# ya comprimidos: deflate sólo gastaría CPU
+STORED_SUFFIXES = {'.glb', '.webp', '.jpg', '.jpeg', '.png', '.mp4', '.m4a', '.mp3', '.zip'}
+
+
+def bundle_dir(exp_id) -> Path:
+    return Path(settings.MEDIA_ROOT, BUNDLE_DIR, str(exp_id))
+
+
+def _media_path(url: str) -> Path:
+    return Path(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+
+
+def collect(scene: dict) -> list:
+    """[(url, ruta en disco)] de todo lo que el visor descarga, sin duplicados."""
+    files = {}
+    for path in VIEWER_STATIC:
+        found = finders.find(path)
+        if found:
+            files[static(path)] = Path(found)
+    for target in scene['targets']:
+        if target['marker']:
+            for ext in MARKER_EXTS:
+                files[target['marker'] + ext] = _media_path(target['marker'] + ext)
+        for placed in target['assets']:
+            if placed['asset']['url']:
+                files[placed['asset']['url']] = _media_path(placed['asset']['url'])
+    return [(url, path) for url, path in files.items() if path.is_file()]
+
+
+def _revision(path: Path) -> str:
+    st = path.stat()
+    return f'{st.st_size:x}-{st.st_mtime_ns:x}'
+
+
+def fingerprint(scene: dict, files: list) -> str:
+    digest = hashlib.sha256(manifest.etag(scene).encode())
+    for url, path in sorted(files):
+        digest.update(f'{url}\0{_revision(path)}\n'.encode())
+    return digest.hexdigest()[:20]
+
+
+def _relative(html: str) -> str:
+    # dentro del zip no hay servidor: /static/… y /media/… pasan a ser relativas
+    for prefix in (settings.STATIC_URL, settings.MEDIA_URL):
+        html = html.replace(f'"{prefix}', f'"{prefix.lstrip("/")}')
+    return html
+
+
+def _write_zip(dest: Path, html: str, files: list, precache: list):
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f'.{dest.name}.')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('index.html', _relative(html))
+            zf.writestr('precache.json', json.dumps(precache))
+            for url, path in files:
+                compress = zipfile.ZIP_STORED if path.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+                zf.write(path, url.lstrip('/'), compress_type=compress)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def build(exp, context=None, html=None) -> dict:
+    """Genera (si no existe ya) el paquete de `exp` y devuelve su índice."""
+    context = context or viewer_context(exp)
+    scene   = context['manifest']
+    files   = collect(scene)
+    version = fingerprint(scene, files)
+    out_dir = bundle_dir(exp.pk)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = out_dir / f'{version}.zip'
+
+    viewer_url = f'/viewer/{exp.pk}/'
+    precache = [{'url': url, 'revision': _revision(path)} for url, path in files]
+    lazy     = ({p['asset']['url'] for t in scene['targets'] for p in t['assets']}
+                - set(context.get('hints', {}).get('prefetch', ())))
+    if not zip_path.exists():
+        html = html or render_to_string('viewer.html', context)
+        with perf.timer('io', 'bundle.zip'):
+            _write_zip(zip_path, html, files, precache)
+
+    index = {
+        'version':  version,
+        'bundle':   f'{settings.MEDIA_URL}{BUNDLE_DIR}/{exp.pk}/{zip_path.name}',
+        'size':     zip_path.stat().st_size,
+        'viewer':   viewer_url,
+        'precache': precache,
+        'install':  [p['url'] for p in precache if p['url'] not in lazy],
+    }
+    write_atomic(out_dir / 'current.json', json.dumps(index))
+    for old in out_dir.glob('*.zip'):   # sólo se conserva la versión vigente
+        if old != zip_path:
+            old.unlink(missing_ok=True)
+    return index
+
+
+def current(exp_id):
+    """Índice de la última publicación o None."""
+    try:
+        return json.loads((bundle_dir(exp_id) / 'current.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,162 @@
+# core/cache.py
+"""
+Caché de lectura para las consultas calientes del ORM (Experience, Target,
+Asset y el manifiesto de escena) sobre el backend `default` de CACHES.
+
+Claves versionadas: cada modelo tiene una generación de tabla y cada fila
+la suya (`orm:v:<modelo>` / `orm:v:<modelo>:<pk>`). Una entrada se guarda
+bajo su nombre más las generaciones de las que depende, así que invalidar
+es sólo cambiar una generación (`touch`): las entradas viejas dejan de
+consultarse y caducan por TTL. core.signals llama a `touch` en
+post_save/post_delete/m2m_changed; los UPDATE por queryset, que no
+disparan señales, lo llaman a mano.
+
+Aciertos y fallos se cuentan en la propia caché por espacio de nombres
+(`stats()`); con un backend compartido (Redis) suman todos los workers.
+
+`aremember`/`aget_object` son las variantes para vistas asíncronas: sólo el
+fallo va al ORM async; la caché se consulta en línea porque un acierto en
+LocMem o Redis cuesta menos que el salto a un hilo de sync_to_async.
+"""
+import time
+
+from django.conf       import settings
+from django.core.cache import cache
+from django.db         import transaction
+from django.http       import Http404
+
+from . import manifest
+from .models import Experience
+
+PREFIX     = 'orm'
+NAMESPACES = ('experience', 'target', 'asset', 'manifest')
+_MISS      = object()
+
+
+def _vkey(model, pk=None) -> str:
+    label = model._meta.label_lower
+    return f'{PREFIX}:v:{label}' if pk is None else f'{PREFIX}:v:{label}:{pk}'
+
+
+def _dep_key(dep) -> str:
+    return _vkey(*dep) if isinstance(dep, tuple) else _vkey(dep)
+
+
+def touch(model, *pks):
+    """Invalida la tabla de `model` y esas filas; se repite al hacer commit."""
+    keys = [_vkey(model), *(_vkey(model, pk) for pk in pks)]
+
+    def bump():
+        version = time.time_ns()
+        cache.set_many({k: version for k in keys}, None)
+
+    bump()
+    # un lector entre el UPDATE y el COMMIT pudo cachear el dato viejo
+    transaction.on_commit(bump)
+
+
+def _versions(deps) -> list:
+    keys  = [_dep_key(d) for d in deps]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:   # nunca vista o desalojada: generación nueva
+            version = time.time_ns()
+            found[key] = version if cache.add(key, version, None) else cache.get(key, version)
+    return [found[k] for k in keys]
+
+
+def _count(namespace: str, hit: bool):
+    key = f"{PREFIX}:stats:{namespace}:{'hits' if hit else 'misses'}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:   # desalojada entre add e incr
+        pass
+
+
+def _entry_key(namespace: str, name, deps) -> str:
+    return f"{PREFIX}:{namespace}:{name}:{'.'.join(map(str, _versions(deps)))}"
+
+
+def remember(namespace: str, name, deps, builder, ttl: int = None):
+    """Valor de `builder()` cacheado hasta que cambie alguna de `deps` (modelo o (modelo, pk))."""
+    key = _entry_key(namespace, name, deps)
+    value = cache.get(key, _MISS)
+    _count(namespace, value is not _MISS)
+    if value is _MISS:
+        value = builder()
+        cache.set(key, value, settings.ORM_CACHE_TTL if ttl is None else ttl)
+    return value
+
+
+def get_object(namespace: str, queryset, pk, deps=(), variant: str = ''):
+    """queryset.get(pk=pk) cacheado (None si no existe); `variant` distingue querysets."""
+    model = queryset.model
+    return remember(namespace, f'{pk}:{variant}', [(model, pk), *deps],
+                    lambda: queryset.filter(pk=pk).first())
+
+
+async def aremember(namespace: str, name, deps, builder, ttl: int = None):
+    """remember() con `builder` asíncrono; comparte las entradas con la versión síncrona."""
+    key = _entry_key(namespace, name, deps)
+    value = cache.get(key, _MISS)
+    _count(namespace, value is not _MISS)
+    if value is _MISS:
+        value = await builder()
+        cache.set(key, value, settings.ORM_CACHE_TTL if ttl is None else ttl)
+    return value
+
+
+async def aget_object(namespace: str, queryset, pk, deps=(), variant: str = ''):
+    model = queryset.model
+    return await aremember(namespace, f'{pk}:{variant}', [(model, pk), *deps],
+                           lambda: queryset.filter(pk=pk).afirst())
+
+
+def scene_manifest(exp_id: int, loader):
+    """(manifiesto, etag) de la experiencia; `loader()` devuelve la Experience en un fallo."""
+    def build():
+        data = manifest.build(loader())
+        return data, manifest.etag(data)
+
+    # sólo la generación de la experiencia: core.signals y core.jobs la cambian cuando
+    # cambia algo de la escena (targets, contenidos, colocaciones o estado del marcador)
+    return remember('manifest', exp_id, [(Experience, exp_id)], build)
+
+
+def stats() -> dict:
+    keys = [f'{PREFIX}:stats:{ns}:{kind}' for ns in NAMESPACES for kind in ('hits', 'misses')]
+    counts = cache.get_many(keys)
+    out = {}
+    for ns in NAMESPACES:
+        hits   = counts.get(f'{PREFIX}:stats:{ns}:hits', 0)
+        misses = counts.get(f'{PREFIX}:stats:{ns}:misses', 0)
+        out[ns] = {'hits': hits, 'misses': misses,
+                   'hit_rate': hits / (hits + misses) if hits + misses else None}
+    out['backend'] = settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1]
+    return out
+
+
+# ---------- Viewsets ----------
+class CachedObjectMixin:
+    """
+    get_object() de las lecturas (GET) desde la caché; las escrituras siguen
+    leyendo de la BD. `cache_depends`: modelos extra de los que depende la
+    representación (p. ej. Job para marker_status).
+    """
+    cache_namespace = None
+    cache_depends   = ()
+
+    def get_object(self):
+        if self.request.method != 'GET':
+            return super().get_object()
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            obj = get_object(self.cache_namespace, self.get_queryset(), pk, self.cache_depends,
+                             variant=self.request.GET.get('fields', ''))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
@@ -0,0 +1,37 @@
+# core/counters.py
+"""
+Contador de visitas del visor sin contención.
+
+Cada visita se apunta en memoria y se vuelca como un único
+`UPDATE ... SET views = views + n` por experiencia cada
+VIEWS_FLUSH_INTERVAL segundos (o VIEWS_BUFFER_SIZE visitas), en lugar de
+bloquear la fila de Experience en cada escaneo. `Experience.total_views`
+suma lo pendiente de este proceso al valor guardado.
+"""
+from collections import Counter
+
+from django.conf      import settings
+from django.db        import transaction
+from django.db.models import F
+
+from .        import cache
+from .buffers import BufferedWriter
+from .models  import Experience
+
+
+class ViewCounter(BufferedWriter):
+    def write(self, items):
+        # atómico: si falla una experiencia, BufferedWriter reintenta el lote entero
+        # y las ya sumadas no deben contarse dos veces
+        counts = sorted(Counter(items).items())
+        with transaction.atomic():
+            for exp_id, n in counts:
+                Experience.objects.filter(pk=exp_id).update(views=F('views') + n)
+            transaction.on_commit(lambda: cache.touch(Experience, *(exp_id for exp_id, _ in counts)))
+
+    def pending(self, exp_id) -> int:
+        with self._lock:
+            return self._items.count(exp_id)
+
+
+view_counter = ViewCounter(settings.VIEWS_BUFFER_SIZE, settings.VIEWS_FLUSH_INTERVAL)
@@ -0,0 +1,231 @@
+# core/jobs.py
+"""
+Cola de trabajos respaldada por la base de datos (SQLite/Postgres, sin broker).
+
+Las vistas encolan con `enqueue()` y responden de inmediato; el comando
+`manage.py run_jobs` reclama trabajos pendientes y los ejecuta en un pool
+de procesos acotado.
+"""
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from multiprocessing.util import Finalize
+
+from django.conf             import settings
+from django.db               import connections, transaction
+from django.db.models        import F
+from django.utils            import timezone
+from django.utils.module_loading import import_string
+
+from . import cache, perf
+from .models import Experience, Job
+
+log = logging.getLogger(__name__)
+
+# kind → callable(job); se resuelven de forma perezosa en cada proceso
+HANDLERS = {
+    'marker': 'core.markers.build_target_marker',
+    'asset':  'core.optimize.optimize_asset',
+    'render': 'core.renders.render',
+}
+
+
+def enqueue(kind: str, **payload) -> Job:
+    """Crea un trabajo pendiente. Con JOBS_EAGER se ejecuta al hacer commit."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    job = Job.objects.create(kind=kind, payload=payload)
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: _run_eager(job.pk))
+    return job
+
+
+def enqueue_many(kind: str, payloads, max_attempts: int = None) -> list:
+    """Como enqueue() para muchos trabajos en un solo INSERT."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    extra = {'max_attempts': max_attempts} if max_attempts else {}
+    created = Job.objects.bulk_create([Job(kind=kind, payload=p, **extra) for p in payloads])
+    cache.touch(Job)
+    if getattr(settings, 'JOBS_EAGER', False):
+        for job in created:
+            transaction.on_commit(lambda pk=job.pk: _run_eager(pk))
+    return created
+
+
+def _touch_status(*job_ids):
+    """Invalida los trabajos y el manifiesto de las experiencias cuyo marker_status muestran."""
+    cache.touch(Job, *job_ids)
+    exp_ids = set(Experience.objects.filter(targets__marker_job__in=job_ids).values_list('id', flat=True))
+    if exp_ids:
+        cache.touch(Experience, *exp_ids)
+
+
+def _run_eager(job_id: int):
+    if claim_one(job_id):
+        run(job_id)
+
+
+def set_progress(job: Job, progress: int):
+    job.progress = max(0, min(100, int(progress)))
+    Job.objects.filter(pk=job.pk).update(progress=job.progress)
+    cache.touch(Job, job.pk)
+
+
+# ---------- Reclamo / ejecución ----------
+def claim_one(job_id: int) -> bool:
+    """UPDATE condicional: sólo un worker gana la carrera por cada trabajo."""
+    won = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ) == 1
+    if won:
+        _touch_status(job_id)
+    return won
+
+
+def claim(limit: int, ids=None) -> list:
+    qs = Job.objects.filter(status=Job.PENDING).order_by('created_at', 'id')
+    if ids is not None:
+        qs = qs.filter(pk__in=ids)
+    claimed = []
+    for pk in qs.values_list('id', flat=True)[:limit * 2]:
+        if claim_one(pk):
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def fail(job: Job, error: str) -> str:
+    """Registra un intento fallido: vuelve a la cola o, agotados los intentos, queda FAILED."""
+    status = Job.PENDING if job.attempts < job.max_attempts else Job.FAILED
+    Job.objects.filter(pk=job.pk).update(
+        status=status,
+        error=error[-4000:],
+        finished_at=timezone.now() if status == Job.FAILED else None,
+    )
+    _touch_status(job.pk)
+    return status
+
+
+def run(job_id: int) -> str:
+    """Ejecuta un trabajo ya reclamado y devuelve su estado final."""
+    job = Job.objects.get(pk=job_id)
+    start = time.perf_counter()
+    try:
+        import_string(HANDLERS[job.kind])(job)
+    except Exception:
+        log.exception("Trabajo %s falló", job)
+        status = fail(job, traceback.format_exc())
+        _observe(job, status, start)
+        return status
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, progress=100, error='', finished_at=timezone.now()
+    )
+    _touch_status(job.pk)
+    _observe(job, Job.DONE, start)
+    return Job.DONE
+
+
+def _observe(job: Job, status: str, start: float):
+    perf.registry.observe('yukiar_job_duration_seconds', (('kind', job.kind), ('status', status)),
+                          time.perf_counter() - start)
+    perf.registry.dump(force=True)   # los hijos del pool no pasan por el middleware
+
+
+def unclaim(job_id: int):
+    """Deshace claim_one() de un trabajo que no llegó a ejecutarse."""
+    Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+        status=Job.PENDING, started_at=None, attempts=F('attempts') - 1
+    )
+    _touch_status(job_id)
+
+
+def requeue_stale(older_than: timedelta) -> int:
+    """Devuelve a la cola trabajos `running` huérfanos (worker caído)."""
+    cutoff = timezone.now() - older_than
+    stale  = list(Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff).values_list('id', flat=True))
+    count  = Job.objects.filter(pk__in=stale, status=Job.RUNNING).update(status=Job.PENDING)
+    if count:
+        _touch_status(*stale)
+    return count
+
+
+# ---------- Pool de procesos ----------
+def _init_worker():
+    # cada proceso hijo abre sus propias conexiones
+    connections.close_all()
+    # y al salir suma sus métricas a PERF_DIR/_total.json (multiprocessing no ejecuta atexit)
+    Finalize(None, perf.registry.retire, exitpriority=10)
+
+
+def _run_in_worker(job_id: int):
+    try:
+        return job_id, run(job_id)
+    finally:
+        connections.close_all()
+
+
+def drain(workers: int = None, ids=None, poll: float = None, on_done=None) -> dict:
+    """
+    Ejecuta trabajos pendientes en paralelo con como máximo `workers` procesos.
+
+    `ids` limita el drenaje a esos trabajos; `poll` (segundos) mantiene el
+    bucle vivo esperando trabajo nuevo; `on_done(job_id, status)` se llama
+    al terminar cada uno. Devuelve {job_id: estado_final}.
+
+    Si un proceso del pool muere (OOM, node/ffmpeg que revientan) el pool
+    queda roto: los trabajos que llevaba cuentan como intento fallido
+    (vuelven a la cola o quedan FAILED) y se crea un pool nuevo.
+    """
+    workers = workers or getattr(settings, 'JOBS_WORKERS', None) or os.cpu_count() or 1
+    results = {}
+    running = {}   # future → job_id
+    pool    = None
+    try:
+        while True:
+            if pool is None:
+                connections.close_all()   # nunca heredar sockets/ficheros abiertos al hacer fork
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            broken = False
+            free = workers - len(running)
+            for pk in claim(free, ids) if free else ():
+                if broken:
+                    unclaim(pk)
+                    continue
+                try:
+                    running[pool.submit(_run_in_worker, pk)] = pk
+                except BrokenProcessPool:
+                    unclaim(pk)
+                    broken = True
+            if not running and not broken:
+                if poll is None:
+                    break
+                time.sleep(poll)
+                continue
+            done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+            for fut in done:
+                job_id = running.pop(fut)
+                try:
+                    status = fut.result()[1]
+                except BrokenProcessPool as e:
+                    log.error("Trabajo %s: el proceso del pool murió", job_id)
+                    status = fail(Job.objects.get(pk=job_id), f'{type(e).__name__}: {e}')
+                    broken = True
+                results[job_id] = status
+                if on_done:
+                    on_done(job_id, status)
+            if broken:
+                # los futuros que queden los resuelve wait() en las siguientes vueltas
+                pool.shutdown(wait=False)
+                pool = None
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
@@ -0,0 +1,98 @@
+# core/jsonpatch.py
+"""
+Subconjunto de JSON Patch (RFC 6902) para Experience.config_json.
+
+Operaciones admitidas: add, remove, replace y test. Las rutas son JSON
+Pointer (RFC 6901), con `-` para añadir al final de una lista. El
+documento original no se modifica; `apply()` devuelve una copia.
+"""
+import copy
+
+OPS = ('add', 'remove', 'replace', 'test')
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _parse(pointer: str) -> list:
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f'Ruta inválida: {pointer!r}')
+    return [p.replace('~1', '/').replace('~0', '~') for p in pointer[1:].split('/')]
+
+
+def _index(container: list, token: str, allow_end=False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise PatchError(f'Índice inválido: {token!r}')
+    idx = int(token)
+    if idx > len(container) or (idx == len(container) and not allow_end):
+        raise PatchError(f'Índice fuera de rango: {idx}')
+    return idx
+
+
+def _walk(doc, tokens: list):
+    """Devuelve el contenedor padre del último token."""
+    for token in tokens[:-1]:
+        if isinstance(doc, dict) and token in doc:
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_index(doc, token)]
+        else:
+            raise PatchError(f'Ruta inexistente: /{"/".join(tokens)}')
+    return doc
+
+
+def _apply_one(doc, op: dict):
+    kind, path = op.get('op'), op.get('path')
+    if kind not in OPS or not isinstance(path, str):
+        raise PatchError(f'Operación inválida: {op!r}')
+    tokens = _parse(path)
+    if not tokens:   # la raíz entera
+        if kind == 'test':
+            if doc != op.get('value'):
+                raise PatchError('test fallido en /')
+            return doc
+        if kind == 'remove':
+            return {}
+        return copy.deepcopy(op['value'])
+
+    parent, last = _walk(doc, tokens), tokens[-1]
+    if kind in ('add', 'replace', 'test') and 'value' not in op:
+        raise PatchError(f'Falta "value" en {op!r}')
+
+    if isinstance(parent, dict):
+        if kind != 'add' and last not in parent:
+            raise PatchError(f'Ruta inexistente: {path}')
+        if kind == 'test':
+            if parent[last] != op['value']:
+                raise PatchError(f'test fallido en {path}')
+        elif kind == 'remove':
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op['value'])
+    elif isinstance(parent, list):
+        idx = _index(parent, last, allow_end=(kind == 'add'))
+        if kind == 'test':
+            if parent[idx] != op['value']:
+                raise PatchError(f'test fallido en {path}')
+        elif kind == 'remove':
+            del parent[idx]
+        elif kind == 'replace':
+            parent[idx] = copy.deepcopy(op['value'])
+        else:
+            parent.insert(idx, copy.deepcopy(op['value']))
+    else:
+        raise PatchError(f'Ruta inexistente: {path}')
+    return doc
+
+
+def apply(doc, ops: list):
+    """Aplica `ops` en orden sobre una copia de `doc`; todo o nada."""
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        doc = _apply_one(doc, op)
+    return doc
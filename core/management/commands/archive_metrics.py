@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import archive, rollups
+from core.metrics import metric_buffer
+
+
+class Command(BaseCommand):
+    help = ('Mueve las detecciones crudas ya agregadas con más de --older-than-days días a '
+            'tablas mensuales (particiones de core_detectionmetric_archive en Postgres). '
+            '--drop-before YYYY-MM borra meses archivados completos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.METRICS_ARCHIVE_AFTER_DAYS,
+                            help='Antigüedad a partir de la cual se archiva (por defecto METRICS_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--chunk', type=int, default=5000, help='Filas por transacción.')
+        parser.add_argument('--drop-before', metavar='YYYY-MM', default=None,
+                            help='Borra los meses archivados anteriores a éste.')
+        parser.add_argument('--list', action='store_true', help='Sólo lista los meses archivados.')
+
+    def handle(self, *args, **opts):
+        if not opts['list']:
+            metric_buffer.flush()
+            rollups.compact(chunk=opts['chunk'])   # sólo se archiva lo ya sumado
+            cutoff = timezone.now() - timedelta(days=opts['older_than_days'])
+            moved  = archive.archive(cutoff, chunk=opts['chunk'])
+            for month, n in moved.items():
+                self.stdout.write(f'  {month}: {n} detecciones archivadas')
+            self.stdout.write(f'archivadas: {sum(moved.values())} (anteriores a {cutoff:%Y-%m-%d %H:%M})')
+
+            if opts['drop_before']:
+                try:
+                    before = datetime.strptime(opts['drop_before'], '%Y-%m').replace(tzinfo=dt_timezone.utc)
+                except ValueError:
+                    raise CommandError('--drop-before debe ser YYYY-MM')
+                dropped = archive.drop(before)
+                self.stdout.write(f"meses borrados: {', '.join(dropped) or 'ninguno'}")
+
+        rows = archive.months()
+        kind = 'particiones' if archive.partitioned() else 'tablas'
+        self.stdout.write(f'{len(rows)} mes(es) archivados ({kind} {archive.PARENT}_YYYYMM)')
+        for month, name, n in rows:
+            self.stdout.write(f'  {month}  {n:>10}  {name}')
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from core import viewer_cache
+from core.benchmarks import summarize
+from core.models     import Asset, DetectionMetric, Experience, ExperienceAsset, Target
+
+
+async def _read_response(reader) -> tuple:
+    """(status, cerrar) de una respuesta HTTP/1.1 leída entera."""
+    head  = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status  = int(lines[0].split()[1])
+    headers = {k.strip().lower(): v.strip() for k, v in (l.split(':', 1) for l in lines[1:] if ':' in l)}
+    close   = headers.get('connection', '').lower() == 'close'
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif status not in (204, 304):
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def _load(port: int, build, n_connections: int, duration: float) -> dict:
+    """`n_connections` conexiones keep-alive (si el servidor la admite) durante `duration` s."""
+    loop     = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    latencies, errors = [], 0
+
+    async def client(i):
+        nonlocal errors
+        reader = writer = None
+        n = 0
+        while loop.time() < deadline:
+            t0 = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(build(i, n))
+                await writer.drain()
+                status, close = await _read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.01)   # servidor saturado: no girar en vacío
+                continue
+            latencies.append(time.perf_counter() - t0)
+            errors += status >= 400
+            n += 1
+            if close:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(n_connections)))
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def _request(method: str, path: str, body: dict = None, cookie: str = '') -> bytes:
+    data = json.dumps(body).encode() if body is not None else b''
+    head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+    if cookie:
+        head += f'Cookie: {cookie}\r\n'
+    if body is not None:
+        head += f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+    return (head + '\r\n').encode() + data
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Compara el camino WSGI (workers síncronos de gunicorn, comportamiento anterior) '
+            'con el ASGI (workers uvicorn + vistas asíncronas) en las rutas públicas: visor, '
+            '/api/metrics/batch/ y save_config. Arranca gunicorn en cada modo en un puerto '
+            'local, lanza muchas conexiones concurrentes y mide req/s y p99. Usa la BD '
+            'configurada (DATABASE_URL) y borra lo que crea.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=200, help='Conexiones simultáneas.')
+        parser.add_argument('--duration', type=float, default=10, help='Segundos por escenario.')
+        parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn en ambos modos.')
+        parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        exp    = self._seed(prefix)
+        user   = User.objects.create_user(f'{prefix}-viewer')
+        client = Client()
+        client.force_login(user)   # el visor exige sesión
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        self.viewer_request = _request('GET', f'/viewer/{exp.pk}/', cookie=cookie)
+        scenarios = {
+            'viewer':        lambda i, n: self.viewer_request,
+            'metrics_batch': lambda i, n: _request('POST', '/api/metrics/batch/',
+                                                   {'detections': [{'experience': exp.pk}] * 10}),
+            'save_config':   lambda i, n: _request('PATCH', f'/save_config/{exp.pk}/',
+                                                   {'config_json': {'client': i, 'n': n}}),
+        }
+        results = {'database': connection.vendor, 'connections': opts['connections'],
+                   'duration': opts['duration'], 'workers': opts['workers']}
+        try:
+            with tempfile.TemporaryDirectory(prefix='yukiar-bench-') as tmp:
+                for mode in opts['modes']:
+                    results[mode] = self._run_mode(mode, tmp, exp, scenarios, opts)
+        finally:
+            DetectionMetric.objects.filter(experience=exp).delete()
+            viewer_cache.invalidate(exp.pk)
+            exp.delete()
+            Target.objects.filter(name__startswith=prefix).delete()
+            Asset.objects.filter(name__startswith=prefix).delete()
+            client.logout()
+            user.delete()
+
+        if 'wsgi' in results and 'asgi' in results:
+            for name in scenarios:
+                base, new = results['wsgi'][name], results['asgi'][name]
+                if base.get('requests_per_second') and new.get('requests_per_second'):
+                    new['speedup'] = round(new['requests_per_second'] / base['requests_per_second'], 2)
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"BD: {results['database']}  conexiones={opts['connections']}  "
+                          f"workers={opts['workers']}  {opts['duration']}s por escenario")
+        for mode in opts['modes']:
+            for name, r in results[mode].items():
+                if not r.get('requests'):
+                    self.stdout.write(f"  {mode} {name:14} sin respuestas  errores={r['errors']}")
+                    continue
+                self.stdout.write(f"  {mode} {name:14} {r['requests_per_second']:>9.1f} req/s  "
+                                  f"p50={r['p50_ms']}ms  p99={r['p99_ms']}ms  errores={r['errors']}"
+                                  + (f"  x{r['speedup']}" if 'speedup' in r else ''))
+
+    def _seed(self, prefix: str) -> Experience:
+        """Experiencia publicada con targets y contenidos sin ficheros (el visor sólo pinta URLs)."""
+        exp = Experience.objects.create(name=f'{prefix}-exp', is_published=True)
+        targets = Target.objects.bulk_create([
+            Target(name=f'{prefix}-t{i}', image=f'targets/{prefix}-t{i}.png', pattfile=f'markers/{prefix}-{i}/marker')
+            for i in range(3)
+        ])
+        exp.targets.add(*targets)
+        assets = Asset.objects.bulk_create([
+            Asset(name=f'{prefix}-a{i}', type='model', file=f'assets/{prefix}-a{i}.glb', size_mb=1)
+            for i in range(len(targets) * 2)
+        ])
+        ExperienceAsset.objects.bulk_create([
+            ExperienceAsset(experience=exp, asset=asset, target=targets[i % len(targets)])
+            for i, asset in enumerate(assets)
+        ])
+        return exp
+
+    def _run_mode(self, mode: str, tmp: str, exp, scenarios: dict, opts) -> dict:
+        port = _free_port()
+        env  = {**os.environ, 'SERVER_MODE': mode, 'PERF_DIR': os.path.join(tmp, mode)}
+        env.pop('ASYNC_PUBLIC_VIEWS', None)   # que lo decida SERVER_MODE
+        log  = open(os.path.join(tmp, f'{mode}.log'), 'wb')
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+             '--workers', str(opts['workers']), '--backlog', str(max(2048, opts['connections']))],
+            cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            self._wait_ready(server, port, exp, log.name)
+            out = {}
+            for name, build in scenarios.items():
+                if not opts['json']:
+                    self.stderr.write(f'  {mode}: {name}…')
+                out[name] = asyncio.run(_load(port, build, opts['connections'], opts['duration']))
+            return out
+        finally:
+            server.terminate()   # worker_exit vuelca los buffers antes de salir
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            log.close()
+
+    def _wait_ready(self, server, port: int, exp, log_path: str, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn terminó al arrancar (ver {log_path}):\n'
+                                   + open(log_path, encoding='utf-8', errors='replace').read()[-2000:])
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                    s.sendall(self.viewer_request)   # de paso renderiza el visor
+                    if s.recv(16).startswith(b'HTTP/1.1 200'):
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'gunicorn no respondió en {timeout:.0f}s en el puerto {port}')
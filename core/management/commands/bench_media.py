@@ -0,0 +1,109 @@
+import http.client
+import json
+import os
+import random
+import time
+import urllib.parse
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.views.static import serve as static_serve
+
+from core import media
+from core.views import media_view
+
+
+def _drain(response) -> int:
+    sent = 0
+    if response.streaming:
+        for chunk in response.streaming_content:
+            sent += len(chunk)
+    else:
+        sent = len(response.content)
+    response.close()
+    return sent
+
+
+class Command(BaseCommand):
+    help = ('Compara el servicio de media anterior (django.views.static.serve, el de '
+            'static() en DEBUG) con core.media: descarga completa, saltos por Range y '
+            'variante .gz. Con --url mide además por HTTP contra un servidor en marcha '
+            '(gunicorn: ahí se nota sendfile). Crea un fichero temporal en MEDIA_ROOT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=32, help='Tamaño del fichero de prueba.')
+        parser.add_argument('--requests', type=int, default=20, help='Peticiones por escenario.')
+        parser.add_argument('--seek-kb', type=int, default=512, help='Bytes pedidos en cada salto.')
+        parser.add_argument('--url', default='', help='Base de un servidor en marcha, p. ej. http://127.0.0.1:8000')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        size, n, seek = opts['size_mb'] * 1024 ** 2, opts['requests'], opts['seek_kb'] * 1024
+        rel  = f'bench/media-{os.getpid()}.glb'
+        path = Path(settings.MEDIA_ROOT, rel)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rng = random.Random(0)
+        with path.open('wb') as fh:   # mitad ruido, mitad relleno: comprime como un GLB típico
+            for _ in range(size // (1024 ** 2)):
+                fh.write(rng.randbytes(512 * 1024) + bytes(512 * 1024))
+        media.precompress(path)
+
+        factory = RequestFactory()
+        offsets = [rng.randrange(0, size - seek) for _ in range(n)]
+        results = {'size_mb': opts['size_mb'], 'requests': n, 'seek_kb': opts['seek_kb']}
+
+        def scenario(name, view, headers=lambda i: {}):
+            sent, start = 0, time.perf_counter()
+            for i in range(n):
+                sent += _drain(view(factory.get(f'{settings.MEDIA_URL}{rel}', headers=headers(i))))
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                'requests_per_second': round(n / elapsed, 1),
+                'mb_sent':             round(sent / 1024 ** 2, 1),
+                'ms_per_request':      round(elapsed / n * 1000, 2),
+            }
+
+        old = lambda request: static_serve(request, rel, document_root=settings.MEDIA_ROOT)
+        new = lambda request: media_view(request, rel)
+        ranged = lambda i: {'Range': f'bytes={offsets[i]}-{offsets[i] + seek - 1}'}
+        gzipped = lambda i: {'Accept-Encoding': 'gzip'}
+        try:
+            scenario('static_full', old)
+            scenario('media_full', new)
+            scenario('static_seek', old, ranged)   # sin rangos: baja el fichero entero
+            scenario('media_seek', new, ranged)
+            scenario('media_gzip', new, gzipped)
+            if opts['url']:
+                results['http'] = self._http(opts['url'], rel, n, offsets, seek)
+        finally:
+            for f in (path, *media.variants(path)):
+                f.unlink(missing_ok=True)
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"fichero {opts['size_mb']} MB, {n} peticiones por escenario")
+        for name, row in results.items():
+            if isinstance(row, dict) and 'mb_sent' in row:
+                self.stdout.write(f"  {name:<14} {row['requests_per_second']:>8} req/s  "
+                                  f"{row['ms_per_request']:>8} ms/req  {row['mb_sent']:>8} MB")
+        for name, row in results.get('http', {}).items():
+            self.stdout.write(f"  http {name:<9} {row['mb_per_second']:>8} MB/s  {row['ms_per_request']:>8} ms/req")
+
+    def _http(self, base, rel, n, offsets, seek) -> dict:
+        url  = urllib.parse.urlsplit(base)
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        out  = {}
+        for name, headers in (('full', lambda i: {}),
+                              ('seek', lambda i: {'Range': f'bytes={offsets[i]}-{offsets[i] + seek - 1}'})):
+            sent, start = 0, time.perf_counter()
+            for i in range(n):
+                conn.request('GET', f'{settings.MEDIA_URL}{rel}', headers=headers(i))
+                sent += len(conn.getresponse().read())
+            elapsed = time.perf_counter() - start
+            out[name] = {'mb_per_second': round(sent / 1024 ** 2 / elapsed, 1),
+                         'ms_per_request': round(elapsed / n * 1000, 2)}
+        conn.close()
+        return out
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from core.metrics import metric_buffer
+from core.models  import DetectionMetric, Experience
+
+
+class Command(BaseCommand):
+    help = ('Compara la ingesta de DetectionMetric: una inserción por petición '
+            'frente al buffer y al endpoint /api/metrics/batch/. Usa la BD configurada '
+            '(DATABASE_URL) y borra lo que crea.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n', type=int, default=2000, help='Detecciones por escenario.')
+        parser.add_argument('--batch', type=int, default=100, help='Detecciones por petición batch.')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        n, batch = opts['n'], opts['batch']
+        client   = Client()
+        exp      = Experience.objects.create(name='bench-metrics')
+        saved    = metric_buffer.max_items, metric_buffer.max_age
+        results  = {'database': connection.vendor, 'n': n, 'batch': batch}
+
+        def scenario(name, buffer_size, run):
+            metric_buffer.flush()
+            metric_buffer.max_items, metric_buffer.max_age = buffer_size, 0
+            start = time.perf_counter()
+            run()
+            metric_buffer.flush()
+            elapsed = time.perf_counter() - start
+            stored  = DetectionMetric.objects.filter(experience=exp).count()
+            DetectionMetric.objects.filter(experience=exp).delete()
+            results[name] = {'seconds': round(elapsed, 4), 'per_second': round(n / elapsed, 1),
+                             'stored': stored}
+
+        def single():
+            for _ in range(n):
+                client.post('/api/metrics/', {'experience': exp.pk}, content_type='application/json')
+
+        def batched():
+            body = json.dumps({'detections': [{'experience': exp.pk}] * batch})
+            for _ in range(0, n, batch):
+                client.post('/api/metrics/batch/', body, content_type='application/json')
+
+        try:
+            scenario('per_request_insert', 1, single)       # comportamiento anterior
+            scenario('buffered_single', saved[0], single)
+            scenario('batch_endpoint', saved[0], batched)
+        finally:
+            metric_buffer.max_items, metric_buffer.max_age = saved
+            exp.delete()
+
+        base = results['per_request_insert']['per_second']
+        for key in ('buffered_single', 'batch_endpoint'):
+            results[key]['speedup'] = round(results[key]['per_second'] / base, 1)
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"BD: {results['database']}  n={n}  batch={batch}")
+        for key in ('per_request_insert', 'buffered_single', 'batch_endpoint'):
+            r = results[key]
+            self.stdout.write(f"  {key:20} {r['per_second']:>10.1f} det/s  "
+                              f"x{r.get('speedup', 1.0):<5} guardadas={r['stored']}")
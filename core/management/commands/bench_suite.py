@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Suite de benchmarks reproducible: siembra experiencias sintéticas, lanza clientes '
+            'concurrentes contra el visor, la API, publish, la ingesta de métricas y la subida, '
+            'mide la generación de marcadores y micro benchmarks, y guarda un JSON comparable '
+            'entre commits (--output / --compare). Usa la BD configurada (DATABASE_URL), la '
+            'media en un directorio temporal y borra lo que crea.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', type=int, default=5, help='Targets de la experiencia sintética.')
+        parser.add_argument('--assets', type=int, default=3, help='Contenidos por target.')
+        parser.add_argument('--clients', type=int, default=8, help='Clientes simultáneos.')
+        parser.add_argument('--requests', type=int, default=25, help='Peticiones por cliente.')
+        parser.add_argument('--rounds', type=int, default=200, help='Repeticiones de cada micro benchmark.')
+        parser.add_argument('--upload-mb', type=int, default=8, help='Tamaño de la subida por trozos.')
+        parser.add_argument('--images', default=None,
+                            help='Directorio de imágenes para los marcadores (por defecto, sintéticas).')
+        parser.add_argument('--only', nargs='+', metavar='NOMBRE',
+                            choices=[*benchmarks.Suite.SCENARIOS, *benchmarks.Suite.MICRO],
+                            help='Ejecuta sólo estos escenarios / micro benchmarks.')
+        parser.add_argument('--output', default=None, help='Guarda el resultado en este JSON.')
+        parser.add_argument('--compare', default=None, help='JSON de una ejecución anterior.')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        baseline = None
+        if opts['compare']:
+            try:
+                baseline = json.loads(Path(opts['compare']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se puede leer {opts['compare']}: {e}")
+
+        log = (lambda msg: None) if opts['json'] else self.stderr.write
+        results = benchmarks.run(
+            targets=opts['targets'], assets=opts['assets'], clients=opts['clients'],
+            requests=opts['requests'], rounds=opts['rounds'], upload_mb=opts['upload_mb'],
+            images=opts['images'], only=opts['only'], log=log,
+        )
+        if baseline is not None:
+            results['baseline'] = baseline.get('environment', {})
+            results['comparison'] = [dict(zip(('section', 'name', 'metric', 'before', 'after', 'speedup'), row))
+                                     for row in benchmarks.compare(baseline, results)]
+        if opts['output']:
+            Path(opts['output']).write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        env = results['environment']
+        self.stdout.write(f"commit {env['commit']}{' (con cambios)' if env['dirty'] else ''}  "
+                          f"BD: {env['database']}  caché: {env['cache']}  python {env['python']}  "
+                          f"django {env['django']}")
+        for name, r in results['scenarios'].items():
+            if 'requests_per_second' in r:
+                self.stdout.write(f"  {name:22} {r['requests_per_second']:>9.1f} req/s  p50={r['p50_ms']}ms  "
+                                  f"p99={r['p99_ms']}ms  errores={r['errors']}")
+            elif 'mb_per_second' in r:
+                self.stdout.write(f"  {name:22} {r['mb_per_second']:>9.1f} MB/s   {r['seconds']}s")
+            elif 'skipped' in r or 'error' in r:
+                self.stdout.write(f"  {name:22} {r.get('skipped') or r.get('error')}")
+            else:
+                for key, sub in r.items():
+                    detail = f"{sub['seconds']}s  {sub['bytes'] / 1024:.0f} KB" if 'seconds' in sub else sub['error']
+                    self.stdout.write(f"  {name:22} {key:30} {detail}")
+        for name, r in results['micro'].items():
+            self.stdout.write(f"  {name:22} {r['median_ms']:>9.4f} ms  ±{r['stddev_ms']}  "
+                              f"{r['ops']:.0f} ops/s  ({r['rounds']} rondas)")
+        for row in results.get('comparison', []):
+            self.stdout.write(f"  {row['name']:22} {row['metric']:20} {row['before']} → {row['after']}  "
+                              f"x{row['speedup']}")
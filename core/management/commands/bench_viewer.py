@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+
+from core.counters import view_counter
+from core.models   import Experience
+
+
+class Command(BaseCommand):
+    help = ('Lanza N clientes concurrentes contra /viewer/<id>/ de una misma experiencia '
+            'y compara el contador directo (UPDATE por visita) con el acumulador en memoria. '
+            'Usa la BD configurada (DATABASE_URL) y borra lo que crea.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Clientes simultáneos.')
+        parser.add_argument('--requests', type=int, default=20, help='Peticiones por cliente.')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        n_clients, per_client = opts['clients'], opts['requests']
+        user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}')
+        exp  = Experience.objects.create(name='bench-viewer', is_published=True)
+        url  = f'/viewer/{exp.pk}/'
+        saved = view_counter.max_items, view_counter.max_age
+        results = {'database': connection.vendor, 'clients': n_clients, 'requests': per_client}
+
+        clients = []
+        for _ in range(n_clients):
+            c = Client()
+            c.force_login(user)
+            clients.append(c)
+
+        def hammer(client):
+            latencies, errors = [], 0
+            try:
+                for _ in range(per_client):
+                    t0 = time.perf_counter()
+                    try:
+                        ok = client.get(url).status_code == 200
+                    except Exception:
+                        ok = False
+                    latencies.append(time.perf_counter() - t0)
+                    errors += not ok
+            finally:
+                connections.close_all()
+            return latencies, errors
+
+        def scenario(name, buffer_size):
+            view_counter.flush()
+            Experience.objects.filter(pk=exp.pk).update(views=0)
+            view_counter.max_items, view_counter.max_age = buffer_size, 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=n_clients) as pool:
+                runs = list(pool.map(hammer, clients))
+            view_counter.flush()
+            elapsed = time.perf_counter() - start
+            latencies = sorted(l for lat, _ in runs for l in lat)
+            total = len(latencies)
+            exp.refresh_from_db()
+            results[name] = {
+                'requests_per_second': round(total / elapsed, 1),
+                'p50_ms': round(latencies[total // 2] * 1000, 2),
+                'p99_ms': round(latencies[int(total * 0.99) - 1] * 1000, 2),
+                'errors': sum(e for _, e in runs),
+                'views_counted': exp.views,
+            }
+
+        for name in ('django.request', 'core.buffers'):   # los errores se cuentan aparte
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+        try:
+            client = clients[0]
+            client.get(url)   # calienta la caché del visor
+            scenario('direct_update', 1)            # comportamiento anterior
+            scenario('accumulated', saved[0])
+        finally:
+            view_counter.max_items, view_counter.max_age = saved
+            exp.delete()
+            user.delete()
+
+        base = results['direct_update']['requests_per_second']
+        results['accumulated']['speedup'] = round(results['accumulated']['requests_per_second'] / base, 2)
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"BD: {results['database']}  clientes={n_clients}  peticiones/cliente={per_client}")
+        for key in ('direct_update', 'accumulated'):
+            r = results[key]
+            self.stdout.write(f"  {key:14} {r['requests_per_second']:>9.1f} req/s  p50={r['p50_ms']}ms  "
+                              f"p99={r['p99_ms']}ms  errores={r['errors']}  visitas={r['views_counted']}")
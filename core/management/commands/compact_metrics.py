@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+from core.metrics import metric_buffer
+
+
+class Command(BaseCommand):
+    help = ('Suma en DetectionRollup las detecciones crudas pendientes y poda '
+            'las ya agregadas más antiguas que --retention-days.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Borra detecciones crudas ya agregadas con más de N días.')
+        parser.add_argument('--chunk', type=int, default=10000,
+                            help='Filas por transacción.')
+
+    def handle(self, *args, **opts):
+        metric_buffer.flush()
+        result = rollups.compact(opts['retention_days'], chunk=opts['chunk'])
+        self.stdout.write(f"agregadas: {result['folded']}  podadas: {result['pruned']}")
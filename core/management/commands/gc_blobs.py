@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import storage
+
+
+class Command(BaseCommand):
+    help = ('Borra los blobs de assets (MEDIA_ROOT/blobs/) que ningún Asset referencia '
+            'desde hace más de --grace segundos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None,
+                            help='Segundos sin uso antes de borrar (por defecto BLOB_GC_GRACE).')
+        parser.add_argument('--dry-run', action='store_true', help='Sólo informa.')
+
+    def handle(self, *args, **opts):
+        grace = opts['grace'] if opts['grace'] is not None else settings.BLOB_GC_GRACE
+        count, freed = storage.collect(timedelta(seconds=grace), dry_run=opts['dry_run'])
+        verb = 'se borrarían' if opts['dry_run'] else 'borrados'
+        self.stdout.write(f"blobs {verb}: {count}  ({freed / 1024 ** 2:.1f} MB)")
@@ -0,0 +1,122 @@
+import time
+import zipfile
+from pathlib import Path
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from PIL import Image
+
+from core import cache, jobs, renders
+from core.markers import PROFILES
+from core.models  import Experience, Job, Target
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png'}
+
+
+def _sources(path: Path):
+    """(nombre, abridor) de cada imagen del directorio o zip, en orden."""
+    if path.is_dir():
+        for f in sorted(path.rglob('*')):
+            if f.is_file() and f.suffix.lower() in IMAGE_EXTS and not f.name.startswith('.'):
+                yield f.name, lambda f=f: f.open('rb')
+        return
+    with zipfile.ZipFile(path) as zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.filename):
+            name = Path(info.filename)
+            if info.is_dir() or name.suffix.lower() not in IMAGE_EXTS or \
+                    name.name.startswith('.') or '__MACOSX' in name.parts:
+                continue
+            yield name.name, lambda info=info: zf.open(info)
+
+
+class Command(BaseCommand):
+    help = ('Importa un directorio o zip de imágenes como Targets (el nombre es el del fichero '
+            'sin extensión) y genera sus marcadores NFT en paralelo con el pool de run_jobs. '
+            'Las miniaturas quedan en cola para run_jobs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directorio o .zip con imágenes JPG/PNG.')
+        parser.add_argument('--experience', type=int, default=None, help='Añade los targets a esta experiencia.')
+        parser.add_argument('--profile', choices=sorted(PROFILES), default='standard',
+                            help='Perfil de generación del marcador.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Procesos en paralelo (por defecto JOBS_WORKERS o nº de CPUs).')
+        parser.add_argument('--retries', type=int, default=2, help='Reintentos por marcador fallido.')
+        parser.add_argument('--no-markers', action='store_true',
+                            help='Sólo crea los targets; los marcadores quedan en cola para run_jobs.')
+
+    def handle(self, *args, **opts):
+        source = Path(opts['source'])
+        if not source.is_dir() and not zipfile.is_zipfile(source):
+            raise CommandError(f'{source} no es un directorio ni un zip')
+        exp = None
+        if opts['experience'] is not None:
+            exp = Experience.objects.filter(pk=opts['experience']).first()
+            if exp is None:
+                raise CommandError(f"No existe la experiencia {opts['experience']}")
+
+        targets = self._create(source, opts['profile'], opts['retries'], exp)
+        self.stdout.write(f'{len(targets)} target(s) creados')
+        if not targets or opts['no_markers']:
+            return
+
+        names = {t.marker_job_id: t.name for t in targets}
+        total, done, start = len(targets), 0, time.monotonic()
+
+        def report(job_id, status):
+            nonlocal done
+            if status == Job.PENDING:
+                self.stdout.write(f'  {names[job_id]}: falló, se reintenta')
+                return
+            done += 1
+            elapsed = time.monotonic() - start
+            eta = elapsed / done * (total - done)
+            self.stdout.write(f'[{done}/{total}] {names[job_id]}: {status}  ({elapsed:.0f}s, quedan ~{eta:.0f}s)')
+
+        results = jobs.drain(workers=opts['workers'], ids=list(names), on_done=report)
+        failed = Job.objects.filter(pk__in=names, status=Job.FAILED)
+        for job in failed:
+            last = job.error.strip().splitlines()[-1:] or ['']
+            self.stderr.write(f'  {names[job.pk]}: {last[0]}')
+        self.stdout.write(f'marcadores: {total - len(failed)} ok, {len(failed)} fallidos '
+                          f'en {time.monotonic() - start:.1f}s')
+        if len(results) < total:
+            self.stdout.write(f'{total - len(results)} trabajo(s) los atendió otro worker')
+
+    def _create(self, source: Path, profile: str, retries: int, exp) -> list:
+        existing = set(Target.objects.values_list('name', flat=True))
+        targets  = []
+        for filename, opener in _sources(source):
+            name = Path(filename).stem[:100]
+            if name in existing:
+                self.stderr.write(f'  {filename}: ya existe un target "{name}", se omite')
+                continue
+            with opener() as fh:
+                try:
+                    with Image.open(fh) as img:
+                        img.verify()
+                except Exception:
+                    self.stderr.write(f'  {filename}: no es una imagen válida, se omite')
+                    continue
+                fh.seek(0)
+                target = Target(name=name, marker_profile=profile)
+                target.image.save(filename, File(fh, name=filename), save=False)
+            existing.add(name)
+            targets.append(target)
+
+        with transaction.atomic():
+            targets = Target.objects.bulk_create(targets)
+            queued  = jobs.enqueue_many('marker', [{'target_id': t.pk} for t in targets],
+                                        max_attempts=retries + 1)
+            for target, job in zip(targets, queued):
+                target.marker_job = job
+            Target.objects.bulk_update(targets, ['marker_job'])
+            renders.enqueue_renders(targets)   # miniaturas: las atiende run_jobs
+            cache.touch(Target)   # bulk_*: sin señales
+            if exp is not None and targets:
+                exp.targets.add(*targets)
+                Experience.objects.filter(pk=exp.pk).update(version=F('version') + 1)
+                cache.touch(Experience, exp.pk)
+        return targets
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.markers import set_stats
+from core.models  import Target
+
+
+class Command(BaseCommand):
+    help = ('Tamaño, escalas DPI y puntos de los marcadores NFT por target '
+            '(Target.marker_stats). --refresh vuelve a analizar los ficheros en disco.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help='Reanaliza y guarda marker_stats.')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON.')
+
+    def handle(self, *args, **opts):
+        rows = []
+        for target in Target.objects.select_related('marker_set').order_by('id'):
+            if opts['refresh'] and target.marker_set_id:
+                target.marker_stats = set_stats(target.marker_set, target.marker_profile)
+                target.save(update_fields=['marker_stats'])
+            rows.append({'id': target.id, 'name': target.name, 'profile': target.marker_profile,
+                         'stats': target.marker_stats})
+
+        if opts['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        self.stdout.write(f"{'target':<30} {'perfil':<16} {'KB':>8} {'KB gz':>8} {'escalas':>7} "
+                          f"{'seguim.':>8} {'detecc.':>8}")
+        for row in rows:
+            stats = row['stats'] or {}
+            if not stats.get('bytes'):
+                self.stdout.write(f"{row['name'][:30]:<30} {row['profile']:<16} {'sin analizar':>8}")
+                continue
+            self.stdout.write(
+                f"{row['name'][:30]:<30} {row['profile']:<16} "
+                f"{stats['bytes']['total'] / 1024:>8.1f} {stats['gzip_bytes']['total'] / 1024:>8.1f} "
+                f"{len(stats.get('iset', {}).get('dpi_levels', [])):>7} "
+                f"{stats.get('fset', {}).get('points', '-'):>8} {stats.get('fset3', {}).get('points', '-'):>8}"
+            )
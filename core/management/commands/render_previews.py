@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import jobs, renders
+from core.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Encola las miniaturas WebP de los Targets y Assets de imagen que aún no las tienen '
+            '(p. ej. los creados antes del trabajo `render`). Los QR se generan al publicar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run', action='store_true',
+                            help='Las genera ya con el pool de run_jobs en vez de dejarlas en cola.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Procesos en paralelo con --run (por defecto JOBS_WORKERS o nº de CPUs).')
+
+    def handle(self, *args, **opts):
+        queued = renders.backfill()
+        self.stdout.write(f'{len(queued)} trabajo(s) de miniaturas en cola')
+        if queued and opts['run']:
+            results = jobs.drain(workers=opts['workers'], ids=[job.pk for job in queued])
+            failed  = sum(status != Job.DONE for status in results.values())
+            self.stdout.write(f'generadas: {len(results) - failed}  fallidas: {failed}')
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de trabajos (marcadores NFT, etc.) con pool de procesos acotado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Procesos en paralelo (por defecto JOBS_WORKERS o nº de CPUs).')
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help='Segundos entre consultas a la cola.')
+        parser.add_argument('--once', action='store_true',
+                            help='Vacía la cola y termina en lugar de quedarse escuchando.')
+
+    def handle(self, *args, **opts):
+        stale = jobs.requeue_stale(timedelta(seconds=settings.JOBS_STALE_AFTER))
+        if stale:
+            self.stdout.write(f'{stale} trabajo(s) huérfano(s) devueltos a la cola')
+
+        def report(job_id, status):
+            self.stdout.write(f'job {job_id}: {status}')
+
+        try:
+            jobs.drain(
+                workers=opts['workers'],
+                poll=None if opts['once'] else opts['poll'],
+                on_done=report,
+            )
+        except KeyboardInterrupt:
+            pass
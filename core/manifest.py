@@ -0,0 +1,68 @@
+# core/manifest.py
+"""
+Manifiesto de escena: todo lo que el editor y el visor necesitan de una
+experiencia (targets, prefijos de marcador, contenidos colocados con su
+transform y config_json) en un único documento JSON.
+
+Se construye con tres consultas fijas, sin importar cuántos targets o
+contenidos tenga la escena. El ETag es el hash del JSON canónico, así que
+cualquier cambio visible produce otro ETag y nada más lo hace.
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+VERSION = 1
+
+
+def _url(field):
+    return field.url if field else None
+
+
+def build(exp) -> dict:
+    placed = defaultdict(list)
+    for ea in exp.experienceasset_set.select_related('asset').order_by('id'):
+        asset = ea.asset
+        placed[ea.target_id].append({
+            'id':        ea.id,
+            'asset': {
+                'id':      asset.id,
+                'name':    asset.name,
+                'type':    asset.type,
+                'url':     _url(asset.delivery_file),   # derivado optimizado si existe
+                'size_mb': round(asset.optimized_size_mb or asset.size_mb, 3),
+            },
+            'transform': ea.transform,
+            'autoplay':  ea.autoplay,
+            'loop':      ea.loop,
+            'face_user': ea.face_user,
+        })
+
+    targets = []
+    for t in exp.targets.select_related('marker_job').order_by('id'):
+        targets.append({
+            'id':            t.id,
+            'name':          t.name,
+            'image':         _url(t.image),
+            'marker':        _url(t.pattfile),   # prefijo: AR.js añade .iset/.fset/.fset3
+            'marker_status': t.marker_status,
+            'assets':        placed[t.id],
+        })
+
+    return {
+        'version':    VERSION,
+        'experience': {
+            'id':           exp.id,
+            'name':         exp.name,
+            'slug':         exp.slug,
+            'is_published': exp.is_published,
+            'version':      exp.version,   # para las escrituras por lotes (core.scene)
+        },
+        'config':  exp.config_json,
+        'targets': targets,
+    }
+
+
+def etag(manifest: dict) -> str:
+    canonical = json.dumps(manifest, sort_keys=True, separators=(',', ':'), default=str)
+    return '"m%d-%s"' % (VERSION, hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32])
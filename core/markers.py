@@ -0,0 +1,218 @@
+# core/markers.py
+"""
+Generación de marcadores NFT (.iset/.fset/.fset3) con NFTMarkerCreator.
+
+Los juegos generados se guardan en MEDIA_ROOT/markers/<sha256>/ y se
+comparten entre todos los Target cuya imagen (+ versión del creador +
+perfil) produce el mismo hash; en un acierto de caché no se ejecuta node.
+
+El perfil (Target.marker_profile) reescala la imagen con Pillow antes de
+generar: menos píxeles dan menos escalas y puntos, es decir, ficheros más
+pequeños y menos CPU en el móvil a cambio de seguimiento menos estable.
+Tras generar, core.nft analiza el juego y el resumen queda en
+Target.marker_stats.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf      import settings
+from django.db        import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils     import timezone
+from PIL              import Image, ImageOps
+
+from . import jobs, media, nft, perf
+from .models import Job, MarkerSet, StatCounter, Target
+
+CREATOR_DIR     = Path(settings.BASE_DIR, 'tools', 'nft-marker')
+CREATOR_PACKAGE = CREATOR_DIR / 'node_modules' / '@webarkit' / 'nft-marker-creator-app'
+CREATOR_OPTIONS = ['-noConf']
+MARKER_EXTS     = ('.iset', '.fset', '.fset3')
+CACHE_DIR       = 'markers'
+
+# -level / -leveli (densidad de puntos de seguimiento / detección) los pasa
+# el creador tal cual a genMarkerSet. 'standard' es el comportamiento previo.
+PROFILES = {
+    'standard':        {'max_px': None, 'options': CREATOR_OPTIONS},
+    'fast-load':       {'max_px': 640,  'options': [*CREATOR_OPTIONS, '-level=1', '-leveli=0']},
+    'robust-tracking': {'max_px': 1600, 'options': [*CREATOR_OPTIONS, '-level=3', '-leveli=2']},
+}
+DEFAULT_PROFILE = 'standard'
+
+
+def generate_nft(image_path: str, out_dir: str = None, options=None) -> Path:
+    """
+    Ejecuta @webarkit/nft-marker-creator-app y devuelve el prefijo (Path sin extensión).
+    """
+    out_dir = Path(out_dir or Path(image_path).parent)
+    base    = Path(image_path).stem
+    script  = CREATOR_PACKAGE / 'src' / 'NFTMarkerCreator.js'
+
+    with perf.timer('subprocess', 'nft-marker-creator'):
+        subprocess.run(
+            ['node', str(script),
+             '-i', str(image_path),
+             '-o', str(out_dir),
+             *(options or CREATOR_OPTIONS)],
+            check=True,
+            stdout=subprocess.DEVNULL
+        )
+    return out_dir / base
+
+
+def enqueue_marker(target: Target) -> Job:
+    """Encola la generación del marcador y la enlaza al target."""
+    job = jobs.enqueue('marker', target_id=target.pk)
+    target.marker_job = job
+    target.save(update_fields=['marker_job'])
+    return job
+
+
+# ---------- Caché direccionada por contenido ----------
+@lru_cache(maxsize=1)
+def creator_version() -> str:
+    """Versión instalada del creador (o la declarada si no hay node_modules)."""
+    for pkg, key in ((CREATOR_PACKAGE / 'package.json', 'version'),
+                     (CREATOR_DIR / 'package.json', 'dependencies')):
+        try:
+            data = json.loads(pkg.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        value = data.get(key)
+        if isinstance(value, dict):
+            value = value.get('@webarkit/nft-marker-creator-app')
+        if value:
+            return str(value)
+    return 'unknown'
+
+
+def marker_digest(image_path: str, profile: str = DEFAULT_PROFILE) -> str:
+    spec = PROFILES[profile]
+    h = hashlib.sha256()
+    h.update(f"{creator_version()}\0{' '.join(spec['options'])}\0".encode())
+    if spec['max_px']:   # 'standard' conserva el hash anterior
+        h.update(f"max_px={spec['max_px']}\0".encode())
+    with open(image_path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_complete(marker_set: MarkerSet) -> bool:
+    prefix = Path(settings.MEDIA_ROOT, marker_set.prefix)
+    return all(prefix.with_suffix(ext).exists() for ext in MARKER_EXTS)
+
+
+def prescale(image_path: str, dst_dir: Path, max_px: int) -> Path:
+    """Copia de la imagen reducida a `max_px` conservando su DPI (el creador lo usa)."""
+    with Image.open(image_path) as img:
+        dpi = img.info.get('dpi', (72, 72))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+        out = dst_dir / 'marker.jpg'
+        img.convert('RGB').save(out, 'JPEG', quality=92, dpi=dpi)
+    return out
+
+
+def _build_marker_set(image_path: str, digest: str, profile: str = DEFAULT_PROFILE) -> MarkerSet:
+    spec    = PROFILES[profile]
+    out_dir = Path(settings.MEDIA_ROOT, CACHE_DIR, digest)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if spec['max_px']:
+        src = prescale(image_path, out_dir, spec['max_px'])
+    else:
+        src = out_dir / f"marker{Path(image_path).suffix.lower()}"
+        shutil.copyfile(image_path, src)
+    try:
+        prefix = generate_nft(str(src), str(out_dir), spec['options'])
+    finally:
+        src.unlink(missing_ok=True)
+
+    for ext in MARKER_EXTS:   # .fset3 y .iset comprimen bien: el visor los baja en cada visita
+        media.precompress(prefix.with_suffix(ext))
+    size = sum(prefix.with_suffix(ext).stat().st_size for ext in MARKER_EXTS)
+    rel  = os.path.relpath(prefix, settings.MEDIA_ROOT)
+    try:
+        with transaction.atomic():
+            return MarkerSet.objects.create(digest=digest, prefix=rel, size_bytes=size)
+    except IntegrityError:   # otro worker generó el mismo juego en paralelo
+        MarkerSet.objects.filter(digest=digest).update(prefix=rel, size_bytes=size)
+        return MarkerSet.objects.get(digest=digest)
+
+
+def attach(target: Target, marker_set: MarkerSet):
+    """Apunta el target al juego compartido y ajusta los contadores de referencias."""
+    if target.marker_set_id != marker_set.pk:
+        if target.marker_set_id:
+            release(target.marker_set_id)
+        MarkerSet.objects.filter(pk=marker_set.pk).update(refcount=F('refcount') + 1)
+    MarkerSet.objects.filter(pk=marker_set.pk).update(last_used_at=timezone.now())
+    target.marker_set     = marker_set
+    target.pattfile.name  = marker_set.prefix
+    target.save(update_fields=['marker_set', 'pattfile'])
+
+
+def set_stats(marker_set: MarkerSet, profile: str) -> dict:
+    """Resumen de core.nft (tamaños, escalas DPI, puntos) del juego en disco."""
+    return {'profile': profile, **nft.analyse(Path(settings.MEDIA_ROOT, marker_set.prefix))}
+
+
+def release(marker_set_id: int):
+    MarkerSet.objects.filter(pk=marker_set_id, refcount__gt=0).update(refcount=F('refcount') - 1)
+
+
+def evict(budget: int = None) -> int:
+    """Borra juegos sin referencias, del menos usado al más reciente, hasta caber en el presupuesto."""
+    budget = settings.MARKER_CACHE_MAX_BYTES if budget is None else budget
+    total  = MarkerSet.objects.aggregate(s=Sum('size_bytes'))['s'] or 0
+    freed  = 0
+    for ms in MarkerSet.objects.filter(refcount=0).order_by('last_used_at'):
+        if total - freed <= budget:
+            break
+        # primero la fila, condicionada: si un attach() la ha vuelto a usar, los ficheros se quedan
+        if MarkerSet.objects.filter(pk=ms.pk, refcount=0).delete()[0]:
+            shutil.rmtree(Path(settings.MEDIA_ROOT, CACHE_DIR, ms.digest), ignore_errors=True)
+            freed += ms.size_bytes
+            StatCounter.incr('marker_cache.evictions')
+    return freed
+
+
+def cache_stats() -> dict:
+    stats = StatCounter.read('marker_cache.hits', 'marker_cache.misses', 'marker_cache.evictions')
+    hits, misses = stats['marker_cache.hits'], stats['marker_cache.misses']
+    agg = MarkerSet.objects.aggregate(bytes=Sum('size_bytes'))
+    return {
+        'hits':      hits,
+        'misses':    misses,
+        'evictions': stats['marker_cache.evictions'],
+        'hit_rate':  hits / (hits + misses) if hits + misses else None,
+        'sets':      MarkerSet.objects.count(),
+        'bytes':     agg['bytes'] or 0,
+        'budget':    settings.MARKER_CACHE_MAX_BYTES,
+    }
+
+
+# ---------- Handler del worker ----------
+def build_target_marker(job: Job):
+    target = Target.objects.get(pk=job.payload['target_id'])
+    image  = target.image.path
+    digest = marker_digest(image, target.marker_profile)
+    jobs.set_progress(job, 10)
+
+    marker_set = MarkerSet.objects.filter(digest=digest).first()
+    if marker_set and _is_complete(marker_set):
+        StatCounter.incr('marker_cache.hits')
+    else:
+        StatCounter.incr('marker_cache.misses')
+        marker_set = _build_marker_set(image, digest, target.marker_profile)
+    jobs.set_progress(job, 90)
+
+    attach(target, marker_set)
+    target.marker_stats = set_stats(marker_set, target.marker_profile)
+    target.save(update_fields=['marker_stats'])
+    evict()
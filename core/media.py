@@ -0,0 +1,190 @@
+# core/media.py
+"""
+Servicio de ficheros de MEDIA_ROOT en producción.
+
+- Rangos (`Range: bytes=a-b`, `If-Range`) para que <a-video>/<a-sound>
+  puedan saltar sin descargar todo.
+- ETag fuerte (hash del blob o tamaño+mtime) y 304 con If-None-Match.
+- Variantes precomprimidas `.br` / `.gz` junto al original para GLB, JSON
+  y marcadores, elegidas según Accept-Encoding (ver `precompress`).
+- Cero copias: el fichero se entrega abierto y posicionado, y gunicorn lo
+  envía con sendfile(2) respetando Content-Length. Con MEDIA_ACCEL_REDIRECT
+  la entrega se delega en nginx (X-Accel-Redirect).
+"""
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+from pathlib import Path
+
+from django.conf       import settings
+from django.http       import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+from . import perf
+
+try:
+    import brotli
+except ImportError:   # opcional: sin él sólo hay .gz
+    brotli = None
+
+PRECOMPRESS_SUFFIXES = ('.glb', '.gltf', '.json', '.iset', '.fset', '.fset3', '.html', '.js', '.svg')
+PRIVATE_DIRS         = ('uploads',)   # trozos de subidas en curso: nunca se sirven
+ENCODINGS            = (('br', '.br'), ('gzip', '.gz'))   # orden de preferencia
+RANGE_RE             = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# ---------- Variantes precomprimidas ----------
+def precompress(path, min_ratio: float = 0.9) -> list:
+    """
+    Escribe path.gz (y path.br si hay brotli) cuando comprimen por debajo de
+    `min_ratio`; devuelve las variantes creadas. Idempotente.
+    """
+    path = Path(path)
+    if path.suffix.lower() not in PRECOMPRESS_SUFFIXES or not path.is_file():
+        return []
+    size, made = path.stat().st_size, []
+    for encoding, suffix in ENCODINGS:
+        out = path.with_name(path.name + suffix)
+        if out.exists() and out.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            made.append(out)
+            continue
+        if encoding == 'br' and brotli is None:
+            continue
+        tmp = out.with_name(f'.{out.name}.tmp')
+        with perf.timer('io', f'precompress.{encoding}'):
+            if encoding == 'gzip':
+                with path.open('rb') as src, gzip.open(tmp, 'wb', compresslevel=9) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            else:
+                tmp.write_bytes(brotli.compress(path.read_bytes(), quality=11))
+        if tmp.stat().st_size < size * min_ratio:
+            os.replace(tmp, out)
+            made.append(out)
+        else:
+            tmp.unlink()
+    return made
+
+
+def variants(path) -> list:
+    path = Path(path)
+    return [path.with_name(path.name + suffix) for _, suffix in ENCODINGS]
+
+
+# ---------- Entrega ----------
+class _RangeFile:
+    """Fichero limitado a [start, start+length): read() no pasa del final y
+    fileno()/posición permiten a gunicorn usar sendfile con ese tramo."""
+
+    def __init__(self, fh, start, length):
+        fh.seek(start)
+        self._fh, self._left = fh, length
+        self.name = fh.name
+
+    def fileno(self):
+        return self._fh.fileno()
+
+    def read(self, n=-1):
+        if self._left <= 0:
+            return b''
+        data = self._fh.read(self._left if n is None or n < 0 else min(n, self._left))
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._fh.close()
+
+
+def _parse_range(header: str, size: int):
+    """(start, end) inclusivo, None si no aplica, o False si es insatisfacible."""
+    m = RANGE_RE.match(header.strip())
+    if not m or m.groups() == ('', ''):
+        return None   # multirango o sintaxis desconocida: se sirve entero
+    first, last = m.groups()
+    if first == '':   # sufijo: últimos N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end   = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _accepted(header: str) -> set:
+    out = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            out.add(name.strip().lower())
+    return out
+
+
+def _pick_encoding(request, path: Path):
+    accepted = _accepted(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted:
+            candidate = path.with_name(path.name + suffix)
+            if candidate.is_file():
+                return encoding, candidate
+    return None, path
+
+
+def serve(request, path, etag: str = None, immutable: bool = False, max_age: int = None):
+    """Respuesta para `path` (ya validado dentro de MEDIA_ROOT)."""
+    path = Path(path)
+    st   = path.stat()
+    etag = etag or f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    if path.suffix.lower() == '.glb':
+        content_type = 'model/gltf-binary'
+
+    range_header = request.META.get('HTTP_RANGE', '')
+    if_range     = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range != etag:
+        range_header = ''   # el cliente tiene otra versión: fichero completo
+
+    encoding, body = (None, path) if range_header else _pick_encoding(request, path)
+    tagged = etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+    if tagged in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')) or \
+            etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        size = body.stat().st_size if encoding else st.st_size
+        byte_range = _parse_range(range_header, size) if range_header else None
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{size}'
+        elif settings.MEDIA_ACCEL_REDIRECT:
+            # nginx hace rangos, sendfile y conexiones lentas por nosotros
+            response = HttpResponse(content_type=content_type)
+            rel = body.relative_to(settings.MEDIA_ROOT).as_posix()
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + rel
+        else:
+            fh = body.open('rb')
+            if byte_range:
+                start, end = byte_range
+                response = FileResponse(_RangeFile(fh, start, end - start + 1),
+                                        status=206, content_type=content_type)
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+                response['Content-Length'] = end - start + 1
+            else:
+                response = FileResponse(fh, content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(st.st_mtime)
+
+    response['ETag'] = tagged
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if immutable:
+        patch_cache_control(response, public=True, max_age=settings.BLOB_CACHE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True,
+                            max_age=settings.MEDIA_CACHE_MAX_AGE if max_age is None else max_age)
+    return response
@@ -0,0 +1,55 @@
+# core/metrics.py
+"""
+Ingesta de detecciones del visor público.
+
+Las detecciones no se insertan una a una: se acumulan en `metric_buffer`
+y se vuelcan con `bulk_create` al llegar a METRICS_BUFFER_SIZE elementos o
+tras METRICS_FLUSH_INTERVAL segundos. Lo pendiente en memoria se pierde si
+el proceso muere de golpe; a cambio la BD recibe un INSERT por lote.
+"""
+from django.conf  import settings
+from django.db    import transaction
+from django.utils import timezone
+
+from .        import rollups
+from .buffers import BufferedWriter
+from .models  import DetectionMetric
+
+
+class MetricBuffer(BufferedWriter):
+    def write(self, items):
+        # crudas y agregados en la misma transacción: nunca se cuenta dos veces
+        for m in items:
+            m.rolled_up = True
+        with transaction.atomic():
+            DetectionMetric.objects.bulk_create(items, batch_size=settings.METRICS_BULK_BATCH_SIZE)
+            rollups.apply(rollups.count_metrics(items))
+
+
+metric_buffer = MetricBuffer(settings.METRICS_BUFFER_SIZE, settings.METRICS_FLUSH_INTERVAL)
+
+
+def _metrics(detections) -> list:
+    now = timezone.now()
+    return [
+        DetectionMetric(
+            experience_id=d['experience'],
+            target_id=d.get('target'),
+            detected_at=min(d.get('detected_at') or now, now),   # relojes de móviles adelantados
+        )
+        for d in detections
+    ]
+
+
+def record(experience_id: int, target_id: int = None, detected_at=None):
+    metric_buffer.add(*_metrics([{'experience': experience_id, 'target': target_id,
+                                  'detected_at': detected_at}]))
+
+
+def record_many(detections):
+    metric_buffer.add(*_metrics(detections))
+
+
+async def arecord_many(detections):
+    """record_many() para las vistas asíncronas (core.views, modo ASGI)."""
+    await metric_buffer.aadd(*_metrics(detections))
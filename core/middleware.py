@@ -0,0 +1,35 @@
+# core/middleware.py
+"""
+Middlewares propios que no encajan en otro módulo.
+
+`WhiteNoiseMiddleware`: el de whitenoise sólo es síncrono y, bajo ASGI,
+un único middleware síncrono en la cadena hace que Django ejecute todas
+las vistas (también las async) en un hilo por petición. Esta subclase
+acepta los dos modos; los estáticos se sirven igual que antes.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_markerset_statcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detectionmetric',
+            name='detected_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_detectionmetric_detected_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionmetric',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='detectionmetric',
+            name='target',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.target'),
+        ),
+        migrations.CreateModel(
+            name='DetectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('hour', 'Hora'), ('day', 'Día')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('experience', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.experience')),
+                ('target', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.target')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('target__isnull', True)), fields=('experience', 'bucket', 'period_start'), name='uniq_rollup_experience'), models.UniqueConstraint(condition=models.Q(('target__isnull', False)), fields=('experience', 'target', 'bucket', 'period_start'), name='uniq_rollup_target')],
+            },
+        ),
+    ]
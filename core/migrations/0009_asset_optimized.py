@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_detectionrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='optimized',
+            field=models.FileField(blank=True, null=True, upload_to='assets/optimized/'),
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='optimized_size_mb',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='process_job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.job'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:54
+
+import core.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='asset',
+            name='file',
+            field=models.FileField(storage=core.storage.ContentAddressedStorage(), upload_to='assets/'),
+        ),
+        migrations.AlterField(
+            model_name='asset',
+            name='optimized',
+            field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='assets/optimized/'),
+        ),
+    ]
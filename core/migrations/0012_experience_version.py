@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experience',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
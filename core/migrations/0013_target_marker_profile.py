@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_experience_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='marker_profile',
+            field=models.CharField(choices=[('standard', 'Estándar'), ('fast-load', 'Carga rápida'), ('robust-tracking', 'Seguimiento robusto')], default='standard', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='target',
+            name='marker_stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_target_marker_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detectionmetric',
+            name='experience',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.experience'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['created_at', 'id'], name='asset_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionmetric',
+            index=models.Index(fields=['experience', 'detected_at', 'id'], name='metric_exp_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionmetric',
+            index=models.Index(fields=['detected_at', 'id'], name='metric_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionmetric',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='metric_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionrollup',
+            index=models.Index(fields=['bucket', 'period_start'], name='rollup_bucket_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='target',
+            index=models.Index(fields=['created_at', 'id'], name='target_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['updated_at'], name='upload_updated_idx'),
+        ),
+    ]
@@ -1,16 +1,135 @@
 # core/models.py
 import os
+import uuid
 from pathlib import Path
+from django.conf import settings
 from django.db   import models
+from django.db.models import F
+from django.utils import timezone
 from django.utils.text import slugify
 
+from .storage import blob_storage
+
+
+def _smallest(variants) -> str:
+    """URL de la variante más pequeña de un render ({'160': url, …}; ver core.renders)."""
+    return variants[min(variants, key=int)] if variants else None
+
+
+class Job(models.Model):
+    """Trabajo en segundo plano; lo consume `manage.py run_jobs`."""
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'En curso'),
+        (DONE,    'Terminado'),
+        (FAILED,  'Fallido'),
+    ]
+    kind         = models.CharField(max_length=50)
+    payload      = models.JSONField(blank=True, default=dict)
+    status       = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress     = models.PositiveSmallIntegerField(default=0)   # 0‑100
+    attempts     = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    error        = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    started_at   = models.DateTimeField(blank=True, null=True)
+    finished_at  = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.kind}#{self.pk} ({self.status})"
+
+
+class StatCounter(models.Model):
+    """Contador compartido entre procesos (hits/misses de cachés, etc.)."""
+    name  = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def incr(cls, name, n=1):
+        if not cls.objects.filter(name=name).update(value=F('value') + n):
+            obj, created = cls.objects.get_or_create(name=name, defaults={'value': n})
+            if not created:
+                cls.objects.filter(name=name).update(value=F('value') + n)
+
+    @classmethod
+    def read(cls, *names):
+        values = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return {n: values.get(n, 0) for n in names}
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class MarkerSet(models.Model):
+    """Juego .iset/.fset/.fset3 compartido, direccionado por el hash de la imagen."""
+    digest       = models.CharField(max_length=64, unique=True)
+    prefix       = models.CharField(max_length=255)   # relativo a MEDIA_ROOT, sin extensión
+    size_bytes   = models.BigIntegerField(default=0)
+    refcount     = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    created_at   = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest[:12]
+
+
+class Blob(models.Model):
+    """Fichero de MEDIA_ROOT/blobs/ (ver core.storage); `refcount` = campos de Asset que lo usan."""
+    name         = models.CharField(max_length=255, unique=True)   # blobs/aa/<sha256><ext>
+    digest       = models.CharField(max_length=64, db_index=True)
+    size_bytes   = models.BigIntegerField(default=0)
+    refcount     = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    created_at   = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
 
 class Target(models.Model):
+    PROFILE_CHOICES = [   # claves de core.markers.PROFILES
+        ('standard',        'Estándar'),
+        ('fast-load',       'Carga rápida'),
+        ('robust-tracking', 'Seguimiento robusto'),
+    ]
+
     name      = models.CharField(max_length=100, unique=True)
     image     = models.ImageField(upload_to='targets/')
     pattfile  = models.FileField(upload_to='targets/', blank=True, null=True)  # guarda prefijo o .zft
+    marker_job = models.ForeignKey(Job, on_delete=models.SET_NULL,
+                                   blank=True, null=True, related_name='+')
+    marker_set = models.ForeignKey(MarkerSet, on_delete=models.SET_NULL,
+                                   blank=True, null=True, related_name='targets')
+    # perfil de generación (core.markers.PROFILES) y resumen de core.nft
+    marker_profile = models.CharField(max_length=20, choices=PROFILE_CHOICES, default='standard')
+    marker_stats   = models.JSONField(blank=True, null=True)
+    renders    = models.JSONField(blank=True, default=dict)   # miniaturas WebP (core.renders)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # listado de la API: ORDER BY created_at DESC, id DESC (core.pagination)
+        indexes = [models.Index(fields=['created_at', 'id'], name='target_created_idx')]
+
+    @property
+    def marker_status(self):
+        if self.marker_job_id:
+            return self.marker_job.status
+        return Job.DONE if self.pattfile else Job.PENDING
+
+    @property
+    def marker_progress(self):
+        if self.marker_job_id:
+            return self.marker_job.progress
+        return 100 if self.pattfile else 0
+
+    @property
+    def thumbnail_url(self):
+        return _smallest(self.renders.get('thumb'))
+
     def __str__(self):
         return self.name
 
@@ -23,11 +142,33 @@ class Asset(models.Model):
         ('audio', 'Audio'),
     ]
     name      = models.CharField(max_length=100)
-    file      = models.FileField(upload_to='assets/')
+    file      = models.FileField(upload_to='assets/', storage=blob_storage)
     type      = models.CharField(max_length=10, choices=TYPE_CHOICES)
     size_mb   = models.FloatField(default=0)
+    optimized = models.FileField(upload_to='assets/optimized/', storage=blob_storage,
+                                 blank=True, null=True)  # derivado para el visor
+    optimized_size_mb = models.FloatField(default=0)
+    process_job = models.ForeignKey(Job, on_delete=models.SET_NULL,
+                                    blank=True, null=True, related_name='+')
+    renders    = models.JSONField(blank=True, default=dict)   # miniaturas WebP de las imágenes
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @property
+    def delivery_file(self):
+        """Lo que descarga el visor: el derivado optimizado si existe."""
+        return self.optimized if self.optimized else self.file
+
+    @property
+    def processing_status(self):
+        return self.process_job.status if self.process_job_id else None
+
+    @property
+    def thumbnail_url(self):
+        return _smallest(self.renders.get('thumb'))
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'], name='asset_created_idx')]
+
     def save(self, *args, **kwargs):
         # calcula tamaño antes de la primera escritura
         if self.file and self.file.size:
@@ -45,6 +186,19 @@ class Experience(models.Model):
     config_json  = models.JSONField(blank=True, default=dict)
     is_published = models.BooleanField(default=False)
     views        = models.IntegerField(default=0)
+    version      = models.PositiveIntegerField(default=0)   # sube con cada escritura de escena (ver core.scene)
+    renders      = models.JSONField(blank=True, default=dict)   # QR del enlace publicado (core.renders)
+
+    @property
+    def total_views(self):
+        """Visitas guardadas + las aún pendientes de volcar en este proceso."""
+        from .counters import view_counter
+        return self.views + view_counter.pending(self.pk)
+
+    @property
+    def qr_url(self):
+        """QR en SVG (pocos KB a cualquier tamaño) o None si aún no se ha generado."""
+        return (self.renders.get('qr') or {}).get('svg')
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -77,5 +231,77 @@ class ExperienceAsset(models.Model):
 
 
 class DetectionMetric(models.Model):
-    experience  = models.ForeignKey(Experience, on_delete=models.CASCADE)
-    detected_at = models.DateTimeField(auto_now_add=True)
+    """Detección cruda; las antiguas se mueven a tablas mensuales (core.archive)."""
+    experience  = models.ForeignKey(Experience, on_delete=models.CASCADE,
+                                    db_index=False)   # cubierto por metric_exp_time_idx
+    target      = models.ForeignKey(Target, on_delete=models.SET_NULL, blank=True, null=True)
+    detected_at = models.DateTimeField(default=timezone.now)   # se fija al recibir, no al volcar el lote
+    rolled_up   = models.BooleanField(default=False)           # ya sumada en DetectionRollup
+
+    class Meta:
+        indexes = [
+            # /api/metrics/?experience= y borrado en cascada
+            models.Index(fields=['experience', 'detected_at', 'id'], name='metric_exp_time_idx'),
+            # /api/metrics/ sin filtro y archivo/poda por antigüedad
+            models.Index(fields=['detected_at', 'id'], name='metric_time_idx'),
+            # compact(): sólo las pendientes, que son pocas
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='metric_pending_idx'),
+        ]
+
+
+class DetectionRollup(models.Model):
+    """Contador de detecciones por hora/día; target nulo = total de la experiencia."""
+    HOUR, DAY = 'hour', 'day'
+    BUCKET_CHOICES = [(HOUR, 'Hora'), (DAY, 'Día')]
+
+    experience   = models.ForeignKey(Experience, on_delete=models.CASCADE)
+    target       = models.ForeignKey(Target, on_delete=models.CASCADE, blank=True, null=True)
+    bucket       = models.CharField(max_length=4, choices=BUCKET_CHOICES)
+    period_start = models.DateTimeField()
+    count        = models.BigIntegerField(default=0)
+
+    class Meta:
+        # las consultas por experiencia usan las restricciones únicas; ésta es la del total global
+        indexes = [models.Index(fields=['bucket', 'period_start'], name='rollup_bucket_period_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['experience', 'bucket', 'period_start'],
+                condition=models.Q(target__isnull=True),
+                name='uniq_rollup_experience',
+            ),
+            models.UniqueConstraint(
+                fields=['experience', 'target', 'bucket', 'period_start'],
+                condition=models.Q(target__isnull=False),
+                name='uniq_rollup_target',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.experience_id}/{self.target_id or '*'} {self.bucket} {self.period_start:%Y-%m-%d %H:%M}={self.count}"
+
+
+class UploadSession(models.Model):
+    """Subida por trozos reanudable; al completarse crea el Asset o el Target."""
+    ASSET, TARGET = 'asset', 'target'
+    KIND_CHOICES = [(ASSET, 'Asset'), (TARGET, 'Target')]
+
+    id         = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner      = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    kind       = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename   = models.CharField(max_length=255)
+    size       = models.BigIntegerField()                 # bytes esperados
+    offset     = models.BigIntegerField(default=0)        # bytes ya escritos
+    sha256     = models.CharField(max_length=64, blank=True)   # del fichero completo (opcional)
+    fields     = models.JSONField(blank=True, default=dict)     # name, type…
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='upload_updated_idx')]   # purge_expired()
+
+    @property
+    def part_path(self) -> Path:
+        return Path(settings.MEDIA_ROOT, 'uploads', 'tmp', f'{self.pk}.part')
+
+    def __str__(self):
+        return f"{self.kind}:{self.filename} {self.offset}/{self.size}"
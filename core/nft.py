@@ -0,0 +1,104 @@
+# core/nft.py
+"""
+Lectura de los ficheros de marcador NFT de ARToolKit5 / WebARKit.
+
+- .iset:  int num_escalas, JPEG de la escala base (con su DPI) y los DPI
+          (float) del resto de escalas.
+- .fset:  puntos de seguimiento por escala: int num_escalas y, por escala,
+          int escala, float max_dpi, float min_dpi, int n y n registros
+          (int x, int y, float mx, float my, float similitud).
+- .fset3: puntos clave FREAK para la detección inicial: int n, n registros
+          de tamaño fijo y la tabla de páginas/imágenes.
+
+Todo little-endian (lo que escribe el creador en x86/wasm). `analyse`
+devuelve un resumen apto para JSON; una sección ilegible no tumba el resto.
+"""
+import io
+import struct
+from pathlib import Path
+
+from PIL import Image
+
+FSET_POINT    = struct.Struct('<iifff')
+FSET3_POINT   = 132   # coord2D + coord3D (4 float), FreakFeature (96 B + 3 int), página, imagen
+FSET3_IMAGE   = struct.Struct('<iii')   # ancho, alto, n.º de imagen
+
+
+class MarkerFormatError(ValueError):
+    pass
+
+
+def _int(data: bytes, offset: int) -> int:
+    if offset + 4 > len(data):
+        raise MarkerFormatError('Fichero truncado')
+    return struct.unpack_from('<i', data, offset)[0]
+
+
+def read_iset(data: bytes) -> dict:
+    num = _int(data, 0)
+    if not 0 < num < 64:
+        raise MarkerFormatError(f'Número de escalas inválido: {num}')
+    tail = data[len(data) - 4 * (num - 1):] if num > 1 else b''
+    with Image.open(io.BytesIO(data[4:len(data) - len(tail)])) as img:
+        width, height = img.size
+        base_dpi = float(img.info.get('dpi', (0, 0))[0] or 0)
+    dpis = [base_dpi, *struct.unpack(f'<{num - 1}f', tail)]
+    return {'width': width, 'height': height, 'dpi_levels': [round(d, 2) for d in dpis]}
+
+
+def read_fset(data: bytes) -> dict:
+    num, offset, levels = _int(data, 0), 4, []
+    for _ in range(num):
+        if offset + 16 > len(data):
+            raise MarkerFormatError('Fichero truncado')
+        _, max_dpi, min_dpi, points = struct.unpack_from('<iffi', data, offset)
+        offset += 16 + points * FSET_POINT.size
+        levels.append({'max_dpi': round(max_dpi, 2), 'min_dpi': round(min_dpi, 2), 'points': points})
+    if offset != len(data):
+        raise MarkerFormatError('Tamaño de .fset inesperado')
+    return {'levels': levels, 'points': sum(l['points'] for l in levels)}
+
+
+def read_fset3(data: bytes) -> dict:
+    points = _int(data, 0)
+    out = {'points': points}
+    try:   # la tabla de páginas depende del tamaño del registro FREAK de la versión
+        offset = 4 + points * FSET3_POINT
+        pages, offset, images = _int(data, offset), offset + 4, []
+        for _ in range(pages):
+            count, offset = _int(data, offset + 4), offset + 8   # n.º de página, n.º de imágenes
+            for _ in range(count):
+                width, height, _ = FSET3_IMAGE.unpack_from(data, offset)
+                images.append([width, height])
+                offset += FSET3_IMAGE.size
+        if offset == len(data):
+            out['images'] = images
+    except (MarkerFormatError, struct.error):
+        pass
+    return out
+
+
+READERS = {'.iset': read_iset, '.fset': read_fset, '.fset3': read_fset3}
+
+
+def analyse(prefix) -> dict:
+    """Resumen del juego `prefix`.{iset,fset,fset3}: tamaños, escalas y puntos."""
+    prefix = Path(prefix)
+    stats  = {'bytes': {}, 'gzip_bytes': {}}
+    for ext, reader in READERS.items():
+        path = prefix.with_name(prefix.name + ext)
+        key  = ext[1:]
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        stats['bytes'][key] = len(data)
+        gz = path.with_name(path.name + '.gz')
+        stats['gzip_bytes'][key] = gz.stat().st_size if gz.exists() else len(data)
+        try:
+            stats[key] = reader(data)
+        except (MarkerFormatError, struct.error, OSError) as e:
+            stats[key] = {'error': str(e)}
+    stats['bytes']['total']      = sum(stats['bytes'].values())
+    stats['gzip_bytes']['total'] = sum(stats['gzip_bytes'].values())
+    return stats
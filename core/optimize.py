@@ -0,0 +1,223 @@
+# core/optimize.py
+"""
+Derivados optimizados de los Asset para el visor móvil.
+
+Se ejecuta como trabajo `asset` en `manage.py run_jobs`. Según Asset.type:
+
+- image: orientación EXIF, reducción a ASSET_IMAGE_MAX_PX y WebP.
+- model: texturas embebidas del GLB reducidas a ASSET_TEXTURE_MAX_PX y
+  recomprimidas; si está instalado `gltf-transform` además simplifica la
+  malla (ASSET_MESH_RATIO).
+- video/audio: `ffmpeg` con bitrate acotado, si está disponible.
+
+El original no se toca; el derivado sólo se guarda si pesa menos.
+"""
+import io
+import json
+import logging
+import shutil
+import struct
+import subprocess
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps
+
+from . import jobs, media, perf
+from .models import Asset, Job
+
+log = logging.getLogger(__name__)
+
+GLB_MAGIC, CHUNK_JSON, CHUNK_BIN = 0x46546C67, 0x4E4F534A, 0x004E4942
+
+
+def enqueue_optimize(asset: Asset) -> Job:
+    job = jobs.enqueue('asset', asset_id=asset.pk)
+    asset.process_job = job
+    asset.save(update_fields=['process_job'])
+    return job
+
+
+# ---------- Imágenes ----------
+def _fit(img: Image.Image, max_px: int) -> Image.Image:
+    if max(img.size) > max_px:
+        img = img.copy()
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+    return img
+
+
+def optimize_image(src: Path, dst_dir: Path) -> Path:
+    with Image.open(src) as img:
+        img = _fit(ImageOps.exif_transpose(img), settings.ASSET_IMAGE_MAX_PX)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        out = dst_dir / f'{src.stem}.webp'
+        img.save(out, 'WEBP', quality=settings.ASSET_IMAGE_QUALITY, method=6)
+    return out
+
+
+# ---------- GLB ----------
+def _read_glb(data: bytes):
+    magic, version, length = struct.unpack_from('<III', data, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise ValueError('No es un GLB 2.0')
+    offset, gltf, binary = 12, None, b''
+    while offset < length:
+        chunk_len, chunk_type = struct.unpack_from('<II', data, offset)
+        chunk = data[offset + 8: offset + 8 + chunk_len]
+        if chunk_type == CHUNK_JSON:
+            gltf = json.loads(chunk)
+        elif chunk_type == CHUNK_BIN and not binary:
+            binary = chunk
+        offset += 8 + chunk_len
+    return gltf, binary
+
+
+def _write_glb(gltf: dict, binary: bytes) -> bytes:
+    js = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    js += b' ' * (-len(js) % 4)
+    binary += b'\0' * (-len(binary) % 4)
+    length = 12 + 8 + len(js) + (8 + len(binary) if binary else 0)
+    out = struct.pack('<III', GLB_MAGIC, 2, length) + struct.pack('<II', len(js), CHUNK_JSON) + js
+    if binary:
+        out += struct.pack('<II', len(binary), CHUNK_BIN) + binary
+    return out
+
+
+def _recompress_texture(data: bytes, mime: str):
+    """(bytes, mime) de la textura reducida, o None si no compensa."""
+    with Image.open(io.BytesIO(data)) as img:
+        img = _fit(img, settings.ASSET_TEXTURE_MAX_PX)
+        buf = io.BytesIO()
+        has_alpha = img.mode in ('RGBA', 'LA') or 'transparency' in img.info
+        if has_alpha:   # glTF core sólo admite PNG/JPEG
+            img.convert('RGBA').save(buf, 'PNG', optimize=True)
+            new_mime = 'image/png'
+        else:
+            img.convert('RGB').save(buf, 'JPEG', quality=settings.ASSET_IMAGE_QUALITY,
+                                    optimize=True, progressive=True)
+            new_mime = 'image/jpeg'
+    new = buf.getvalue()
+    return (new, new_mime) if len(new) < len(data) else None
+
+
+def shrink_glb_textures(data: bytes) -> bytes:
+    """Reescribe el BIN del GLB con las texturas embebidas reducidas."""
+    gltf, binary = _read_glb(data)
+    views   = gltf.get('bufferViews', [])
+    buffers = gltf.get('buffers', [])
+    if not binary or not buffers or 'uri' in buffers[0]:
+        return data
+
+    replaced = {}
+    for image in gltf.get('images', []):
+        idx = image.get('bufferView')
+        mime = image.get('mimeType', '')
+        if idx is None or mime not in ('image/png', 'image/jpeg'):
+            continue
+        view  = views[idx]
+        start = view.get('byteOffset', 0)
+        try:
+            result = _recompress_texture(binary[start:start + view['byteLength']], mime)
+        except Exception:   # textura corrupta o formato raro: se deja como está
+            log.warning('Textura %s no recomprimible', idx, exc_info=True)
+            continue
+        if result:
+            replaced[idx]     = result[0]
+            image['mimeType'] = result[1]
+
+    if not replaced:
+        return data
+
+    # reconstruye el buffer 0 respetando el alineamiento de 4 bytes
+    new_bin = bytearray()
+    for idx, view in enumerate(views):
+        if view.get('buffer', 0) != 0:
+            continue
+        start = view.get('byteOffset', 0)
+        chunk = replaced.get(idx, binary[start:start + view['byteLength']])
+        new_bin += b'\0' * (-len(new_bin) % 4)
+        view['byteOffset'] = len(new_bin)
+        view['byteLength'] = len(chunk)
+        new_bin += chunk
+    buffers[0]['byteLength'] = len(new_bin)
+    return _write_glb(gltf, bytes(new_bin))
+
+
+def optimize_model(src: Path, dst_dir: Path) -> Path:
+    work = src
+    tool = shutil.which('gltf-transform')
+    if tool and settings.ASSET_MESH_RATIO:
+        simplified = dst_dir / f'{src.stem}.simplified.glb'
+        with perf.timer('subprocess', 'gltf-transform'):
+            subprocess.run([tool, 'simplify', str(src), str(simplified),
+                            '--ratio', str(settings.ASSET_MESH_RATIO)],
+                           check=True, stdout=subprocess.DEVNULL, timeout=600)
+        work = simplified
+    try:
+        data = shrink_glb_textures(work.read_bytes())
+    except (ValueError, struct.error):   # .gltf de texto u otro formato: no se toca
+        return None
+    out = dst_dir / f'{src.stem}.glb'
+    out.write_bytes(data)
+    return out
+
+
+# ---------- Vídeo / audio ----------
+def _ffmpeg(src: Path, out: Path, args: list) -> Path:
+    tool = shutil.which('ffmpeg')
+    if not tool:
+        return None
+    with perf.timer('subprocess', 'ffmpeg'):
+        subprocess.run([tool, '-y', '-loglevel', 'error', '-i', str(src), *args, str(out)],
+                       check=True, timeout=3600)
+    return out
+
+
+def optimize_video(src: Path, dst_dir: Path) -> Path:
+    rate = settings.ASSET_VIDEO_MAXRATE
+    return _ffmpeg(src, dst_dir / f'{src.stem}.mp4', [
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+        '-maxrate', rate, '-bufsize', rate,
+        '-vf', f"scale='min({settings.ASSET_VIDEO_MAX_PX},iw)':-2",
+        '-c:a', 'aac', '-b:a', settings.ASSET_AUDIO_BITRATE,
+        '-movflags', '+faststart',
+    ])
+
+
+def optimize_audio(src: Path, dst_dir: Path) -> Path:
+    return _ffmpeg(src, dst_dir / f'{src.stem}.m4a', [
+        '-vn', '-c:a', 'aac', '-b:a', settings.ASSET_AUDIO_BITRATE,
+    ])
+
+
+OPTIMIZERS = {
+    'image': optimize_image,
+    'model': optimize_model,
+    'video': optimize_video,
+    'audio': optimize_audio,
+}
+
+
+# ---------- Handler del worker ----------
+def optimize_asset(job: Job):
+    asset     = Asset.objects.get(pk=job.payload['asset_id'])
+    optimizer = OPTIMIZERS.get(asset.type)
+    if not optimizer:
+        return
+    src = Path(asset.file.path)
+    jobs.set_progress(job, 10)
+    with tempfile.TemporaryDirectory() as tmp:
+        out = optimizer(src, Path(tmp))
+        jobs.set_progress(job, 80)
+        # sin herramienta o sin ganancia: se sirve el original
+        if out and out.stat().st_size < src.stat().st_size:
+            if asset.optimized:
+                asset.optimized.delete(save=False)
+            with out.open('rb') as fh:
+                asset.optimized.save(out.name, File(fh), save=False)
+            asset.optimized_size_mb = asset.optimized.size / (1024 * 1024)
+            asset.save(update_fields=['optimized', 'optimized_size_mb'])
+    media.precompress(asset.delivery_file.path)   # .gz/.br del GLB que descarga el visor
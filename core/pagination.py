@@ -0,0 +1,33 @@
+# core/pagination.py
+"""
+Paginación por cursor (keyset) para toda la API.
+
+Cada página es un `WHERE created_at < :cursor ORDER BY created_at DESC, id
+DESC LIMIT n`: el coste no depende de cuántas páginas se hayan recorrido y
+no hay `COUNT(*)` por petición. Quien necesite el total usa la acción
+`count/` (CountMixin).
+"""
+from django.conf import settings
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.response   import Response
+
+
+class KeysetPagination(CursorPagination):
+    """Orden por `view.cursor_ordering` (por defecto más recientes primero)."""
+    ordering              = ('-created_at', '-id')
+    page_size             = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size         = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', None) or self.ordering)
+
+
+class CountMixin:
+    """GET <lista>/count/ → {"count": n}, con los mismos filtros que la lista."""
+
+    @action(detail=False, methods=['GET'])
+    def count(self, request):
+        qs = self.filter_queryset(self.get_queryset())
+        return Response({'count': qs.select_related(None).prefetch_related(None).order_by().count()})
@@ -0,0 +1,390 @@
+# core/perf.py
+"""
+Instrumentación de rendimiento: dónde se va el tiempo de cada petición.
+
+- `PerfMiddleware`: latencia por endpoint (view_name) en histogramas,
+  consultas a la BD (número y tiempo, vía execute_wrapper) y, con
+  PERF_SERVER_TIMING, cabecera Server-Timing para las devtools.
+- `timer(kind, name)`: API para medir bloques fuera del ORM; se usa para
+  plantillas (instaladas en `install()`), subprocesos (NFTMarkerCreator,
+  ffmpeg, gltf-transform), E/S de ficheros (paquete offline, .gz) y
+  trabajos de run_jobs.
+- `/metrics`: exposición en formato Prometheus. Cada proceso vuelca su
+  registro a PERF_DIR/<pid>-<arranque>.json cada PERF_DUMP_INTERVAL
+  segundos (y al terminar cada trabajo), y la vista suma todos los
+  ficheros: da igual a qué worker de gunicorn llegue el scrape. Los de
+  procesos que ya no existen (y el propio al salir, `retire()`) se suman
+  a PERF_DIR/_total.json y se borran, así que ni se acumulan ficheros ni
+  bajan los contadores; el sufijo de arranque evita que un pid reciclado
+  pise el fichero de otro proceso.
+- Perfilado: con PERF_PROFILE_RATE > 0 una fracción de las peticiones se
+  ejecuta bajo cProfile y, si tardan más de PERF_PROFILE_SLOW_MS, se
+  guarda el .prof en PERF_PROFILE_DIR. Con la tasa a 0 no se crea nada.
+
+Por petición el coste es un par de perf_counter y una suma con lock.
+"""
+import contextvars
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db   import connections
+
+try:
+    import fcntl
+except ImportError:   # Windows: sin lock entre procesos
+    fcntl = None
+
+TOTAL   = '_total.json'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    'yukiar_http_request_duration_seconds': ('histogram', 'Latencia por endpoint'),
+    'yukiar_http_requests_total':           ('counter',   'Peticiones por endpoint y código'),
+    'yukiar_db_queries_total':              ('counter',   'Consultas SQL por endpoint'),
+    'yukiar_db_query_seconds_total':        ('counter',   'Tiempo en la BD por endpoint'),
+    'yukiar_template_duration_seconds':     ('histogram', 'Render de plantillas'),
+    'yukiar_subprocess_duration_seconds':   ('histogram', 'Herramientas externas (node, ffmpeg…)'),
+    'yukiar_io_duration_seconds':           ('histogram', 'E/S de ficheros (paquetes, precompresión)'),
+    'yukiar_job_duration_seconds':          ('histogram', 'Trabajos de run_jobs'),
+}
+
+
+class Registry:
+    """Contadores e histogramas del proceso; se reinicia tras un fork."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid       = os.getpid()
+        self._started   = time.time_ns()
+        self.counters   = {}   # (nombre, etiquetas) → valor
+        self.histograms = {}   # (nombre, etiquetas) → [por cubo…, +Inf, suma]
+        self._dumped_at = time.monotonic()
+
+    def inc(self, name: str, labels: tuple, value: float = 1):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            row = self.histograms.get((name, labels))
+            if row is None:
+                row = self.histograms[(name, labels)] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(BUCKETS)] += 1
+            row[-1] += value
+
+    @property
+    def filename(self) -> str:
+        return f'{os.getpid()}-{self._started}.json'
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()   # lo heredado del padre no es de este proceso
+            return {
+                'counters':   [[n, list(l), v] for (n, l), v in self.counters.items()],
+                'histograms': [[n, list(l), list(r)] for (n, l), r in self.histograms.items()],
+            }
+
+    def dump(self, force: bool = False):
+        """Escribe PERF_DIR/<pid>.json (como mucho cada PERF_DUMP_INTERVAL s salvo `force`)."""
+        now = time.monotonic()
+        if not force and now - self._dumped_at < settings.PERF_DUMP_INTERVAL:
+            return
+        self._dumped_at = now
+        snap = self.snapshot()
+        _write_json(Path(settings.PERF_DIR, self.filename), snap)
+
+    def retire(self):
+        """Al salir el proceso: suma lo suyo a _total.json y borra su fichero."""
+        snap = self.snapshot()
+        with _dir_lock():
+            own = Path(settings.PERF_DIR, self.filename)
+            _fold_into_total([snap])
+            own.unlink(missing_ok=True)
+            with self._lock:
+                self._reset()
+
+
+def _write_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_text(json.dumps(data), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _dir_lock():
+    path = Path(settings.PERF_DIR, '.lock')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _alive(pid: int) -> bool:
+    # PERF_DIR es local al host: los pids de los ficheros son de esta máquina
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:   # existe, pero es de otro usuario
+        return True
+    return True
+
+
+def _fold_into_total(snapshots):
+    # con _dir_lock() tomado
+    path  = Path(settings.PERF_DIR, TOTAL)
+    total = _read_json(path)
+    counters, histograms = _sum([*([total] if total else []), *snapshots])
+    _write_json(path, {
+        'counters':   [[n, list(l), v] for (n, l), v in counters.items()],
+        'histograms': [[n, list(l), r] for (n, l), r in histograms.items()],
+    })
+
+
+def prune() -> int:
+    """Suma a _total.json los ficheros de procesos muertos y los borra; devuelve cuántos."""
+    root = Path(settings.PERF_DIR)
+    dead = []
+    for path in root.glob('*.json'):
+        pid = path.stem.split('-', 1)[0]
+        if path.name != TOTAL and pid.isdigit() and not _alive(int(pid)):
+            dead.append(path)
+    if not dead:
+        return 0
+    with _dir_lock():
+        snapshots = [snap for snap in map(_read_json, dead) if snap]
+        _fold_into_total(snapshots)
+        for path in dead:
+            path.unlink(missing_ok=True)
+    return len(dead)
+
+
+registry = Registry()
+
+
+# ---------- Medición de bloques ----------
+class _RequestState:
+    __slots__ = ('db_count', 'db_time', 'spans')
+
+    def __init__(self):
+        self.db_count, self.db_time, self.spans = 0, 0.0, {}
+
+
+_current = contextvars.ContextVar('perf_request', default=None)
+
+
+@contextmanager
+def timer(kind: str, name: str):
+    """Mide el bloque en yukiar_<kind>_duration_seconds{name} y lo suma a la petición en curso."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(f'yukiar_{kind}_duration_seconds', (('name', name),), elapsed)
+        state = _current.get()
+        if state is not None:
+            state.spans[kind] = state.spans.get(kind, 0.0) + elapsed
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state = _current.get()
+        if state is not None:
+            state.db_count += 1
+            state.db_time  += time.perf_counter() - start
+
+
+def install():
+    """Mide el render de todas las plantillas Django (una vez por proceso)."""
+    from django.template.backends.django import Template
+    if getattr(Template.render, 'perf_timed', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        with timer('template', self.origin.template_name or 'string'):
+            return original(self, context, request)
+
+    render.perf_timed = True
+    Template.render = render
+
+
+# ---------- Middleware ----------
+def _route(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'unmatched'
+
+
+def _save_profile(profiler, route: str, elapsed: float):
+    out_dir = Path(settings.PERF_PROFILE_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^\w.-]+', '_', route)[:60]
+    profiler.dump_stats(out_dir / f'{time.strftime("%Y%m%d-%H%M%S")}-{slug}-{elapsed * 1000:.0f}ms.prof')
+    dumps = sorted(out_dir.glob('*.prof'), key=lambda p: p.stat().st_mtime)
+    for old in dumps[:-settings.PERF_PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+
+
+class PerfMiddleware:
+    """
+    Síncrono y asíncrono: bajo ASGI no obliga a Django a envolver las vistas
+    async en un hilo. En el camino asíncrono no se perfila (cProfile mide el
+    hilo y mezclaría las peticiones que comparten el bucle).
+    """
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rate    = settings.PERF_PROFILE_RATE
+        profile = cProfile.Profile() if rate and random.random() < rate else None
+        with self._measure() as (state, start):
+            if profile:
+                profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profile:
+                    profile.disable()
+        return self._finish(request, response, state, start, profile)
+
+    async def __acall__(self, request):
+        with self._measure() as (state, start):
+            response = await self.get_response(request)
+        return self._finish(request, response, state, start)
+
+    @contextmanager
+    def _measure(self):
+        state = _RequestState()
+        token = _current.set(state)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_db_wrapper))
+                yield state, time.perf_counter()
+        finally:
+            _current.reset(token)
+
+    def _finish(self, request, response, state, start, profile=None):
+        elapsed = time.perf_counter() - start
+        route, method = _route(request), request.method
+        registry.observe('yukiar_http_request_duration_seconds', (('method', method), ('route', route)), elapsed)
+        registry.inc('yukiar_http_requests_total',
+                     (('method', method), ('route', route), ('status', str(response.status_code))))
+        if state.db_count:
+            registry.inc('yukiar_db_queries_total', (('route', route),), state.db_count)
+            registry.inc('yukiar_db_query_seconds_total', (('route', route),), state.db_time)
+        if profile and elapsed * 1000 >= settings.PERF_PROFILE_SLOW_MS:
+            _save_profile(profile, route, elapsed)
+        if settings.PERF_SERVER_TIMING:
+            parts = [f'db;desc="{state.db_count} queries";dur={state.db_time * 1000:.1f}']
+            parts += [f'{kind};dur={t * 1000:.1f}' for kind, t in state.spans.items()]
+            parts.append(f'total;dur={elapsed * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(parts)
+        registry.dump()
+        return response
+
+
+# ---------- Exposición Prometheus ----------
+def _merged() -> tuple:
+    prune()
+    snapshots = [registry.snapshot()]
+    own = registry.filename
+    with _dir_lock():   # sin que otro proceso mueva un fichero a _total.json a media lectura
+        for path in Path(settings.PERF_DIR).glob('*.json'):
+            if path.name == own:
+                continue   # el propio proceso va en vivo
+            snap = _read_json(path)
+            if snap:
+                snapshots.append(snap)
+    return _sum(snapshots)
+
+
+def _sum(snapshots) -> tuple:
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, row in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            acc = histograms.setdefault(key, [0] * len(row))
+            histograms[key] = [a + b for a, b in zip(acc, row)]
+    return counters, histograms
+
+
+def _labels(labels, extra=()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in pairs) + '}'
+
+
+def exposition() -> str:
+    counters, histograms = _merged()
+    lines, seen = [], set()
+
+    def header(name):
+        if name not in seen:
+            seen.add(name)
+            kind, text = HELP.get(name, ('untyped', ''))
+            lines.extend([f'# HELP {name} {text}', f'# TYPE {name} {kind}'])
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name)
+        lines.append(f'{name}{_labels(labels)} {value:g}')
+    for (name, labels), row in sorted(histograms.items()):
+        header(name)
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), row[:-1]):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {row[-1]:.6f}')
+        lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,128 @@
+# core/publishing.py
+"""
+Motor único de publicación (API autenticada y endpoint auxiliar del editor).
+
+Salidas por experiencia: visor estático (viewer_cache) y paquete offline
+(core.bundle). Antes de construir se calcula la huella del grafo de la
+experiencia (manifiesto + plantilla + URL del QR); si coincide con la de
+la última publicación y las salidas siguen en disco, no se toca nada.
+
+El QR del enlace no se dibuja aquí: lo genera el worker (core.renders,
+trabajo `render`) en varios tamaños y formatos. Sus URLs dependen sólo del
+enlace, así que la respuesta ya las incluye aunque el trabajo esté en cola.
+
+Un flock por experiencia serializa las publicaciones concurrentes: la
+segunda espera a la primera, ve la huella ya escrita y vuelve al instante.
+"""
+import contextlib
+import hashlib
+import json
+from pathlib import Path
+
+from django.conf            import settings
+from django.db.models       import Case, F, Sum, When
+from django.template.loader import get_template
+
+from . import bundle, cache, manifest, renders, viewer_cache
+from .models import Experience
+
+try:
+    import fcntl
+except ImportError:   # Windows: sin lock entre procesos
+    fcntl = None
+
+MAX_PUBLISH_MB = 50
+
+
+class PublishError(Exception):
+    pass
+
+
+def state_path(exp_id) -> Path:
+    return bundle.bundle_dir(exp_id) / 'publish.json'
+
+
+@contextlib.contextmanager
+def locked(exp_id):
+    path = bundle.bundle_dir(exp_id) / '.lock'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def delivered_mb(exp) -> float:
+    size = Case(When(asset__optimized_size_mb__gt=0, then=F('asset__optimized_size_mb')),
+                default=F('asset__size_mb'))
+    return exp.experienceasset_set.aggregate(s=Sum(size))['s'] or 0
+
+
+def fingerprint(scene: dict, viewer_url: str) -> str:
+    template = Path(get_template('viewer.html').origin.name)
+    digest = hashlib.sha256()
+    for part in (manifest.etag(scene), str(template.stat().st_mtime_ns), viewer_url or ''):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _load_state(exp_id):
+    try:
+        return json.loads(state_path(exp_id).read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _outputs_present(exp_id, state) -> bool:
+    return (viewer_cache.path_for(exp_id).exists()
+            and (bundle.bundle_dir(exp_id) / Path(state['bundle_url']).name).exists())
+
+
+def _qr(exp, viewer_url) -> dict:
+    """URLs del QR de `viewer_url`; si faltan en disco encola su render."""
+    if not viewer_url:
+        return {'qr_url': None, 'qr': None, 'qr_job': None}
+    job = None if renders.qr_ready(viewer_url) else renders.enqueue_render(exp, viewer_url)
+    qr  = renders.qr_urls(viewer_url)
+    return {
+        'qr_url': qr['png'][str(settings.RENDER_QR_SIZES[0])],   # antes, un único PNG
+        'qr':     qr,
+        'qr_job': job.pk if job else None,
+    }
+
+
+def publish(exp: Experience, viewer_url: str = None) -> dict:
+    """
+    Publica `exp` y devuelve las URLs de salida. `viewer_url` (absoluta)
+    es lo que codifica el QR; sin ella no hay QR.
+    """
+    if delivered_mb(exp) > MAX_PUBLISH_MB:
+        raise PublishError('Contenido demasiado grande')
+    # update() y no save(): no dispara la invalidación del visor
+    if Experience.objects.filter(pk=exp.pk, is_published=False).update(is_published=True):
+        cache.touch(Experience, exp.pk)
+    exp.is_published = True
+
+    with locked(exp.pk):
+        context = viewer_cache.viewer_context(exp)
+        fp      = fingerprint(context['manifest'], viewer_url)
+        state   = _load_state(exp.pk)
+        if state and state['fingerprint'] == fp and _outputs_present(exp.pk, state):
+            return {**state, **_qr(exp, viewer_url), 'rebuilt': False}
+
+        html, _ = viewer_cache.store(exp, context)
+        index   = bundle.build(exp, context, html)
+        state = {
+            'fingerprint':    fp,
+            'viewer_url':     f'{settings.MEDIA_URL}{viewer_cache.path_for(exp.pk).name}',
+            'viewer_link':    viewer_url,
+            'bundle_url':     index['bundle'],
+            'bundle_version': index['version'],
+        }
+        viewer_cache.write_atomic(state_path(exp.pk), json.dumps(state))
+    return {**state, **_qr(exp, viewer_url), 'rebuilt': True}
@@ -0,0 +1,181 @@
+# core/renders.py
+"""
+Derivados de presentación generados por el worker (trabajo `render`).
+
+- QR del enlace del visor: PNG en RENDER_QR_SIZES píxeles (1 bit, módulos
+  enteros centrados) y un SVG que escala solo.
+- Miniaturas WebP de Target.image y de los Asset de tipo imagen, con el
+  lado mayor en RENDER_THUMB_SIZES.
+
+Cada juego se guarda en MEDIA_ROOT/renders/<aa>/<clave>/, donde la clave
+es el hash del contenido de origen (bytes de la imagen o texto del QR)
+más los parámetros de render: dos targets con la misma imagen comparten
+miniaturas y, si el directorio ya está completo, no se abre la imagen.
+Como el nombre cambia con el contenido, se sirven como `immutable`.
+
+El resultado queda en el campo `renders` del modelo ({'key', 'thumb'} o
+{'key', 'link', 'qr'}) y lo exponen los serializers y el dashboard. Se
+escribe con update(): no invalida el visor publicado.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL         import Image, ImageOps
+
+import qrcode
+import qrcode.image.svg
+
+from . import cache, jobs, media, perf, storage
+from .models import Asset, Experience, Job, Target
+
+RENDER_DIR = 'renders'
+READ_SIZE  = 1024 * 1024
+MODELS     = {'target': Target, 'asset': Asset, 'experience': Experience}
+
+
+def _key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def file_digest(f) -> str:
+    h = hashlib.sha256()
+    with f.open('rb') as fh:
+        for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def render_dir(key: str) -> Path:
+    return Path(settings.MEDIA_ROOT, RENDER_DIR, key[:2], key)
+
+
+def url_for(key: str, name: str) -> str:
+    return f'{settings.MEDIA_URL}{RENDER_DIR}/{key[:2]}/{key}/{name}'
+
+
+def _write(path: Path, save):
+    """save(ruta_temporal) y rename atómico: un lector nunca ve un fichero a medias."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    os.close(fd)
+    try:
+        save(tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+# ---------- QR ----------
+def qr_key(link: str) -> str:
+    return _key('qr', link, *settings.RENDER_QR_SIZES)
+
+
+def qr_urls(link: str) -> dict:
+    """URLs del juego de QR de `link` (existan o no todavía)."""
+    key = qr_key(link)
+    return {
+        'png': {str(size): url_for(key, f'qr-{size}.png') for size in settings.RENDER_QR_SIZES},
+        'svg': url_for(key, 'qr.svg'),
+    }
+
+
+def qr_ready(link: str) -> bool:
+    out = render_dir(qr_key(link))
+    return (out / 'qr.svg').exists() and all(
+        (out / f'qr-{size}.png').exists() for size in settings.RENDER_QR_SIZES)
+
+
+def render_qr(link: str) -> dict:
+    out = render_dir(qr_key(link))
+    if not qr_ready(link):
+        out.mkdir(parents=True, exist_ok=True)
+        code = qrcode.QRCode(box_size=1, border=4)
+        code.add_data(link)
+        code.make(fit=True)
+        modules = code.make_image().get_image().convert('1')
+        for size in settings.RENDER_QR_SIZES:
+            box    = max(1, size // modules.width)
+            scaled = modules.resize((modules.width * box,) * 2, Image.NEAREST)
+            canvas = Image.new('1', (max(size, scaled.width),) * 2, 1)
+            canvas.paste(scaled, ((canvas.width - scaled.width) // 2,) * 2)
+            _write(out / f'qr-{size}.png', lambda tmp: canvas.save(tmp, 'PNG', optimize=True))
+        svg = code.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+        _write(out / 'qr.svg', lambda tmp: Path(tmp).write_bytes(svg))
+        media.precompress(out / 'qr.svg')
+    return {'key': qr_key(link), 'link': link, 'qr': qr_urls(link)}
+
+
+# ---------- Miniaturas ----------
+def thumb_key(digest: str) -> str:
+    return _key('thumb', digest, settings.RENDER_THUMB_QUALITY, *settings.RENDER_THUMB_SIZES)
+
+
+def render_thumbnails(f, digest: str = None) -> dict:
+    """Miniaturas WebP del fichero de imagen `f` (FieldFile)."""
+    key = thumb_key(digest or file_digest(f))
+    out = render_dir(key)
+    names = {size: f'thumb-{size}.webp' for size in settings.RENDER_THUMB_SIZES}
+    if not all((out / name).exists() for name in names.values()):
+        out.mkdir(parents=True, exist_ok=True)
+        with f.open('rb') as fh, Image.open(fh) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            for size in sorted(names, reverse=True):   # cada una reduce la anterior
+                img = img.copy()
+                img.thumbnail((size, size), Image.LANCZOS)
+                _write(out / names[size], lambda tmp: img.save(
+                    tmp, 'WEBP', quality=settings.RENDER_THUMB_QUALITY, method=6))
+    return {'key': key, 'thumb': {str(size): url_for(key, name) for size, name in names.items()}}
+
+
+# ---------- Encolado ----------
+def needs_render(obj) -> bool:
+    if isinstance(obj, Asset):
+        return obj.type == 'image' and bool(obj.file)
+    return bool(obj.image)
+
+
+def enqueue_render(obj, link: str = None) -> Job:
+    """Encola los derivados de un Target / Asset (o el QR de `link` para una Experience)."""
+    kind = obj._meta.model_name
+    return jobs.enqueue('render', model=kind, id=obj.pk, **({'link': link} if link else {}))
+
+
+def enqueue_renders(objs, max_attempts: int = None) -> list:
+    """Como enqueue_render() para muchos Target / Asset en un solo INSERT."""
+    return jobs.enqueue_many('render', [{'model': o._meta.model_name, 'id': o.pk}
+                                        for o in objs if needs_render(o)], max_attempts)
+
+
+def backfill() -> list:
+    """Encola los Target y Asset de imagen que aún no tienen miniaturas; devuelve los trabajos."""
+    pending = [*Target.objects.filter(renders={}).exclude(image=''),
+               *Asset.objects.filter(renders={}, type='image')]
+    return enqueue_renders(pending)
+
+
+# ---------- Handler del worker ----------
+def render(job: Job):
+    model = MODELS[job.payload['model']]
+    obj   = model.objects.filter(pk=job.payload['id']).first()
+    if obj is None:   # borrado mientras esperaba en la cola
+        return
+    with perf.timer('render', job.payload['model']):
+        if model is Experience:
+            result = render_qr(job.payload['link'])
+        elif needs_render(obj):
+            f = obj.file if model is Asset else obj.image
+            result = render_thumbnails(f, storage.digest_of(f.name) if storage.is_blob(f.name) else None)
+        else:
+            return
+    model.objects.filter(pk=obj.pk).update(renders=result)
+    cache.touch(model, obj.pk)
@@ -0,0 +1,121 @@
+# core/rollups.py
+"""
+Agregados de detecciones por hora y por día.
+
+Las lecturas del dashboard sólo tocan DetectionRollup, cuyo tamaño depende
+de experiencias × periodos y no del número de detecciones crudas. Los
+contadores se mantienen al volcar el buffer de métricas (`apply`) y
+`manage.py compact_metrics` suma lo que haya llegado por otras vías y
+poda las filas crudas antiguas.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db        import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils     import timezone
+
+from .models import DetectionMetric, DetectionRollup
+
+TRUNC = {DetectionRollup.HOUR: TruncHour, DetectionRollup.DAY: TruncDay}
+
+
+def period_start(ts, bucket: str):
+    local = timezone.localtime(ts).replace(minute=0, second=0, microsecond=0)
+    if bucket == DetectionRollup.DAY:
+        local = local.replace(hour=0)
+    return local
+
+
+def _increment(key, n: int):
+    experience_id, target_id, bucket, start = key
+    lookup = dict(experience_id=experience_id, target_id=target_id, bucket=bucket, period_start=start)
+    if DetectionRollup.objects.filter(**lookup).update(count=F('count') + n):
+        return
+    try:
+        with transaction.atomic():
+            DetectionRollup.objects.create(count=n, **lookup)
+    except IntegrityError:   # otro proceso creó la fila entre el UPDATE y el INSERT
+        DetectionRollup.objects.filter(**lookup).update(count=F('count') + n)
+
+
+def apply(counts: Counter):
+    """Suma {(experience_id, target_id, bucket, period_start): n} a los agregados."""
+    for key, n in sorted(counts.items(), key=lambda kv: (kv[0][0], kv[0][1] or 0, kv[0][2], kv[0][3])):
+        _increment(key, n)
+
+
+def count_metrics(metrics) -> Counter:
+    counts = Counter()
+    for m in metrics:
+        for bucket in TRUNC:
+            start = period_start(m.detected_at, bucket)
+            counts[(m.experience_id, None, bucket, start)] += 1
+            if m.target_id:
+                counts[(m.experience_id, m.target_id, bucket, start)] += 1
+    return counts
+
+
+def compact(retention_days: int = None, chunk: int = 10000) -> dict:
+    """
+    Pasa a los agregados las filas crudas aún sin sumar y, si se indica,
+    borra las ya sumadas con más de `retention_days` días.
+    """
+    folded = 0
+    while True:
+        ids = list(DetectionMetric.objects.filter(rolled_up=False)
+                   .order_by('id').values_list('id', flat=True)[:chunk])
+        if not ids:
+            break
+        with transaction.atomic():
+            raw = DetectionMetric.objects.filter(id__in=ids, rolled_up=False)
+            counts = Counter()
+            for bucket, trunc in TRUNC.items():
+                rows = (raw.annotate(start=trunc('detected_at'))
+                        .values('experience_id', 'target_id', 'start')
+                        .annotate(n=Count('id')))
+                for r in rows:
+                    counts[(r['experience_id'], None, bucket, r['start'])] += r['n']
+                    if r['target_id']:
+                        counts[(r['experience_id'], r['target_id'], bucket, r['start'])] += r['n']
+            apply(counts)
+            folded += raw.update(rolled_up=True)
+
+    pruned = 0
+    if retention_days is not None:
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        old = DetectionMetric.objects.filter(rolled_up=True, detected_at__lt=cutoff)
+        while True:
+            ids = list(old.values_list('id', flat=True)[:chunk])
+            if not ids:
+                break
+            pruned += DetectionMetric.objects.filter(id__in=ids).delete()[0]
+    return {'folded': folded, 'pruned': pruned}
+
+
+# ---------- Lecturas ----------
+def series(bucket: str, start, end, experience_id=None, target_id=None) -> list:
+    """[(period_start, count)] con ceros en los periodos sin detecciones."""
+    first = period_start(start, bucket)
+    qs = DetectionRollup.objects.filter(bucket=bucket, period_start__gte=first, period_start__lt=end)
+    if experience_id:
+        qs = qs.filter(experience_id=experience_id)
+    qs = qs.filter(target_id=target_id) if target_id else qs.filter(target__isnull=True)
+    found = {r['period_start']: r['n'] for r in qs.values('period_start').annotate(n=Sum('count'))}
+    found = {timezone.localtime(k): v for k, v in found.items()}
+
+    points, current = [], first
+    step = timedelta(hours=1) if bucket == DetectionRollup.HOUR else timedelta(days=1)
+    while current < end:
+        points.append((current, found.get(current, 0)))
+        current = period_start(current + step, bucket)
+    return points
+
+
+def target_totals(experience_id: int) -> dict:
+    """{target_id: detecciones} acumuladas, desde los agregados diarios."""
+    rows = (DetectionRollup.objects
+            .filter(experience_id=experience_id, bucket=DetectionRollup.DAY, target__isnull=False)
+            .values('target_id').annotate(n=Sum('count')))
+    return {r['target_id']: r['n'] for r in rows}
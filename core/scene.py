@@ -0,0 +1,112 @@
+# core/scene.py
+"""
+Escritura por lotes de una escena: altas, cambios y bajas de ExperienceAsset
+más un JSON Patch sobre config_json, todo en una transacción.
+
+Control optimista: el cliente envía la `version` de la experiencia que
+leyó (viene en el manifiesto). El primer paso es un UPDATE condicional
+que la incrementa; si otra pestaña guardó antes, no casa ninguna fila y
+se responde 409 sin tocar nada.
+
+`replace_config` (save_config) sustituye config_json entero sin versión
+del cliente, pero también con un UPDATE de una sola sentencia
+(`version = version + 1`): nunca pisa un lote de ops que se cuele entre
+medias y siempre invalida la versión que leyeron las demás pestañas.
+"""
+from asgiref.sync     import sync_to_async
+from django.db        import transaction
+from django.db.models import F
+
+from . import cache, jsonpatch, viewer_cache
+from .models import Asset, Experience, ExperienceAsset
+
+UPDATABLE = ('target', 'transform', 'autoplay', 'loop', 'face_user')
+IDENTITY  = {'pos': [0, 0, 0], 'rot': [0, 0, 0], 'scale': [1, 1, 1]}
+
+
+class Conflict(Exception):
+    def __init__(self, version):
+        super().__init__(f'La escena cambió (versión actual {version})')
+        self.version = version
+
+
+class OpError(ValueError):
+    pass
+
+
+def _check_ids(wanted, found, what):
+    missing = set(wanted) - set(found)
+    if missing:
+        raise OpError(f'{what} inexistentes en esta experiencia: {sorted(missing)}')
+
+
+def apply_ops(exp: Experience, version: int, create=(), update=(), delete=(), config=()) -> dict:
+    """Devuelve {'version': nueva, 'created': [ids]} o lanza Conflict / OpError."""
+    with transaction.atomic():
+        fields = {'version': version + 1}
+        if config:
+            fields['config_json'] = jsonpatch.apply(exp.config_json, config)
+        if not Experience.objects.filter(pk=exp.pk, version=version).update(**fields):
+            raise Conflict(Experience.objects.filter(pk=exp.pk).values_list('version', flat=True).first())
+
+        target_ids = {op['target'] for op in (*create, *update) if 'target' in op}
+        if target_ids:
+            _check_ids(target_ids, exp.targets.filter(pk__in=target_ids).values_list('id', flat=True),
+                       'Targets')
+
+        if delete:
+            deleted, _ = ExperienceAsset.objects.filter(experience=exp, pk__in=delete).delete()
+            if deleted != len(set(delete)):
+                raise OpError('Algún contenido a borrar no existe en esta experiencia')
+
+        if update:
+            rows = ExperienceAsset.objects.in_bulk([op['id'] for op in update])
+            _check_ids([op['id'] for op in update],
+                       [pk for pk, ea in rows.items() if ea.experience_id == exp.pk], 'Contenidos')
+            changed = set()
+            for op in update:
+                ea = rows[op['id']]
+                for name in UPDATABLE:
+                    if name in op:
+                        setattr(ea, f'{name}_id' if name == 'target' else name, op[name])
+                        changed.add(name)
+            if changed:
+                ExperienceAsset.objects.bulk_update(rows.values(), sorted(changed))
+
+        created = []
+        if create:
+            asset_ids = {op['asset'] for op in create}
+            _check_ids(asset_ids, Asset.objects.filter(pk__in=asset_ids).values_list('id', flat=True),
+                       'Assets')
+            created = ExperienceAsset.objects.bulk_create([
+                ExperienceAsset(experience=exp, asset_id=op['asset'], target_id=op['target'],
+                                **{'transform': IDENTITY, **{k: op[k] for k in UPDATABLE[1:] if k in op}})
+                for op in create
+            ])
+
+        # UPDATE y bulk_* no disparan señales: se invalidan visor y caché a mano
+        _changed(exp.pk)
+        cache.touch(ExperienceAsset)
+
+    return {'version': version + 1, 'created': [ea.pk for ea in created]}
+
+
+def _changed(exp_id):
+    transaction.on_commit(lambda: viewer_cache.invalidate(exp_id))
+    cache.touch(Experience, exp_id)
+
+
+def replace_config(exp_id: int, config) -> bool:
+    """Sustituye config_json y sube la versión; False si la experiencia no existe."""
+    if not Experience.objects.filter(pk=exp_id).update(config_json=config, version=F('version') + 1):
+        return False
+    _changed(exp_id)
+    return True
+
+
+async def areplace_config(exp_id: int, config) -> bool:
+    """replace_config() para save_config_async."""
+    if not await Experience.objects.filter(pk=exp_id).aupdate(config_json=config, version=F('version') + 1):
+        return False
+    await sync_to_async(_changed, thread_sensitive=False)(exp_id)
+    return True
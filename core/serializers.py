@@ -1,35 +1,78 @@
 # core/serializers.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Target, Asset, Experience, ExperienceAsset, DetectionMetric
+from .models import Target, Asset, Experience, ExperienceAsset, DetectionMetric, UploadSession
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=id,name` en un GET limita la respuesta a esos campos (los
+    desconocidos se ignoran). En escrituras no se aplica: la validación
+    siempre ve el serializer completo.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        wanted = request.query_params.get('fields')
+        if wanted:
+            keep = {f.strip() for f in wanted.split(',')}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    """Campos pedidos con ?fields= o None si se quieren todos."""
+    wanted = request.query_params.get('fields') if request.method == 'GET' else None
+    return {f.strip() for f in wanted.split(',')} if wanted else None
+
 
+class TargetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    marker_status   = serializers.ReadOnlyField()
+    marker_progress = serializers.ReadOnlyField()
 
-class TargetSerializer(serializers.ModelSerializer):
     class Meta:
         model  = Target
-        fields = ['id', 'name', 'image', 'pattfile', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'name', 'image', 'pattfile', 'created_at',
+            'marker_job', 'marker_status', 'marker_progress',
+            'marker_profile', 'marker_stats', 'renders'
+        ]
+        read_only_fields = ['id', 'created_at', 'marker_job', 'marker_stats', 'renders']
+
 
+class AssetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    processing_status = serializers.ReadOnlyField()
 
-class AssetSerializer(serializers.ModelSerializer):
     class Meta:
         model  = Asset
-        fields = ['id', 'name', 'file', 'type', 'size_mb', 'created_at']
-        read_only_fields = ['id', 'size_mb', 'created_at']
+        fields = [
+            'id', 'name', 'file', 'type', 'size_mb', 'created_at',
+            'optimized', 'optimized_size_mb', 'process_job', 'processing_status', 'renders'
+        ]
+        read_only_fields = [
+            'id', 'size_mb', 'created_at',
+            'optimized', 'optimized_size_mb', 'process_job', 'renders'
+        ]
 
 
-# core/serializers.py
-class ExperienceSerializer(serializers.ModelSerializer):
+class ExperienceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     targets = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Target.objects.all(), required=False
     )
+    views = serializers.ReadOnlyField(source='total_views')
 
     class Meta:
         model  = Experience
-        fields = ['id', 'name', 'slug', 'is_published', 'views', 'targets']
-        read_only_fields = ['id', 'slug', 'is_published', 'views']
+        fields = ['id', 'name', 'slug', 'is_published', 'views', 'version', 'targets', 'renders']
+        read_only_fields = ['id', 'slug', 'is_published', 'views', 'version', 'renders']
 
 
-class ExperienceAssetSerializer(serializers.ModelSerializer):
+class ExperienceAssetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model  = ExperienceAsset
         fields = [
@@ -39,8 +82,146 @@ class ExperienceAssetSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class DetectionMetricSerializer(serializers.ModelSerializer):
+class DetectionMetricSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model  = DetectionMetric
-        fields = ['id', 'experience', 'detected_at']
+        fields = ['id', 'experience', 'target', 'detected_at']
         read_only_fields = ['id', 'detected_at']
+
+
+class DetectionItemSerializer(serializers.Serializer):
+    experience  = serializers.IntegerField(min_value=1)
+    target      = serializers.IntegerField(min_value=1, required=False)
+    detected_at = serializers.DateTimeField(required=False)
+
+
+class DetectionBatchSerializer(serializers.Serializer):
+    detections = DetectionItemSerializer(many=True, allow_empty=False)
+
+    check_ids = True   # la vista asíncrona comprueba las ids con el ORM async
+
+    def validate_detections(self, items):
+        if len(items) > settings.METRICS_BATCH_MAX:
+            raise serializers.ValidationError(
+                f"Máximo {settings.METRICS_BATCH_MAX} detecciones por lote"
+            )
+        if self.check_ids:
+            ids, tids = detection_ids(items)
+            check_detection_ids(
+                items,
+                set(Experience.objects.filter(pk__in=ids).values_list('id', flat=True)),
+                set(Target.objects.filter(pk__in=tids).values_list('id', flat=True)),
+            )
+        return items
+
+
+def detection_ids(items) -> tuple:
+    """(ids de experiencia, ids de target) a los que apuntan las detecciones."""
+    return {i['experience'] for i in items}, {i['target'] for i in items if i.get('target')}
+
+
+def check_detection_ids(items, experiences: set, targets: set):
+    """ValidationError si alguna detección apunta a una experiencia o target que no existe."""
+    ids, tids = detection_ids(items)
+    if ids - experiences:
+        raise serializers.ValidationError(f"Experiencias inexistentes: {sorted(ids - experiences)}")
+    if tids - targets:
+        raise serializers.ValidationError(f"Targets inexistentes: {sorted(tids - targets)}")
+
+
+class RollupQuerySerializer(serializers.Serializer):
+    bucket     = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    start      = serializers.DateTimeField(required=False)
+    end        = serializers.DateTimeField(required=False)
+    experience = serializers.IntegerField(min_value=1, required=False)
+    target     = serializers.IntegerField(min_value=1, required=False)
+
+    MAX_POINTS = {'hour': 24 * 31, 'day': 366}
+
+    def validate(self, data):
+        step = timedelta(hours=1) if data['bucket'] == 'hour' else timedelta(days=1)
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - step * (24 if data['bucket'] == 'hour' else 30))
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError("start debe ser anterior a end")
+        if (data['end'] - data['start']) / step > self.MAX_POINTS[data['bucket']]:
+            raise serializers.ValidationError(
+                f"Rango demasiado amplio (máx. {self.MAX_POINTS[data['bucket']]} puntos)"
+            )
+        return data
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(max_length=100, write_only=True)
+    type = serializers.ChoiceField(choices=Asset.TYPE_CHOICES, write_only=True, required=False)
+    marker_profile = serializers.ChoiceField(choices=Target.PROFILE_CHOICES, write_only=True, required=False)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model  = UploadSession
+        fields = ['id', 'kind', 'filename', 'size', 'offset', 'sha256', 'name', 'type',
+                  'marker_profile', 'chunk_size', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Tamaño fuera de rango (máx. {settings.UPLOAD_MAX_SIZE} bytes)")
+        return value
+
+    def validate(self, data):
+        if data['kind'] == UploadSession.TARGET:
+            if Target.objects.filter(name=data['name']).exists():
+                raise serializers.ValidationError({'name': 'Ya existe un target con ese nombre'})
+        elif 'type' not in data:
+            raise serializers.ValidationError({'type': 'Obligatorio para assets'})
+        data['fields'] = {'name': data.pop('name'), 'type': data.pop('type', ''),
+                          'marker_profile': data.pop('marker_profile', 'standard')}
+        return data
+
+
+def _validate_transform(value):
+    if not isinstance(value, dict):
+        raise serializers.ValidationError('Debe ser un objeto {pos, rot, scale}')
+    for key, vec in value.items():
+        if key not in ('pos', 'rot', 'scale'):
+            raise serializers.ValidationError(f'Clave desconocida: {key}')
+        if (not isinstance(vec, list) or len(vec) != 3
+                or not all(isinstance(n, (int, float)) and not isinstance(n, bool) for n in vec)):
+            raise serializers.ValidationError(f'{key} debe ser [x, y, z]')
+    return value
+
+
+class PlacementCreateSerializer(serializers.Serializer):
+    asset     = serializers.IntegerField(min_value=1)
+    target    = serializers.IntegerField(min_value=1)
+    transform = serializers.JSONField(required=False, validators=[_validate_transform])
+    autoplay  = serializers.BooleanField(required=False)
+    loop      = serializers.BooleanField(required=False)
+    face_user = serializers.BooleanField(required=False)
+
+
+class PlacementUpdateSerializer(PlacementCreateSerializer):
+    id     = serializers.IntegerField(min_value=1)
+    asset  = None   # para cambiar de asset: borrar y crear
+    target = serializers.IntegerField(min_value=1, required=False)
+
+
+class SceneOpsSerializer(serializers.Serializer):
+    """{"version": n, "create": [...], "update": [...], "delete": [ids], "config": [patch ops]}"""
+    version = serializers.IntegerField(min_value=0)
+    create  = PlacementCreateSerializer(many=True, required=False, default=list)
+    update  = PlacementUpdateSerializer(many=True, required=False, default=list)
+    delete  = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    config  = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+
+    def validate(self, data):
+        total = sum(len(data[k]) for k in ('create', 'update', 'delete', 'config'))
+        if total > settings.SCENE_OPS_MAX:
+            raise serializers.ValidationError(f'Máximo {settings.SCENE_OPS_MAX} operaciones por lote')
+        ids = [op['id'] for op in data['update']]
+        if len(ids) != len(set(ids)) or set(ids) & set(data['delete']):
+            raise serializers.ValidationError('Cada contenido puede aparecer una sola vez por lote')
+        return data
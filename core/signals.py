@@ -0,0 +1,125 @@
+# core/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch           import receiver
+
+from . import cache, storage, viewer_cache
+from .models import Asset, Experience, ExperienceAsset, Job, Target
+
+
+@receiver(pre_delete, sender=Target)
+def release_marker_set(sender, instance, **kwargs):
+    # se relee de la BD: la instancia puede no reflejar lo que hizo el worker
+    marker_set_id = Target.objects.filter(pk=instance.pk).values_list('marker_set_id', flat=True).first()
+    if marker_set_id:
+        from .markers import release
+        release(marker_set_id)
+
+
+# ---------- Referencias a blobs de Asset ----------
+BLOB_FIELDS = ('file', 'optimized')
+
+
+def _blob_names(asset):
+    return {getattr(asset, f).name for f in BLOB_FIELDS} - {None, ''}
+
+
+@receiver(pre_save, sender=Asset)
+def remember_asset_blobs(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(BLOB_FIELDS):
+        instance._blobs_before = None   # p. ej. sólo process_job: nada que contar
+    elif instance.pk:
+        instance._blobs_before = set(
+            n for row in Asset.objects.filter(pk=instance.pk).values_list(*BLOB_FIELDS) for n in row
+        ) - {None, ''}
+    else:
+        instance._blobs_before = set()
+
+
+@receiver(post_save, sender=Asset)
+def count_asset_blobs(sender, instance, **kwargs):
+    before = getattr(instance, '_blobs_before', None)
+    if before is None:
+        return
+    after = _blob_names(instance)
+    storage.retain(*(after - before))
+    storage.release(*(before - after))
+    instance._blobs_before = None
+
+
+@receiver(post_delete, sender=Asset)
+def release_asset_blobs(sender, instance, **kwargs):
+    storage.release(*_blob_names(instance))
+
+
+# ---------- Invalidación del visor publicado ----------
+def _experiences_using(**lookup):
+    ids = set(ExperienceAsset.objects.filter(**lookup).values_list('experience_id', flat=True))
+    if 'target' in lookup:
+        ids |= set(Experience.objects.filter(targets=lookup['target']).values_list('id', flat=True))
+    return ids
+
+
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=Experience)
+def invalidate_experience(sender, instance, **kwargs):
+    viewer_cache.invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=Experience.targets.through)
+def invalidate_experience_targets(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':   # target.experience_set.clear()
+        viewer_cache.invalidate(*_experiences_using(target=instance))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        viewer_cache.invalidate(*(pk_set or ()) if reverse else [instance.pk])
+
+
+def _scene_changed(*exp_ids):
+    """Visor en disco y manifiesto cacheado (generación de la experiencia) de esas experiencias."""
+    if exp_ids:
+        viewer_cache.invalidate(*exp_ids)
+        cache.touch(Experience, *exp_ids)
+
+
+@receiver(post_save, sender=ExperienceAsset)
+@receiver(post_delete, sender=ExperienceAsset)
+def invalidate_experience_asset(sender, instance, **kwargs):
+    _scene_changed(instance.experience_id)
+
+
+@receiver(post_save, sender=Target)
+@receiver(pre_delete, sender=Target)
+def invalidate_target(sender, instance, created=False, **kwargs):
+    if not created:
+        _scene_changed(*_experiences_using(target=instance))
+
+
+@receiver(post_save, sender=Asset)
+@receiver(pre_delete, sender=Asset)
+def invalidate_asset(sender, instance, created=False, **kwargs):
+    if not created:
+        _scene_changed(*_experiences_using(asset=instance))
+
+
+# ---------- Caché de lecturas del ORM (core.cache) ----------
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=Experience)
+@receiver(post_save, sender=Target)
+@receiver(post_delete, sender=Target)
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+@receiver(post_save, sender=ExperienceAsset)
+@receiver(post_delete, sender=ExperienceAsset)
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def touch_cached(sender, instance, **kwargs):
+    cache.touch(sender, instance.pk)
+
+
+@receiver(m2m_changed, sender=Experience.targets.through)
+def touch_experience_targets(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        if reverse:   # target.experience_set.*: en pre_clear aún se sabe a cuáles afecta
+            ids = pk_set or Experience.objects.filter(targets=instance).values_list('id', flat=True)
+            cache.touch(Experience, *ids)
+        else:
+            cache.touch(Experience, instance.pk)
@@ -5,9 +5,9 @@ document.addEventListener('DOMContentLoaded', () => {
   const ctx         = document.getElementById('usage-chart').getContext('2d');
 
   Promise.all([
-    fetch('/api/targets/?page_size=1').then(r => r.json()),
-    fetch('/api/assets/?page_size=1').then(r => r.json()),
-    fetch('/api/experiences/?page_size=1').then(r => r.json()),
+    fetch('/api/targets/count/').then(r => r.json()),
+    fetch('/api/assets/count/').then(r => r.json()),
+    fetch('/api/experiences/count/').then(r => r.json()),
     fetch('/api/metrics/weekly/').then(r => r.json())
   ]).then(([t,a,e,m]) => {
     statTargets.textContent = t.count;
@@ -7,6 +7,45 @@ const JSON_HEADERS = {
 
 const $ = id => document.getElementById(id);
 
+// Ficheros mayores que esto van por /api/uploads/ en trozos reanudables
+const CHUNKED_FROM = 8 * 1024 * 1024;
+
+// Biblioteca paginada por cursor: primera página y "Cargar más…"
+const LIBRARY_URL = '/api/assets/?fields=id,name,type,file&page_size=100';
+
+async function chunkedUpload(file, kind, fields) {
+  let session = await fetch('/api/uploads/', {
+    method: 'POST',
+    headers: JSON_HEADERS,
+    body: JSON.stringify({ kind, filename: file.name, size: file.size, ...fields })
+  }).then(r => r.json());
+  if (!session.id) throw new Error(JSON.stringify(session));
+
+  let offset = session.offset, retries = 0;
+  while (offset < file.size) {
+    const end = Math.min(offset + session.chunk_size, file.size);
+    try {
+      const r = await fetch(`/api/uploads/${session.id}/chunk/`, {
+        method: 'PUT',
+        headers: { 'X-CSRFToken': CSRF, 'Upload-Offset': String(offset),
+                   'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, end)
+      });
+      const body = await r.json();
+      if (!r.ok && r.status !== 409) throw new Error(body.detail);
+      offset = body.offset;   // 409: el servidor indica desde dónde seguir
+      retries = 0;
+    } catch (err) {
+      if (++retries > 5) throw err;
+      await new Promise(res => setTimeout(res, 1000 * retries));
+      offset = (await fetch(`/api/uploads/${session.id}/`).then(r => r.json())).offset;
+    }
+  }
+  return fetch(`/api/uploads/${session.id}/complete/`, {
+    method: 'POST', headers: JSON_HEADERS
+  }).then(r => r.json());
+}
+
 document.addEventListener('DOMContentLoaded', () => {
   const canvas = $('three-canvas');
   const tree = $('tree');
@@ -44,12 +83,10 @@ document.addEventListener('DOMContentLoaded', () => {
   controls.dampingFactor = 0.1;
   controls.addEventListener('change', () => renderer.render(scene, camera));
   transform.addEventListener('change', () => renderer.render(scene, camera));
-  transform.addEventListener('objectChange', updateInputs);
+  transform.addEventListener('objectChange', () => { updateInputs(); queueTransform(); });
   scene.add(transform);
 
   const expId = window.EXP_ID;
-  const tgtQP = `experience=${expId}`;
-  const eaQP = `experience=${expId}`;
 
   const objMap = new Map();
   const tgtMap = new Map();
@@ -58,18 +95,26 @@ document.addEventListener('DOMContentLoaded', () => {
   let selected = null;
   let currentTarget = null;
   let selectedAsset = null;
+  let selectedEa = null;
   let planes = [];
+  let sceneVersion = 0;
 
   refreshAll();
 
+  // Una petición para toda la escena; el navegador revalida con el ETag (304)
   function refreshAll() {
     Promise.all([
-      fetch(`/api/targets/?${tgtQP}`).then(r => r.json()).then(renderTargets),
-      fetch(`/api/exp-assets/?${eaQP}`).then(r => r.json()).then(renderEA),
-      fetch('/api/assets/').then(r => r.json()).then(renderGlobalAssets)
+      fetch(`/api/experiences/${expId}/manifest/`).then(r => r.json()).then(renderScene),
+      fetch(LIBRARY_URL).then(r => r.json()).then(page => renderGlobalAssets(page))
     ]).catch(console.error);
   }
 
+  function renderScene(manifest) {
+    sceneVersion = manifest.experience.version;
+    renderTargets(manifest.targets);
+    renderEA(manifest.targets.flatMap(t => t.assets.map(ea => ({ ...ea, target: t.id }))));
+  }
+
   function renderTargets(targets = []) {
     tree.innerHTML = '';
     tgtMap.clear();
@@ -133,6 +178,7 @@ document.addEventListener('DOMContentLoaded', () => {
           li.className = 'cursor-pointer';
           li.onclick = () => {
             selectedAsset = ea;
+            selectedEa = ea.id;
             transform.attach(obj);
             selected = obj;
             updateInputs();
@@ -141,8 +187,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
       };
 
+      const url = abs(ea.asset.url || ea.asset.file);
       if (ea.asset.type === 'model') {
-        const url = abs(ea.asset.file);
         gltfLoader.load(
           url,
           gltf => {
@@ -158,7 +204,7 @@ document.addEventListener('DOMContentLoaded', () => {
       } else {
         const sprMat = new THREE.SpriteMaterial();
         texLoader.load(
-          abs(ea.asset.file),
+          url,
           tex => { sprMat.map = tex; obj = new THREE.Sprite(sprMat); finish(); },
           undefined,
           err => console.error('Texture error', err)
@@ -167,49 +213,62 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
-  function renderGlobalAssets(assets = []) {
-    globalAssets.innerHTML = '';
-    assetMap.clear();
+  function renderGlobalAssets(page, append = false) {
+    if (!append) {
+      globalAssets.innerHTML = '';
+      assetMap.clear();
+    }
+    globalAssets.querySelector('.load-more')?.remove();
 
-    assets.forEach(a => {
+    page.results.forEach(a => {
       const li = document.createElement('li');
       li.textContent = a.name;
       li.className = 'cursor-pointer text-gray-600';
       li.onclick = () => {
         selectedAsset = a;
+        selectedEa = null;
         assetMap.forEach(n => n.style.background = '');
         li.style.background = '#eef';
 
         if (currentTarget) {
-          fetch('/api/exp-assets/', {
-            method: 'POST',
-            headers: JSON_HEADERS,
-            credentials: 'same-origin',
-            body: JSON.stringify({
-              experience: expId,
-              asset: a.id,
-              target: currentTarget,
-              transform: { pos: [0, 0, 0], rot: [0, 0, 0], scale: [1, 1, 1] }
-            })
-          })
-            .then(r => r.json())
-            .then(newEa => renderEA([newEa]));
+          const placement = {
+            asset: a.id,
+            target: currentTarget,
+            transform: { pos: [0, 0, 0], rot: [0, 0, 0], scale: [1, 1, 1] }
+          };
+          flushOps({ create: [placement] })
+            .then(res => res && renderEA([{ ...placement, id: res.created[0], asset: a }]));
         }
       };
       globalAssets.appendChild(li);
       assetMap.set(a.id, li);
     });
+
+    if (page.next) {
+      const more = document.createElement('li');
+      more.textContent = 'Cargar más…';
+      more.className = 'load-more cursor-pointer text-blue-600';
+      more.onclick = () => fetch(page.next).then(r => r.json()).then(p => renderGlobalAssets(p, true));
+      globalAssets.appendChild(more);
+    }
   }
 
   btnAddTarget.onclick = () => fileTarget.click();
   fileTarget.onchange = () => {
     const file = fileTarget.files[0];
-    const fd = new FormData();
-    fd.append('name', file.name.replace(/\.[^.]+$/, ''));
-    fd.append('image', file);
+    const name = file.name.replace(/\.[^.]+$/, '');
+    let created;
+    if (file.size > CHUNKED_FROM) {
+      created = chunkedUpload(file, 'target', { name });
+    } else {
+      const fd = new FormData();
+      fd.append('name', name);
+      fd.append('image', file);
+      created = fetch('/api/targets/', { method: 'POST', headers: { 'X-CSRFToken': CSRF }, body: fd })
+        .then(r => r.json());
+    }
 
-    fetch('/api/targets/', { method: 'POST', headers: { 'X-CSRFToken': CSRF }, body: fd })
-      .then(r => r.json())
+    created
       .then(t => {
         return fetch(`/api/experiences/${expId}/`, {
           method: 'PATCH',
@@ -235,10 +294,14 @@ document.addEventListener('DOMContentLoaded', () => {
   btnAddAsset.onclick = () => fileAsset.click();
   fileAsset.onchange = () => {
     const file = fileAsset.files[0];
+    const kind = file.type.split('/')[0] || (file.name.match(/\.(gltf|glb)$/i) ? 'model' : 'file');
+    if (file.size > CHUNKED_FROM) {
+      chunkedUpload(file, 'asset', { name: file.name, type: kind }).then(refreshAll);
+      return;
+    }
     const fd = new FormData();
     fd.append('name', file.name);
     fd.append('file', file);
-    const kind = file.type.split('/')[0] || (file.name.match(/\.(gltf|glb)$/i) ? 'model' : 'file');
     fd.append('type', kind);
 
     fetch('/api/assets/', {
@@ -251,13 +314,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
   btnDelAsset.onclick = () => {
     if (!selectedAsset) return alert('Selecciona un asset');
-    const ea = [...objMap.keys()].find(id => selectedAsset.id === selectedAsset.id);
-    if (ea) {
-      fetch(`/api/exp-assets/${ea}/`, {
-        method: 'DELETE',
-        headers: JSON_HEADERS,
-        credentials: 'same-origin'
-      }).then(refreshAll);
+    if (selectedEa) {
+      pendingUpdates.delete(selectedEa);
+      flushOps({ delete: [selectedEa] }).then(refreshAll);
+      selectedEa = null;
     } else {
       if (confirm('Eliminar el asset globalmente? Puede afectar otras experiencias.')) {
         fetch(`/api/assets/${selectedAsset.id}/`, {
@@ -293,7 +353,7 @@ document.addEventListener('DOMContentLoaded', () => {
     el.style.background = '#eef';
   }
 
-  const abs = p => p.startsWith('http') ? p : `/media/${p}`;
+  const abs = p => p.startsWith('http') || p.startsWith('/') ? p : `/media/${p}`;
 
   function applyTransform(o, t) {
     o.position.set(...t.pos);
@@ -317,8 +377,8 @@ document.addEventListener('DOMContentLoaded', () => {
         renderer.render(scene, camera);
       };
 
-      slider.oninput = () => { input.value = slider.value; if (selected) setter(slider.value); };
-      input.oninput = () => { slider.value = input.value; if (selected) setter(input.value); };
+      slider.oninput = () => { input.value = slider.value; if (selected) { setter(slider.value); queueTransform(); } };
+      input.oninput = () => { slider.value = input.value; if (selected) { setter(input.value); queueTransform(); } };
     });
   }
   syncInputGroup('pos', false);
@@ -334,14 +394,60 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
-  setInterval(() => {
-    fetch(`/save_config/${expId}/`, {
-      method: 'PATCH',
+  // ---------- Escrituras por lotes (/api/experiences/<id>/ops/) ----------
+  // Los arrastres se acumulan y se envían juntos; `version` detecta ediciones concurrentes.
+  const pendingUpdates = new Map();   // ea.id → transform
+  let flushTimer = null;
+
+  function readTransform(o) {
+    return {
+      pos: o.position.toArray().map(n => +n.toFixed(4)),
+      rot: [o.rotation.x, o.rotation.y, o.rotation.z].map(r => +THREE.MathUtils.radToDeg(r).toFixed(2)),
+      scale: o.scale.toArray().map(n => +n.toFixed(4))
+    };
+  }
+
+  function queueTransform() {
+    if (!selected || !selectedEa) return;
+    pendingUpdates.set(selectedEa, readTransform(selected));
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushOps, 800);
+  }
+
+  function flushOps(extra = {}) {
+    clearTimeout(flushTimer);
+    const update = [...pendingUpdates].map(([id, transform]) => ({ id, transform }));
+    pendingUpdates.clear();
+    if (!update.length && !Object.keys(extra).length) return Promise.resolve(null);
+
+    return fetch(`/api/experiences/${expId}/ops/`, {
+      method: 'POST',
       headers: JSON_HEADERS,
       credentials: 'same-origin',
-      body: JSON.stringify({ config_json: { objects: [...objMap.keys()] } })
-    });
+      body: JSON.stringify({ version: sceneVersion, update, ...extra })
+    })
+      .then(async r => {
+        const body = await r.json();
+        if (r.status === 409) {
+          alert('La escena se modificó en otra ventana; se recarga.');
+          refreshAll();
+          return null;
+        }
+        if (!r.ok) throw new Error(body.detail || JSON.stringify(body));
+        sceneVersion = body.version;
+        return body;
+      })
+      .catch(err => { console.error(err); return null; });
+  }
+
+  let savedObjects = null;
+  setInterval(() => {
+    const objects = [...objMap.keys()];
+    if (JSON.stringify(objects) === savedObjects) return flushOps();
+    flushOps({ config: [{ op: 'add', path: '/objects', value: objects }] })
+      .then(res => { if (res) savedObjects = JSON.stringify(objects); });
   }, 30000);
+  addEventListener('pagehide', () => flushOps());
 
   (function animate() {
     requestAnimationFrame(animate);
@@ -0,0 +1,147 @@
+# core/storage.py
+"""
+Almacenamiento direccionado por contenido para los ficheros de Asset.
+
+Cada fichero se guarda como MEDIA_ROOT/blobs/<aa>/<sha256><ext>: el hash se
+calcula mientras se escribe y, si el blob ya existe, la copia nueva se
+descarta. Dos subidas idénticas comparten disco y URL, y como el nombre
+cambia con el contenido el blob se puede servir como `immutable`.
+
+`delete()` nunca borra blobs: otro Asset puede apuntar al mismo. Las
+referencias se cuentan en Blob.refcount (ver signals) y los huérfanos los
+elimina `manage.py gc_blobs`.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.files.move    import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db.models          import F
+from django.utils              import timezone
+from django.utils.deconstruct  import deconstructible
+
+from . import media
+
+BLOB_DIR  = 'blobs'
+READ_SIZE = 64 * 1024
+
+
+def blob_name(digest: str, ext: str = '') -> str:
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def is_blob(name: str) -> bool:
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def digest_of(name: str) -> str:
+    return Path(name).stem
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # el nombre definitivo lo decide el hash en _save
+        return name
+
+    def _save(self, name, content):
+        ext = Path(name).suffix
+        tmp_dir = Path(self.path(BLOB_DIR), 'tmp')
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+
+        if hasattr(content, 'temporary_file_path'):
+            # ya está en disco (subida grande o por trozos): hash y rename, sin copiar
+            tmp = content.temporary_file_path()
+            with open(tmp, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+                    digest.update(chunk)
+                    size += len(chunk)
+            owned = False
+        else:
+            fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+            with os.fdopen(fd, 'wb') as fh:
+                for chunk in content.chunks(READ_SIZE):
+                    fh.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            owned = True   # el temporal es nuestro
+
+        final = blob_name(digest.hexdigest(), ext)
+        path  = Path(self.path(final))
+        # se registra antes de mirar el disco: así gc_blobs no puede llevárselo en medio
+        self._record(final, size)
+        if path.exists():
+            if owned:
+                os.unlink(tmp)   # duplicado: se conserva el blob existente
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if owned:
+                os.replace(tmp, path)
+            else:
+                file_move_safe(tmp, str(path), allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return final
+
+    @staticmethod
+    def _record(name, size):
+        from .models import Blob
+        Blob.objects.update_or_create(name=name, defaults={
+            'digest': digest_of(name), 'size_bytes': size, 'last_used_at': timezone.now(),
+        })
+
+    def delete(self, name):
+        if not is_blob(name):   # ficheros anteriores a los blobs
+            super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+# ---------- Referencias ----------
+def retain(*names):
+    from .models import Blob
+    names = [n for n in names if is_blob(n)]
+    if names:
+        Blob.objects.filter(name__in=names).update(refcount=F('refcount') + 1,
+                                                   last_used_at=timezone.now())
+
+
+def release(*names):
+    from .models import Blob
+    names = [n for n in names if is_blob(n)]
+    if names:
+        Blob.objects.filter(name__in=names, refcount__gt=0).update(refcount=F('refcount') - 1,
+                                                                   last_used_at=timezone.now())
+
+
+def collect(grace: timedelta, dry_run: bool = False) -> tuple:
+    """
+    Borra blobs sin referencias no usados en `grace` (una subida en curso ya
+    escribió el blob pero aún no guardó el Asset). Devuelve (blobs, bytes).
+    """
+    from .models import Blob
+    cutoff = timezone.now() - grace
+    count = freed = 0
+    for blob in Blob.objects.filter(refcount=0, last_used_at__lt=cutoff).iterator():
+        if dry_run:
+            count, freed = count + 1, freed + blob.size_bytes
+            continue
+        path = Path(blob_storage.path(blob.name))
+        # se aparta primero; si otra subida lo tocó entre medias, vuelve a su sitio
+        doomed = path.with_name(path.name + '.gc')
+        if path.exists():
+            os.replace(path, doomed)
+        if Blob.objects.filter(pk=blob.pk, refcount=0, last_used_at__lt=cutoff).delete()[0]:
+            doomed.unlink(missing_ok=True)
+            for variant in media.variants(path):
+                variant.unlink(missing_ok=True)
+            count, freed = count + 1, freed + blob.size_bytes
+        elif doomed.exists():
+            os.replace(doomed, path)
+    return count, freed
@@ -0,0 +1,46 @@
+{# core/templates/viewer_sw.js — service worker del visor publicado #}
+const CACHE = 'exp-{{ exp_id }}-{{ index.version }}';
+const PRECACHE = {{ urls|safe }};      // todo el paquete
+const INSTALL = {{ install|safe }};    // scripts, marcadores y contenidos precargados
+const VIEWER = '{{ index.viewer }}';
+
+// Primera visita: sólo lo que el visor necesita antes de detectar nada
+self.addEventListener('install', event => {
+  event.waitUntil(caches.open(CACHE).then(c => c.addAll(INSTALL)).then(() => self.skipWaiting()));
+});
+
+// Borra las cachés de publicaciones anteriores de esta experiencia
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys
+        .filter(k => k.startsWith('exp-{{ exp_id }}-') && k !== CACHE)
+        .map(k => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== location.origin) return;
+
+  // El HTML va primero a la red (cuenta visitas, trae la versión nueva); sin red, la copia
+  if (url.pathname === VIEWER) {
+    event.respondWith(
+      fetch(event.request)
+        .then(r => { const copy = r.clone(); caches.open(CACHE).then(c => c.put(VIEWER, copy)); return r; })
+        .catch(() => caches.match(VIEWER))
+    );
+    return;
+  }
+  // El resto del paquete se guarda la primera vez que el visor lo pide (al montar su target)
+  if (PRECACHE.includes(url.pathname)) {
+    event.respondWith(caches.match(url.pathname).then(hit => hit || fetch(event.request).then(r => {
+      if (r.ok && r.status === 200) {
+        const copy = r.clone();
+        caches.open(CACHE).then(c => c.put(url.pathname, copy));
+      }
+      return r;
+    })));
+  }
+});
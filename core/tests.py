@@ -1,3 +1,1621 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    archive, buffers, bundle, jobs, markers, media, nft, optimize, perf, publishing, rollups, storage,
+    uploads, viewer_cache, views
+)
+from . import cache as cache_module
+from .counters import ViewCounter, view_counter
+from .metrics import metric_buffer
+from .models import (
+    Asset, Blob, DetectionMetric, DetectionRollup, Experience, ExperienceAsset, Job, MarkerSet,
+    Target, UploadSession
+)
+
+
+# Presupuesto de consultas por endpoint (incluye sesión + usuario del login).
+# Si un cambio lo supera, el test falla: subir el número es una decisión
+# explícita, no un efecto colateral.
+QUERY_BUDGETS = {
+    'experience-list':    4,
+    'experience-detail':  4,
+    'experience-publish': 9,    # render del QR (1.ª vez) + detecciones por target del visor
+    'experience-manifest': 5,
+    'experience-ops':     13,   # lote completo (altas+cambios+bajas+patch), cualquier tamaño
+    'target-list':        3,
+    'viewer-cold':        7,    # +1: detecciones por target para la precarga
+    'viewer-warm':        3,
+}
+
+
+class DiscardBuffersMixin:
+    """Tira lo pendiente en core.buffers al acabar cada test: son filas que se revierten."""
+
+    def tearDown(self):
+        buffers.discard_all()
+        super().tearDown()
+
+
+class MediaTestCase(DiscardBuffersMixin, TestCase):
+    """TestCase con MEDIA_ROOT temporal y un superusuario con sesión iniciada."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media = tempfile.mkdtemp()
+        cls._override = override_settings(MEDIA_ROOT=cls._media)
+        cls._override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._override.disable()
+        shutil.rmtree(cls._media, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def image_upload(name='photo.png', size=(3000, 2000)):
+        buf = io.BytesIO()
+        Image.effect_noise(size, 40).convert('RGB').save(buf, 'PNG')
+        return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget('experience-list', 'get', url) ejecuta la petición y
+    falla si emite más consultas que QUERY_BUDGETS[name], listándolas.
+    """
+    def assertQueryBudget(self, name, method, url, **kwargs):
+        budget = QUERY_BUDGETS[name]
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        sql = '\n'.join(q['sql'] for q in ctx.captured_queries)
+        self.assertLessEqual(
+            len(ctx), budget,
+            f"{name}: {len(ctx)} consultas (presupuesto {budget}):\n{sql}"
+        )
+        return response, len(ctx)
+
+
+@override_settings(JOBS_EAGER=False)
+class QueryBudgetTests(QueryBudgetMixin, MediaTestCase):
+
+    def make_experience(self, n_targets, n_assets, name='exp'):
+        exp = Experience.objects.create(name=name)
+        for i in range(n_targets):
+            target = Target.objects.create(
+                name=f'{name}-t{i}',
+                image=SimpleUploadedFile(f'{name}-t{i}.png', b'png'),
+                pattfile=f'markers/{name}-{i}/marker',
+            )
+            exp.targets.add(target)
+            for j in range(n_assets):
+                asset = Asset.objects.create(
+                    name=f'{name}-a{i}-{j}', type='model',
+                    file=SimpleUploadedFile(f'{name}-a{i}-{j}.glb', b'glTF'),
+                )
+                ExperienceAsset.objects.create(
+                    experience=exp, asset=asset, target=target,
+                    transform={'pos': [0, 0, 0], 'rot': [0, 0, 0], 'scale': [1, 1, 1]},
+                )
+        return exp
+
+    def assertConstant(self, name, build_url, method='get', **kwargs):
+        """Mismo número de consultas con una escena pequeña y con una grande."""
+        counts = []
+        for i, size in enumerate((1, 4)):
+            exp = self.make_experience(size, size, name=f'{name}-{i}')
+            counts.append(self.assertQueryBudget(name, method, build_url(exp), **kwargs)[1])
+        self.assertEqual(counts[0], counts[1], f"{name} crece con el tamaño: {counts}")
+
+    def test_experience_list(self):
+        self.assertConstant('experience-list', lambda exp: '/api/experiences/')
+
+    def test_experience_detail(self):
+        self.assertConstant('experience-detail', lambda exp: f'/api/experiences/{exp.pk}/')
+
+    def test_experience_publish(self):
+        self.assertConstant('experience-publish', lambda exp: f'/api/experiences/{exp.pk}/publish/',
+                            method='post')
+
+    def test_target_list(self):
+        self.assertConstant('target-list', lambda exp: '/api/targets/')
+
+    def test_experience_manifest(self):
+        self.assertConstant('experience-manifest', lambda exp: f'/api/experiences/{exp.pk}/manifest/')
+        exp = self.make_experience(2, 3, name='manifest')
+        url = f'/api/experiences/{exp.pk}/manifest/'
+        response = self.client.get(url)
+        scene = response.json()
+        self.assertEqual([len(t['assets']) for t in scene['targets']], [3, 3])
+        self.assertTrue(scene['targets'][0]['marker'].endswith('/marker'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        ea = ExperienceAsset.objects.filter(experience=exp).first()
+        ea.transform = {'pos': [1, 0, 0], 'rot': [0, 0, 0], 'scale': [1, 1, 1]}
+        ea.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_scene_ops_batch(self):
+        exp = self.make_experience(2, 50, name='ops')
+        placed = list(ExperienceAsset.objects.filter(experience=exp).values_list('id', 'target_id'))
+        url = f'/api/experiences/{exp.pk}/ops/'
+        body = {
+            'version': 0,
+            'update': [{'id': pk, 'transform': {'pos': [i, 0, 0], 'rot': [0, 0, 0], 'scale': [1, 1, 1]}}
+                       for i, (pk, _) in enumerate(placed[:-1])],
+            'delete': [placed[-1][0]],
+            'create': [{'asset': ExperienceAsset.objects.get(pk=placed[0][0]).asset_id,
+                        'target': placed[0][1], 'loop': True}],
+            'config': [{'op': 'add', 'path': '/objects', 'value': [1, 2]},
+                       {'op': 'add', 'path': '/objects/-', 'value': 3}],
+        }
+        response, _ = self.assertQueryBudget('experience-ops', 'post', url, data=body,
+                                             content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['version'], 1)
+        exp.refresh_from_db()
+        self.assertEqual(exp.config_json, {'objects': [1, 2, 3]})
+        self.assertEqual(ExperienceAsset.objects.get(pk=placed[42][0]).transform['pos'], [42, 0, 0])
+        self.assertEqual(ExperienceAsset.objects.filter(experience=exp).count(), 100)
+        self.assertTrue(ExperienceAsset.objects.get(pk=response.json()['created'][0]).loop)
+
+        # versión vieja: 409 y nada cambia
+        stale = self.client.post(url, {'version': 0, 'delete': [placed[0][0]]},
+                                 content_type='application/json')
+        self.assertEqual((stale.status_code, stale.json()['version']), (409, 1))
+        # un test fallido del patch revierte el lote entero
+        failed = self.client.post(url, {'version': 1, 'delete': [placed[0][0]],
+                                        'config': [{'op': 'test', 'path': '/objects/0', 'value': 9}]},
+                                  content_type='application/json')
+        self.assertEqual(failed.status_code, 400)
+        self.assertTrue(ExperienceAsset.objects.filter(pk=placed[0][0]).exists())
+        other = self.make_experience(1, 1, name='ops-other')
+        foreign = self.client.post(url, {'version': 1, 'delete': [
+            ExperienceAsset.objects.get(experience=other).pk]}, content_type='application/json')
+        self.assertEqual(foreign.status_code, 400)
+        self.assertEqual(Experience.objects.get(pk=exp.pk).version, 1)
+
+    def test_publish_writes_offline_bundle(self):
+        exp = self.make_experience(1, 2, name='bundle')
+        marker = Path(self._media, 'markers', 'bundle-0')
+        marker.mkdir(parents=True)
+        for ext in ('.iset', '.fset', '.fset3'):
+            (marker / f'marker{ext}').write_bytes(b'nft')
+        data = self.client.post(f'/api/experiences/{exp.pk}/publish/').json()
+
+        bundle_resp = self.client.get(data['bundle_url'])
+        self.assertEqual(bundle_resp.status_code, 200)
+        self.assertIn('immutable', bundle_resp['Cache-Control'])
+        with zipfile.ZipFile(io.BytesIO(b''.join(bundle_resp.streaming_content))) as zf:
+            names = set(zf.namelist())
+            html = zf.read('index.html').decode()
+            precache = json.loads(zf.read('precache.json'))
+        self.assertIn('media/markers/bundle-0/marker.fset3', names)
+        self.assertEqual(sum(n.startswith('media/blobs/') for n in names), 1)   # mismo contenido
+        self.assertIn('url="media/markers/bundle-0/marker"', html)
+        self.assertEqual({p['url'].lstrip('/') for p in precache}, names - {'index.html', 'precache.json'})
+
+        sw = self.client.get(f'/viewer/{exp.pk}/sw.js')
+        self.assertEqual(sw['Content-Type'], 'application/javascript')
+        self.assertIn(data['bundle_version'], sw.content.decode())
+        # sin cambios no se reconstruye nada (ni el endpoint auxiliar)
+        again = self.client.post(f'/api/experiences/{exp.pk}/publish/').json()
+        self.assertEqual((again['bundle_version'], again['rebuilt']), (data['bundle_version'], False))
+        self.assertFalse(self.client.post(f'/publish/{exp.pk}/').json()['rebuilt'])
+        viewer_cache.path_for(exp.pk).unlink()   # una salida perdida sí fuerza reconstruir
+        self.assertTrue(self.client.post(f'/publish/{exp.pk}/').json()['rebuilt'])
+        ExperienceAsset.objects.filter(experience=exp).first().delete()
+        changed = self.client.post(f'/api/experiences/{exp.pk}/publish/').json()
+        self.assertNotEqual(changed['bundle_version'], data['bundle_version'])
+        self.assertEqual(self.client.get(data['bundle_url']).status_code, 404)
+
+    @override_settings(VIEWER_PREFETCH_TARGETS=1)
+    def test_viewer_prefetches_only_the_most_detected_target(self):
+        exp = self.make_experience(3, 0, name='lazy')
+        for target in exp.targets.all():
+            for j in range(2):
+                asset = Asset.objects.create(name=f'{target.name}-a{j}', type='model', file=SimpleUploadedFile(
+                    f'{target.name}-{j}.glb', f'glTF {target.pk} {j}'.encode()))
+                ExperienceAsset.objects.create(experience=exp, asset=asset, target=target)
+        hot = exp.targets.order_by('id').last()
+        DetectionRollup.objects.create(experience=exp, target=hot, bucket=DetectionRollup.DAY,
+                                       period_start=timezone.now(), count=5)
+        self.client.post(f'/api/experiences/{exp.pk}/publish/')
+
+        html = self.client.get(f'/viewer/{exp.pk}/').content.decode()
+        prefetched = set(re.findall(r'<link rel="prefetch" href="([^"]+)"', html))
+        self.assertEqual(prefetched, {ea.asset.file.url for ea in hot.ea_set.select_related('asset')})
+        self.assertEqual(html.count('<a-nft '), 3)
+
+        # el service worker instala marcadores y lo precargado; el resto lo guarda al pedirlo
+        index  = bundle.current(exp.pk)
+        blobs  = {p['url'] for p in index['precache'] if '/blobs/' in p['url']}
+        self.assertEqual(len(blobs), 6)
+        self.assertEqual(blobs & set(index['install']), prefetched)
+        self.assertIn('c.addAll(INSTALL)', self.client.get(f'/viewer/{exp.pk}/sw.js').content.decode())
+
+    def test_viewer_views_are_accumulated(self):
+        exp = self.make_experience(1, 1, name='views')
+        Experience.objects.filter(pk=exp.pk).update(is_published=True)
+        for _ in range(3):
+            self.client.get(f'/viewer/{exp.pk}/')
+        exp.refresh_from_db()
+        self.assertEqual((exp.views, exp.total_views), (0, 3))
+        self.assertEqual(self.client.get(f'/api/experiences/{exp.pk}/').json()['views'], 3)
+        view_counter.flush()
+        exp.refresh_from_db()
+        self.assertEqual((exp.views, exp.total_views), (3, 3))
+
+    def test_viewer(self):
+        for i, size in enumerate((1, 4)):
+            exp = self.make_experience(size, size, name=f'viewer-{i}')
+            Experience.objects.filter(pk=exp.pk).update(is_published=True)
+            url = f'/viewer/{exp.pk}/'
+            response, _ = self.assertQueryBudget('viewer-cold', 'get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(b'gltf-model=', response.content)   # se montan al detectar el target
+            response, _ = self.assertQueryBudget('viewer-warm', 'get', url,
+                                                 HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+
+@override_settings(JOBS_EAGER=False)
+class SaveConfigTests(MediaTestCase):
+    """save_config frente a /ops/: la versión sube siempre en la BD, nunca desde una lectura."""
+
+    def setUp(self):
+        super().setUp()
+        self.exp = Experience.objects.create(name='config', is_published=True)
+
+    def ops(self, version, value):
+        return self.client.post(f'/api/experiences/{self.exp.pk}/ops/', {
+            'version': version, 'config': [{'op': 'add', 'path': '/sky', 'value': value}],
+        }, content_type='application/json')
+
+    def test_ops_committed_during_save_config_is_not_lost(self):
+        get_object = views.ExperienceViewSet.get_object
+
+        def read_then_ops(viewset):
+            exp = get_object(viewset)   # lo que save_config leyó (versión 0)…
+            if viewset.action == 'save_config':
+                self.assertEqual(self.ops(0, 'blue').status_code, 200)   # …y otra pestaña guarda antes
+            return exp
+
+        with mock.patch.object(views.ExperienceViewSet, 'get_object', read_then_ops):
+            response = self.client.patch(f'/api/experiences/{self.exp.pk}/save_config/',
+                                         {'config_json': {'fog': True}}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.exp.refresh_from_db()
+        self.assertEqual((self.exp.version, self.exp.config_json), (2, {'fog': True}))
+        # quien tenía la versión 1 (la de /ops/) ya no puede escribir encima del save_config
+        self.assertEqual(self.ops(1, 'red').status_code, 409)
+        self.assertEqual(self.ops(2, 'red').status_code, 200)
+
+    def test_save_config_invalidates_and_conflicts_with_stale_ops(self):
+        self.assertEqual(self.client.get(f'/api/experiences/{self.exp.pk}/manifest/').json()
+                         ['experience']['version'], 0)
+        self.client.get(f'/viewer/{self.exp.pk}/')
+        self.assertTrue(viewer_cache.path_for(self.exp.pk).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/save_config/{self.exp.pk}/', {'config_json': {'fog': True}},
+                                         content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # UPDATE sin señales: visor y manifiesto cacheado se invalidan a mano
+        self.assertFalse(viewer_cache.path_for(self.exp.pk).exists())
+        scene = self.client.get(f'/api/experiences/{self.exp.pk}/manifest/').json()
+        self.assertEqual((scene['experience']['version'], scene['config']), (1, {'fog': True}))
+        self.assertEqual(self.ops(0, 'blue').status_code, 409)
+        self.assertEqual(self.client.patch('/save_config/999/', {}, content_type='application/json').status_code, 404)
+
+
+class ViewerCacheTests(MediaTestCase):
+    """core.viewer_cache: el visor se sirve del fichero hasta que una señal lo borra."""
+
+    def setUp(self):
+        super().setUp()
+        self.exp    = Experience.objects.create(name='cached', is_published=True)
+        self.target = Target.objects.create(name='t', image=SimpleUploadedFile('t.png', b'png'),
+                                            pattfile='markers/t/marker')
+        self.exp.targets.add(self.target)
+        self.url = f'/viewer/{self.exp.pk}/'
+
+    def get(self, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, **headers)
+        core = [q['sql'] for q in ctx.captured_queries if 'core_' in q['sql']]
+        return response, core
+
+    def test_second_request_is_served_from_file_without_orm_queries(self):
+        first, _ = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(viewer_cache.path_for(self.exp.pk).exists())
+        with mock.patch.object(viewer_cache, 'render_to_string') as render:
+            second, core = self.get()
+        render.assert_not_called()
+        self.assertEqual(core, [])   # sólo sesión y usuario
+        self.assertEqual((second.content, second['ETag']), (first.content, first['ETag']))
+
+        not_modified, core = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((not_modified.status_code, not_modified.content, core), (304, b'', []))
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"otro"')[0].status_code, 200)
+
+    def test_signals_delete_the_file(self):
+        path = viewer_cache.path_for(self.exp.pk)
+        changes = [
+            lambda: self.target.save(),
+            lambda: ExperienceAsset.objects.create(
+                experience=self.exp, target=self.target,
+                asset=Asset.objects.create(name='a', type='model', file=SimpleUploadedFile('a.glb', b'glTF'))),
+            lambda: self.exp.targets.remove(self.target),
+            lambda: Experience.objects.get(pk=self.exp.pk).save(),
+        ]
+        for change in changes:
+            self.get()
+            self.assertTrue(path.exists())
+            change()
+            self.assertFalse(path.exists())
+            with mock.patch.object(viewer_cache, 'render_to_string',
+                                   wraps=viewer_cache.render_to_string) as render:
+                self.get()   # la copia en memoria tampoco vale: se vuelve a pintar
+            render.assert_called_once()
+
+    def test_unpublished_experience_is_not_served_from_cache(self):
+        self.assertEqual(self.get()[0].status_code, 200)
+        self.exp.is_published = False
+        self.exp.save()
+        self.assertFalse(viewer_cache.path_for(self.exp.pk).exists())
+        self.assertEqual(self.get()[0].status_code, 404)
+        self.assertFalse(viewer_cache.path_for(self.exp.pk).exists())
+
+        draft = Experience.objects.create(name='draft')
+        self.assertEqual(self.client.get(f'/viewer/{draft.pk}/').status_code, 404)
+        self.assertFalse(viewer_cache.path_for(draft.pk).exists())
+
+
+    @override_settings(VIEWER_CACHE_MAX_AGE=123)
+    def test_responses_carry_cache_control(self):
+        first, _ = self.get()
+        self.assertIn('max-age=123', first['Cache-Control'])
+        not_modified, _ = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertIn('max-age=123', not_modified['Cache-Control'])
+
+    def test_file_rewritten_by_another_worker_replaces_the_memory_copy(self):
+        first, _ = self.get()
+        path = viewer_cache.path_for(self.exp.pk)
+        viewer_cache.write_atomic(path, 'otro worker')   # nuevo mtime: la copia en memoria caduca
+        second, core = self.get()
+        self.assertEqual((second.content, core), (b'otro worker', []))
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_asset_changes_invalidate_the_viewers_using_it(self):
+        asset = Asset.objects.create(name='a', type='model', file=SimpleUploadedFile('a.glb', b'glTF'))
+        ExperienceAsset.objects.create(experience=self.exp, target=self.target, asset=asset)
+        unrelated = Asset.objects.create(name='b', type='model', file=SimpleUploadedFile('b.glb', b'glTF'))
+        path = viewer_cache.path_for(self.exp.pk)
+
+        self.get()
+        unrelated.save()
+        self.assertTrue(path.exists())
+        asset.name = 'renamed'
+        asset.save()
+        self.assertFalse(path.exists())
+        self.assertIn(b'renamed', self.get()[0].content)
+
+class _ListWriter(buffers.BufferedWriter):
+    """Escribe en una lista; `fail(item)` decide qué excepción provoca cada elemento."""
+
+    def __init__(self, *args, fail=lambda item: None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows, self.fail = [], fail
+
+    def write(self, items):
+        for item in items:
+            if self.fail(item):
+                raise self.fail(item)
+        self.rows.extend(items)
+
+
+class BufferedWriterTests(MediaTestCase):
+
+    def test_failed_write_keeps_items_up_to_max_pending(self):
+        down = True
+        writer = _ListWriter(100, 0, max_pending=5,
+                             fail=lambda item: OperationalError('database is locked') if down else None)
+        writer.add(1, 2, 3)
+        with self.assertLogs('core.buffers', 'ERROR'), self.assertRaises(OperationalError):
+            writer.flush()
+        self.assertEqual((len(writer), writer.rows), (3, []))
+        writer.add(4, 5, 6)
+        with self.assertLogs('core.buffers', 'ERROR') as logs, self.assertRaises(OperationalError):
+            writer.flush()
+        self.assertIn('se descartan 1 elementos', logs.output[-1])
+        down = False
+        self.assertEqual(writer.flush(), 5)
+        self.assertEqual((len(writer), writer.rows), (0, [2, 3, 4, 5, 6]))
+
+    def test_add_does_not_raise_when_the_flush_fails(self):
+        writer = _ListWriter(2, 0, fail=lambda item: OperationalError('down'))
+        with self.assertLogs('core.buffers', 'ERROR'):
+            writer.add(1, 2)
+        self.assertEqual(len(writer), 2)
+
+    def test_integrity_error_drops_only_the_invalid_items(self):
+        writer = _ListWriter(100, 0, fail=lambda item: IntegrityError('fk') if item < 0 else None)
+        writer.add(1, -1, 2, -2, 3)
+        with self.assertLogs('core.buffers', 'WARNING') as logs:
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual((writer.rows, len(writer), len(logs.output)), ([1, 2, 3], 0, 2))
+
+    def test_view_counter_retry_does_not_count_twice(self):
+        first, second = (Experience.objects.create(name=name) for name in ('first', 'second'))
+        counter = ViewCounter(100, 0)
+        counter.add(first.pk, first.pk, second.pk)
+        filter_ = Experience.objects.filter
+
+        def failing(*args, **kwargs):
+            if kwargs.get('pk') == second.pk:
+                raise OperationalError('database is locked')
+            return filter_(*args, **kwargs)
+
+        with mock.patch.object(Experience.objects, 'filter', side_effect=failing), \
+                self.assertLogs('core.buffers', 'ERROR'), self.assertRaises(OperationalError):
+            counter.flush()
+        first.refresh_from_db()
+        self.assertEqual((first.views, len(counter)), (0, 3))   # la primera también se deshizo
+        self.assertEqual(counter.flush(), 3)
+        self.assertEqual(sorted(Experience.objects.values_list('name', 'views')), [('first', 2), ('second', 1)])
+
+
+@override_settings(JOBS_EAGER=False)
+class PublishConcurrencyTests(DiscardBuffersMixin, TransactionTestCase):
+    """core.publishing: flock por experiencia y reconstrucción si faltan salidas."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.exp = Experience.objects.create(name='pub')
+        target = Target.objects.create(name='pub-t', image=SimpleUploadedFile('pub-t.png', b'png'),
+                                       pattfile='markers/pub/marker')
+        self.exp.targets.add(target)
+        self.link = 'https://example.com/viewer/pub/'
+
+    def test_concurrent_publishes_are_coalesced_by_the_lock(self):
+        building, gate, results = threading.Event(), threading.Event(), {}
+        build = bundle.build
+
+        def slow_build(*args, **kwargs):
+            building.set()
+            gate.wait(5)
+            return build(*args, **kwargs)
+
+        def run(name):
+            try:
+                results[name] = publishing.publish(Experience.objects.get(pk=self.exp.pk), self.link)
+            finally:
+                connection.close()
+
+        first, second = (threading.Thread(target=run, args=(name,)) for name in ('first', 'second'))
+        with mock.patch.object(bundle, 'build', side_effect=slow_build) as spy:
+            first.start()
+            self.assertTrue(building.wait(5))
+            second.start()
+            second.join(0.3)
+            self.assertTrue(second.is_alive())   # esperando el flock de la experiencia
+            gate.set()
+            first.join(5)
+            second.join(5)
+
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual((results['first']['rebuilt'], results['second']['rebuilt']), (True, False))
+        self.assertEqual(results['second']['bundle_version'], results['first']['bundle_version'])
+
+    def test_same_fingerprint_with_missing_outputs_rebuilds(self):
+        first = publishing.publish(self.exp, self.link)
+        zip_path = bundle.bundle_dir(self.exp.pk) / Path(first['bundle_url']).name
+        self.assertFalse(publishing.publish(self.exp, self.link)['rebuilt'])
+
+        outputs = [zip_path, viewer_cache.path_for(self.exp.pk), publishing.state_path(self.exp.pk)]
+        for lost in outputs:
+            lost.unlink()
+            again = publishing.publish(self.exp, self.link)
+            self.assertTrue(again['rebuilt'], lost.name)
+            self.assertEqual(again['fingerprint'], first['fingerprint'])
+            self.assertTrue(all(path.exists() for path in outputs), lost.name)
+        self.assertFalse(publishing.publish(self.exp, self.link)['rebuilt'])
+
+
+class MetricIngestionTests(MediaTestCase):
+
+    def setUp(self):
+        self.exp = Experience.objects.create(name='metrics')
+
+    def test_batch_is_buffered_and_flushed_in_one_insert(self):
+        body = {'detections': [{'experience': self.exp.pk}] * 25}
+        response = self.client.post('/api/metrics/batch/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(DetectionMetric.objects.count(), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(metric_buffer.flush(), 25)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_detectionmetric"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(DetectionMetric.objects.filter(experience=self.exp).count(), 25)
+
+    def test_batch_rejects_unknown_experience(self):
+        body = {'detections': [{'experience': self.exp.pk}, {'experience': 999}]}
+        response = self.client.post('/api/metrics/batch/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(metric_buffer), 0)
+
+
+class RollupTests(MediaTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='pw')
+        self.client.force_login(self.user)
+        self.exp = Experience.objects.create(name='rollups')
+        self.target = Target.objects.create(name='rollups-t', image='targets/r.png')
+
+    def test_flush_updates_rollups_incrementally(self):
+        body = {'detections': [{'experience': self.exp.pk, 'target': self.target.pk}] * 3
+                              + [{'experience': self.exp.pk}]}
+        self.client.post('/api/metrics/batch/', body, content_type='application/json')
+        metric_buffer.flush()
+        totals = DetectionRollup.objects.filter(experience=self.exp, target__isnull=True)
+        self.assertEqual(sorted(totals.values_list('bucket', 'count')), [('day', 4), ('hour', 4)])
+        self.assertEqual(rollups.target_totals(self.exp.pk), {self.target.pk: 3})
+        self.assertFalse(DetectionMetric.objects.filter(rolled_up=False).exists())
+
+    def test_compact_folds_raw_rows_and_prunes(self):
+        old = timezone.now() - timedelta(days=40)
+        DetectionMetric.objects.bulk_create(
+            [DetectionMetric(experience=self.exp, detected_at=old) for _ in range(5)]
+        )
+        self.assertEqual(rollups.compact(retention_days=30), {'folded': 5, 'pruned': 5})
+        day = DetectionRollup.objects.get(experience=self.exp, bucket='day', target__isnull=True)
+        self.assertEqual(day.count, 5)
+        self.assertEqual(rollups.compact(retention_days=30), {'folded': 0, 'pruned': 0})
+
+    def test_weekly_reads_only_rollups(self):
+        metrics_rows = [{'experience': self.exp.pk}] * 10
+        self.client.post('/api/metrics/batch/', {'detections': metrics_rows},
+                         content_type='application/json')
+        metric_buffer.flush()
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/metrics/weekly/').json()
+        self.assertEqual(len(data['labels']), 7)
+        self.assertEqual(data['values'][-1], 10)
+        self.assertFalse(any('core_detectionmetric' in q['sql'] for q in ctx.captured_queries))
+
+
+@override_settings(JOBS_EAGER=True)
+class AssetOptimizationTests(MediaTestCase):
+
+    def test_image_upload_gets_smaller_derivative(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/assets/', {
+                'name': 'photo', 'type': 'image', 'file': self.image_upload(),
+            })
+        self.assertEqual(response.status_code, 201)
+        asset = Asset.objects.get(pk=response.json()['id'])
+        self.assertEqual(asset.processing_status, Job.DONE)
+        self.assertTrue(asset.optimized.name.endswith('.webp'))
+        self.assertLess(asset.optimized_size_mb, asset.size_mb)
+        self.assertEqual(asset.delivery_file, asset.optimized)
+        with Image.open(asset.optimized.path) as img:
+            self.assertLessEqual(max(img.size), 2048)
+
+    @override_settings(ASSET_TEXTURE_MAX_PX=64)
+    def test_glb_embedded_texture_is_shrunk_into_a_valid_glb(self):
+        positions = struct.pack('<9f', 0, 0, 0, 1, 0, 0, 0, 1, 0)
+        indices   = struct.pack('<3H', 0, 1, 2)   # 6 bytes: la textura queda desalineada si no se rellena
+        buf = io.BytesIO()
+        Image.frombytes('RGB', (256, 256), os.urandom(256 * 256 * 3)).save(buf, 'PNG')
+        png = buf.getvalue()
+        binary = positions + indices + b'\0\0' + png
+        gltf = {
+            'asset': {'version': '2.0'},
+            'buffers': [{'byteLength': len(binary)}],
+            'bufferViews': [
+                {'buffer': 0, 'byteOffset': 0, 'byteLength': 36},
+                {'buffer': 0, 'byteOffset': 36, 'byteLength': 6},
+                {'buffer': 0, 'byteOffset': 44, 'byteLength': len(png)},
+            ],
+            'accessors': [
+                {'bufferView': 0, 'componentType': 5126, 'count': 3, 'type': 'VEC3'},
+                {'bufferView': 1, 'componentType': 5123, 'count': 3, 'type': 'SCALAR'},
+            ],
+            'images': [{'bufferView': 2, 'mimeType': 'image/png'}],
+        }
+        original = optimize._write_glb(gltf, binary)
+
+        data = optimize.shrink_glb_textures(original)
+        self.assertLess(len(data), len(original))
+        magic, version, length = struct.unpack_from('<III', data, 0)
+        self.assertEqual((magic, version, length), (optimize.GLB_MAGIC, 2, len(data)))
+        js_len, js_type = struct.unpack_from('<II', data, 12)
+        bin_at = 20 + js_len
+        bin_len, bin_type = struct.unpack_from('<II', data, bin_at)
+        self.assertEqual((js_type, bin_type, js_len % 4, bin_len % 4), (optimize.CHUNK_JSON, optimize.CHUNK_BIN, 0, 0))
+        self.assertEqual(bin_at + 8 + bin_len, len(data))
+        out  = json.loads(data[20:bin_at])
+        blob = data[bin_at + 8:]
+        self.assertLessEqual(out['buffers'][0]['byteLength'], bin_len)
+        self.assertLess(bin_len - out['buffers'][0]['byteLength'], 4)
+        views = out['bufferViews']
+        for view in views:
+            self.assertEqual(view['byteOffset'] % 4, 0)
+            self.assertLessEqual(view['byteOffset'] + view['byteLength'], out['buffers'][0]['byteLength'])
+        chunk = lambda v: blob[v['byteOffset']:v['byteOffset'] + v['byteLength']]
+        self.assertEqual((chunk(views[0]), chunk(views[1])), (positions, indices))
+        self.assertEqual(out['images'][0]['mimeType'], 'image/jpeg')
+        with Image.open(io.BytesIO(chunk(views[2]))) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (64, 64)))
+        self.assertEqual(optimize._read_glb(data), (out, blob))
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=1024, UPLOAD_CHUNK_MAX=1024)
+class ResumableUploadTests(MediaTestCase):
+
+    def start(self, data, **fields):
+        response = self.client.post('/api/uploads/', {
+            'kind': 'asset', 'filename': 'clip.bin', 'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(), **fields,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def put(self, session_id, data, offset):
+        return self.client.put(f'/api/uploads/{session_id}/chunk/', data,
+                               content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_resumes_after_interrupted_chunk(self):
+        data = os.urandom(2500)
+        session = self.start(data, name='clip', type='audio')
+        self.assertEqual((session['offset'], session['chunk_size']), (0, 1024))
+
+        self.assertEqual(self.put(session['id'], data[:1024], 0).json()['offset'], 1024)
+        # reenviar un trozo ya escrito no avanza ni corrompe: 409 con el offset real
+        stale = self.put(session['id'], data[:1024], 0)
+        self.assertEqual((stale.status_code, stale.json()['offset']), (409, 1024))
+        bad = self.client.put(f'/api/uploads/{session["id"]}/chunk/', data[1024:2048],
+                              content_type='application/octet-stream',
+                              HTTP_UPLOAD_OFFSET='1024', HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/uploads/{session["id"]}/').json()['offset'], 1024)
+
+        self.put(session['id'], data[1024:2048], 1024)
+        self.assertEqual(self.client.post(f'/api/uploads/{session["id"]}/complete/').status_code, 409)
+        self.put(session['id'], data[2048:], 2048)
+        response = self.client.post(f'/api/uploads/{session["id"]}/complete/')
+        self.assertEqual(response.status_code, 201)
+
+        asset = Asset.objects.get(pk=response.json()['id'])
+        with asset.file.open('rb') as fh:
+            self.assertEqual(fh.read(), data)
+        self.assertIsNotNone(asset.process_job_id)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(any(os.scandir(os.path.join(self._media, 'uploads', 'tmp'))))
+
+    def test_sessions_are_private_and_chunks_bounded(self):
+        session = self.start(b'x' * 2000, name='clip', type='audio')
+        self.assertEqual(self.put(session['id'], b'x' * 1025, 0).status_code, 400)
+        other = User.objects.create_user('other', password='pw')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/api/uploads/{session["id"]}/').status_code, 404)
+
+
+class _GatedStream(io.BytesIO):
+    """Stream de petición que se queda a medias hasta que se abre `gate`."""
+
+    def __init__(self, data, gate):
+        super().__init__(data)
+        self.gate, self.reading = gate, threading.Event()
+
+    def read(self, size=-1):
+        self.reading.set()
+        self.gate.wait(5)
+        return super().read(size)
+
+
+@override_settings(UPLOAD_CHUNK_MAX=1024)
+class ParallelUploadChunkTests(DiscardBuffersMixin, TransactionTestCase):
+    """Dos PUT del mismo trozo a la vez: uno escribe, el otro espera al lock y recibe 409."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        owner = User.objects.create_user('uploader')
+        self.session = UploadSession.objects.create(owner=owner, kind='asset', filename='clip.bin', size=2048)
+
+    def test_same_chunk_in_parallel_is_written_once(self):
+        data, gate, results = os.urandom(1024), threading.Event(), {}
+
+        def put(name, stream):
+            session = UploadSession.objects.get(pk=self.session.pk)   # cada petición lee su copia
+            try:
+                results[name] = uploads.append(session, stream, 0, len(data))
+            except uploads.UploadError as e:
+                results[name] = (e.status, session.offset)
+            finally:
+                connection.close()
+
+        gated  = _GatedStream(data, gate)
+        first  = threading.Thread(target=put, args=('first', gated))
+        second = threading.Thread(target=put, args=('second', io.BytesIO(data)))
+        first.start()
+        self.assertTrue(gated.reading.wait(5))   # el primero ya tiene el lock y está escribiendo
+        second.start()
+        second.join(0.3)
+        self.assertTrue(second.is_alive())   # bloqueado en el flock del .part
+        gate.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(results, {'first': 1024, 'second': (409, 1024)})
+        self.assertEqual(self.session.part_path.read_bytes(), data)
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).offset, 1024)
+
+        # reenviado después (el cliente reintenta tras un timeout): tampoco avanza ni escribe
+        with self.assertRaises(uploads.UploadError) as ctx:
+            uploads.append(self.session, io.BytesIO(b'x' * 1024), 0, 1024)
+        self.assertEqual((ctx.exception.status, self.session.offset), (409, 1024))
+        self.assertEqual(self.session.part_path.read_bytes(), data)
+
+
+class BlobStorageTests(MediaTestCase):
+
+    def upload(self, data, name='scene.glb'):
+        response = self.client.post('/api/assets/', {
+            'name': name, 'type': 'model', 'file': SimpleUploadedFile(name, data),
+        })
+        self.assertEqual(response.status_code, 201)
+        return Asset.objects.get(pk=response.json()['id'])
+
+    def test_identical_uploads_share_one_blob(self):
+        data = os.urandom(4096)
+        a, b = self.upload(data), self.upload(data, name='copy.glb')
+        self.assertEqual(a.file.name, b.file.name)
+        self.assertEqual(a.file.name, storage.blob_name(hashlib.sha256(data).hexdigest(), '.glb'))
+        blob = Blob.objects.get(name=a.file.name)
+        self.assertEqual((blob.refcount, blob.size_bytes), (2, 4096))
+
+        a.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertEqual(storage.collect(timedelta(0)), (0, 0))
+        self.assertTrue(os.path.exists(b.file.path))
+
+        b.delete()
+        self.assertEqual(storage.collect(timedelta(0)), (1, 4096))
+        self.assertFalse(os.path.exists(b.file.path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_blob_is_served_immutable(self):
+        asset = self.upload(os.urandom(1024))
+        response = self.client.get(asset.file.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), asset.file.open('rb').read())
+        asset.file.close()
+        again = self.client.get(asset.file.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get('/media/blobs/../../settings.py').status_code, 404)
+
+
+class MediaServingTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(256)) * 64
+        self.path = Path(self._media, 'markers', 'x', 'marker.fset3')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(self.data)
+        self.url = '/media/markers/x/marker.fset3'
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+
+        tail = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(tail.streaming_content), self.data[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=99999-').status_code, 416)
+
+        # If-Range con otra versión: fichero completo
+        full = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=full['ETag']).status_code, 304)
+
+    def test_precompressed_variant(self):
+        self.assertEqual([p.suffix for p in media.precompress(self.path)][-1], '.gz')
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.data)
+        plain = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_private_and_outside_paths(self):
+        part = Path(self._media, 'uploads', 'tmp', '1.part')
+        part.parent.mkdir(parents=True, exist_ok=True)
+        part.write_bytes(b'x')
+        self.assertEqual(self.client.get('/media/uploads/tmp/1.part').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+@override_settings(JOBS_EAGER=False)
+class MarkerAnalysisTests(MediaTestCase):
+
+    def write_marker_set(self, prefix):
+        jpeg = io.BytesIO()
+        Image.new('L', (400, 300)).save(jpeg, 'JPEG', dpi=(150, 150))
+        Path(f'{prefix}.iset').write_bytes(struct.pack('<i', 3) + jpeg.getvalue() + struct.pack('<2f', 100, 50))
+        fset = struct.pack('<i', 2)
+        for points in (3, 1):
+            fset += struct.pack('<iffi', 0, 200, 100, points) + bytes(20 * points)
+        Path(f'{prefix}.fset').write_bytes(fset)
+        Path(f'{prefix}.fset3').write_bytes(
+            struct.pack('<i', 2) + bytes(2 * 132) + struct.pack('<5i', 1, 1, 1, 400, 300) + struct.pack('<i', 0))
+
+    def test_analyse_marker_files(self):
+        prefix = Path(self._media, 'marker')
+        self.write_marker_set(prefix)
+        stats = nft.analyse(prefix)
+        self.assertEqual(stats['iset'], {'width': 400, 'height': 300, 'dpi_levels': [150.0, 100.0, 50.0]})
+        self.assertEqual(stats['fset']['points'], 4)
+        self.assertEqual([l['points'] for l in stats['fset']['levels']], [3, 1])
+        self.assertEqual(stats['fset3']['points'], 2)
+        self.assertEqual(stats['fset3']['images'], [[400, 300]])
+        self.assertEqual(stats['bytes']['total'], sum(p.stat().st_size for p in Path(self._media).glob('marker.*')))
+
+        Path(f'{prefix}.fset').write_bytes(b'\x05\x00')
+        self.assertIn('error', nft.analyse(prefix)['fset'])
+
+    def test_profiles_prescale_and_change_digest(self):
+        image = Path(self._media, 'photo.png')
+        Image.new('RGB', (3000, 2000)).save(image, dpi=(96, 96))
+        digests = {p: markers.marker_digest(str(image), p) for p in markers.PROFILES}
+        self.assertEqual(len(set(digests.values())), len(markers.PROFILES))
+
+        out = markers.prescale(str(image), Path(self._media), markers.PROFILES['fast-load']['max_px'])
+        with Image.open(out) as img:
+            self.assertEqual(img.size, (640, 427))
+            self.assertEqual(round(img.info['dpi'][0]), 96)
+
+        target = Target.objects.create(name='t', image='targets/t.png')
+        response = self.client.patch(f'/api/targets/{target.pk}/',
+                                     encode_multipart(BOUNDARY, {'marker_profile': 'fast-load'}),
+                                     content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['marker_profile'], 'fast-load')
+        self.assertIn('marker_stats', response.json())
+        self.assertIsNotNone(Target.objects.get(pk=target.pk).marker_job_id)   # se regenera
+
+
+@override_settings(JOBS_EAGER=False)
+class MarkerCacheTests(MediaTestCase):
+    """Caché de juegos NFT por hash: aciertos/fallos, referencias y desalojo LRU."""
+    SET_BYTES = 3 * 1000
+
+    @staticmethod
+    def fake_creator(image_path, out_dir, options=None):
+        prefix = Path(out_dir) / Path(image_path).stem
+        for ext in markers.MARKER_EXTS:
+            prefix.with_suffix(ext).write_bytes(b'x' * 1000)
+        return prefix
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(markers, 'generate_nft', side_effect=self.fake_creator)
+        self.creator = patcher.start()
+        self.addCleanup(patcher.stop)
+        analyse = mock.patch.object(nft, 'analyse', return_value={})
+        analyse.start()
+        self.addCleanup(analyse.stop)
+
+    def make_target(self, name, color='red'):
+        image = Path(self._media, 'targets', f'{name}.png')
+        image.parent.mkdir(exist_ok=True)
+        Image.new('RGB', (64, 64), color).save(image)
+        return Target.objects.create(name=name, image=f'targets/{name}.png')
+
+    def build(self, target):
+        markers.build_target_marker(jobs.enqueue('marker', target_id=target.pk))
+        target.refresh_from_db()
+        return target.marker_set
+
+    def test_identical_images_share_one_set(self):
+        first = self.build(self.make_target('a'))
+        second = self.build(self.make_target('b'))   # misma imagen: acierto, node no se ejecuta
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(self.creator.call_count, 1)
+        stats = markers.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['sets'], stats['bytes']),
+                         (1, 1, 1, self.SET_BYTES))
+        self.assertEqual(MarkerSet.objects.get(pk=first.pk).refcount, 2)
+        self.assertTrue(Target.objects.get(name='b').pattfile.name.startswith(f'markers/{first.digest}/'))
+
+        Target.objects.get(name='a').delete()
+        self.assertEqual(MarkerSet.objects.get(pk=first.pk).refcount, 1)
+        target = Target.objects.get(name='b')
+        target.marker_profile = 'fast-load'   # otro hash: suelta el juego anterior
+        target.save()
+        self.assertNotEqual(self.build(target).pk, first.pk)
+        self.assertEqual(MarkerSet.objects.get(pk=first.pk).refcount, 0)
+
+    def test_unreferenced_sets_are_evicted_least_recently_used_first(self):
+        sets = [self.build(self.make_target(f't{i}', color)) for i, color in enumerate(('red', 'green', 'blue'))]
+        Target.objects.filter(name__in=['t0', 't1']).delete()   # t2 sigue en uso
+        for age, ms in zip((1, 3), sets[:2]):
+            MarkerSet.objects.filter(pk=ms.pk).update(last_used_at=timezone.now() - timedelta(days=age))
+
+        self.assertEqual(markers.evict(budget=2 * self.SET_BYTES), self.SET_BYTES)
+        self.assertEqual(set(MarkerSet.objects.values_list('pk', flat=True)), {sets[0].pk, sets[2].pk})
+        self.assertFalse(Path(self._media, markers.CACHE_DIR, sets[1].digest).exists())
+        self.assertTrue(Path(self._media, markers.CACHE_DIR, sets[0].digest).exists())
+
+        with override_settings(MARKER_CACHE_MAX_BYTES=0):
+            self.assertEqual(markers.evict(), self.SET_BYTES)   # el referenciado nunca se borra
+        self.assertEqual(list(MarkerSet.objects.values_list('pk', flat=True)), [sets[2].pk])
+        self.assertEqual(markers.cache_stats()['evictions'], 2)
+
+    def test_set_reused_during_eviction_keeps_its_files(self):
+        ms = self.build(self.make_target('a'))
+        Target.objects.get(name='a').delete()
+        filter_ = MarkerSet.objects.filter
+
+        def listing(*args, **kwargs):
+            if kwargs != {'refcount': 0}:
+                return filter_(*args, **kwargs)
+            rows = list(filter_(refcount=0).order_by('last_used_at'))
+            filter_(pk=ms.pk).update(refcount=1)   # un attach() llega tras la lectura de evict()
+            return mock.Mock(order_by=lambda *fields: rows)
+
+        with mock.patch.object(MarkerSet.objects, 'filter', side_effect=listing):
+            self.assertEqual(markers.evict(budget=0), 0)
+        self.assertTrue(MarkerSet.objects.filter(pk=ms.pk).exists())
+        self.assertTrue(Path(self._media, ms.prefix).with_suffix('.fset3').exists())
+
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.build(self.make_target('a'))
+        self.build(self.make_target('b'))
+        stats = self.client.get('/api/markers/cache/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+        self.assertEqual((stats['sets'], stats['bytes']), (1, self.SET_BYTES))
+
+        self.client.force_login(User.objects.create_user('staffless', password='pw'))
+        self.assertEqual(self.client.get('/api/markers/cache/').status_code, 403)
+
+@override_settings(JOBS_EAGER=False)
+class ImportTargetsTests(MediaTestCase):
+
+    def test_import_zip_into_experience(self):
+        exp = Experience.objects.create(name='catalogo')
+        Target.objects.create(name='dup', image='targets/dup.png')
+        archive = Path(self._media, 'catalogo.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for name in ('a.png', 'sub/b.jpg', 'dup.png'):
+                buf = io.BytesIO()
+                Image.new('RGB', (64, 64)).save(buf, 'PNG' if name.endswith('png') else 'JPEG')
+                zf.writestr(name, buf.getvalue())
+            zf.writestr('roto.png', b'no es una imagen')
+            zf.writestr('__MACOSX/._a.png', b'')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_targets', str(archive), experience=exp.pk, profile='fast-load',
+                     retries=1, no_markers=True, stdout=out, stderr=err)
+        self.assertIn('2 target(s) creados', out.getvalue())
+        self.assertIn('roto.png', err.getvalue())
+        self.assertIn('dup.png', err.getvalue())
+
+        imported = Target.objects.filter(name__in=['a', 'b']).select_related('marker_job')
+        self.assertEqual(sorted(t.marker_profile for t in imported), ['fast-load', 'fast-load'])
+        self.assertTrue(all(t.marker_job.max_attempts == 2 and t.image.storage.exists(t.image.name)
+                            for t in imported))
+        self.assertEqual(set(exp.targets.values_list('name', flat=True)), {'a', 'b'})
+        exp.refresh_from_db()
+        self.assertEqual(exp.version, 1)
+
+
+@override_settings(JOBS_EAGER=False)
+class OrmCacheTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        django_cache.clear()
+        self.exp = Experience.objects.create(name='cache')
+        self.target = Target.objects.create(name='cache-t', image='targets/t.png', pattfile='markers/x/marker')
+        self.exp.targets.add(self.target)
+        self.url = f'/api/experiences/{self.exp.pk}/manifest/'
+
+    def test_manifest_is_cached_until_the_scene_changes(self):
+        first = self.client.get(self.url).json()
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(self.url).json()
+        self.assertEqual(again, first)
+        self.assertLessEqual(len(ctx), 2, '\n'.join(q['sql'] for q in ctx.captured_queries))   # sesión + usuario
+
+        # UPDATE condicional + bulk_* de core.scene: sin señales, se invalida a mano
+        response = self.client.post(f'/api/experiences/{self.exp.pk}/ops/', {
+            'version': 0, 'config': [{'op': 'add', 'path': '/sky', 'value': 'blue'}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        scene = self.client.get(self.url).json()
+        self.assertEqual((scene['experience']['version'], scene['config']), (1, {'sky': 'blue'}))
+
+        # el estado del marcador viene de Job, que se actualiza por queryset
+        self.target.marker_job = jobs.enqueue('marker', target_id=self.target.pk)
+        self.target.save()
+        self.assertEqual(self.client.get(self.url).json()['targets'][0]['marker_status'], Job.PENDING)
+        jobs.claim_one(self.target.marker_job_id)
+        self.assertEqual(self.client.get(self.url).json()['targets'][0]['marker_status'], Job.RUNNING)
+        self.assertEqual(self.client.get(f'/api/targets/{self.target.pk}/').json()['marker_status'],
+                         Job.RUNNING)
+
+        stats = self.client.get('/api/cache/').json()
+        self.assertEqual(stats['manifest']['hits'], 1)
+        self.assertGreater(stats['manifest']['misses'], 1)
+
+    def test_membership_changes_invalidate(self):
+        self.assertEqual(self.client.get(f'/api/experiences/{self.exp.pk}/').json()['targets'], [self.target.pk])
+        self.target.experience_set.clear()   # lado inverso del M2M
+        self.assertEqual(self.client.get(f'/api/experiences/{self.exp.pk}/').json()['targets'], [])
+        self.assertEqual(self.client.get(self.url).json()['targets'], [])
+        self.exp.delete()
+        self.assertEqual(self.client.get(f'/api/experiences/{self.exp.pk}/').status_code, 404)
+
+    def test_manifest_only_depends_on_its_own_scene(self):
+        self.client.get(self.url)
+        other = Target.objects.create(name='other-t', image='targets/o.png')
+        other.name = 'other-t2'
+        other.save()
+        jobs.claim_one(jobs.enqueue('marker', target_id=other.pk).pk)   # trabajo de un target ajeno
+        Asset.objects.create(name='loose', type='model', file=SimpleUploadedFile('loose.glb', b'glTF')).save()
+        self.client.get(self.url)
+        self.assertEqual(self.client.get('/api/cache/').json()['manifest']['hits'], 1)
+
+        self.target.name = 'renamed'
+        self.target.save()
+        self.assertEqual(self.client.get(self.url).json()['targets'][0]['name'], 'renamed')
+
+    def test_published_outputs_do_not_come_from_the_cache(self):
+        self.client.get(self.url)   # manifiesto en core.cache
+        Experience.objects.filter(pk=self.exp.pk).update(name='renamed')   # sin señal ni touch
+        with mock.patch.object(cache_module, 'remember', side_effect=AssertionError('core.cache')):
+            data = self.client.post(f'/api/experiences/{self.exp.pk}/publish/').json()
+            self.assertContains(self.client.get(f'/viewer/{self.exp.pk}/'), 'renamed')
+        with zipfile.ZipFile(Path(self._media, 'bundles', str(self.exp.pk), Path(data['bundle_url']).name)) as zf:
+            self.assertIn('renamed', zf.read('index.html').decode())
+
+
+class PerfInstrumentationTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.perf_dir = Path(tempfile.mkdtemp(dir=self._media), 'perf')   # uno por test
+        self.override = override_settings(PERF_DIR=str(self.perf_dir), PERF_PROFILE_DIR=str(self.perf_dir / 'prof'))
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        perf.registry._reset()
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_request_and_block_metrics_are_exposed(self):
+        exp = Experience.objects.create(name='perf')
+        response = self.client.get(f'/api/experiences/{exp.pk}/manifest/')
+        self.assertIn('db;desc=', response['Server-Timing'])
+        with perf.timer('subprocess', 'nft-marker-creator'):
+            pass
+        self.client.get('/login/')   # plantilla
+
+        # otro proceso que ya volcó su registro
+        self.perf_dir.mkdir(parents=True, exist_ok=True)
+        (self.perf_dir / '999999.json').write_text(json.dumps({'counters': [
+            ['yukiar_http_requests_total', [['method', 'GET'], ['route', 'viewer'], ['status', '200']], 5],
+        ], 'histograms': []}))
+
+        text = self.client.get('/metrics').content.decode()
+        route = 'route="api:experience-manifest"'
+        self.assertIn(f'yukiar_http_request_duration_seconds_count{{method="GET",{route}}} 1', text)
+        self.assertRegex(text, r'yukiar_db_queries_total\{%s\} [1-9]' % route)
+        self.assertIn('yukiar_subprocess_duration_seconds_bucket{name="nft-marker-creator",le="+Inf"} 1', text)
+        self.assertIn('yukiar_template_duration_seconds_count{name="login.html"} 1', text)
+        self.assertIn('yukiar_http_requests_total{method="GET",route="viewer",status="200"} 5', text)
+
+    def write_snapshot(self, name, value):
+        self.perf_dir.mkdir(parents=True, exist_ok=True)
+        (self.perf_dir / name).write_text(json.dumps({'counters': [
+            ['yukiar_http_requests_total', [['method', 'GET'], ['route', 'viewer'], ['status', '200']], value],
+        ], 'histograms': []}))
+
+    def scraped(self):
+        text = self.client.get('/metrics').content.decode()
+        return int(re.search(r'yukiar_http_requests_total\{method="GET",route="viewer",status="200"\} (\d+)',
+                             text).group(1))
+
+    def test_dead_process_files_are_folded_into_the_total(self):
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        self.write_snapshot(f'{dead.pid}-1.json', 5)
+        self.write_snapshot(f'{os.getppid()}-1.json', 7)   # vivo
+        self.write_snapshot(f'{os.getppid()}-2.json', 11)  # pid reciclado: otro fichero, no lo pisa
+        for _ in range(2):   # recoger dos veces no cuenta dos veces
+            self.assertEqual(self.scraped(), 23)
+        self.assertEqual(sorted(p.name for p in self.perf_dir.glob('*.json')),
+                         sorted([perf.TOTAL, f'{os.getppid()}-1.json', f'{os.getppid()}-2.json']))
+
+    def test_retired_process_leaves_only_its_totals(self):
+        labels = (('method', 'GET'), ('route', 'viewer'), ('status', '200'))
+        perf.registry.inc('yukiar_http_requests_total', labels, 3)
+        perf.registry.dump(force=True)
+        own = self.perf_dir / perf.registry.filename
+        self.assertTrue(own.exists())
+        perf.registry.retire()
+        self.assertFalse(own.exists())
+        self.assertEqual([p.name for p in self.perf_dir.glob('*.json')], [perf.TOTAL])
+        perf.registry.inc('yukiar_http_requests_total', labels, 2)   # el proceso sigue vivo
+        self.assertEqual(self.scraped(), 5)
+
+    @override_settings(PERF_METRICS_TOKEN='s3cret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(PERF_PROFILE_RATE=1.0, PERF_PROFILE_SLOW_MS=0)
+    def test_slow_requests_are_profiled(self):
+        self.client.get('/api/experiences/')
+        dumps = list((self.perf_dir / 'prof').glob('*api_experience-list*.prof'))
+        self.assertEqual(len(dumps), 1)
+
+
+@override_settings(JOBS_EAGER=False)
+class PaginationTests(MediaTestCase):
+
+    def test_cursor_pages_count_and_sparse_fields(self):
+        for i in range(7):
+            Asset.objects.create(name=f'a{i}', type='model',
+                                 file=SimpleUploadedFile(f'a{i}.glb', f'glTF{i}'.encode()))
+        seen, url = [], '/api/assets/?page_size=3&fields=id,name'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 3)
+            self.assertTrue(all(set(a) == {'id', 'name'} for a in page['results']))
+            seen += [a['name'] for a in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [f'a{i}' for i in reversed(range(7))])
+        self.assertEqual(self.client.get('/api/assets/count/').json(), {'count': 7})
+        self.assertEqual(self.client.get('/api/targets/count/').json(), {'count': 0})
+
+        # en escritura ?fields= no recorta la validación ni la respuesta
+        response = self.client.post('/api/experiences/?fields=id', {'name': 'x'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('slug', response.json())
+
+
+class BenchSuiteTests(DiscardBuffersMixin, TransactionTestCase):
+    """La suite corre entera en pequeño (los clientes van en hilos: TransactionTestCase)."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()   # siembra visores, paquetes y subidas: nunca en media/
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_suite_writes_comparable_results_and_cleans_up(self):
+        out = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, out, True)
+        args = ['--targets', '2', '--assets', '2', '--clients', '2', '--requests', '4', '--rounds', '10',
+                '--upload-mb', '1', '--only', 'viewer_warm', 'api_manifest', 'api_scene_ops',
+                'publish_unchanged', 'metrics_batch', 'upload', 'manifest_etag', '--json']
+        call_command('bench_suite', *args, '--output', str(out / 'a.json'), stdout=io.StringIO())
+        first = json.loads((out / 'a.json').read_text())
+
+        self.assertEqual(first['environment']['database'], connection.vendor)
+        self.assertEqual(set(first['scenarios']), {'viewer_warm', 'api_manifest', 'api_scene_ops',
+                                                   'publish_unchanged', 'metrics_batch', 'upload'})
+        for name in ('viewer_warm', 'api_manifest', 'api_scene_ops', 'metrics_batch'):
+            self.assertEqual(first['scenarios'][name]['errors'], 0, name)
+        self.assertEqual(first['scenarios']['viewer_warm']['requests'], 8)
+        self.assertEqual(first['scenarios']['metrics_batch']['stored'], 8 * 50)
+        self.assertEqual(first['scenarios']['upload']['status'], 201)
+        self.assertEqual(set(first['micro']['manifest_etag']),
+                         {'rounds', 'min_ms', 'max_ms', 'mean_ms', 'stddev_ms', 'median_ms', 'ops'})
+
+        # lo sembrado se borra: sin restos en la BD
+        for model in (Experience, Target, Asset, ExperienceAsset, DetectionMetric, UploadSession, Job):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertFalse(User.objects.exists())
+
+        stdout = io.StringIO()
+        call_command('bench_suite', *args, '--compare', str(out / 'a.json'), stdout=stdout)
+        second = json.loads(stdout.getvalue())
+        compared = {(r['name'], r['metric']) for r in second['comparison']}
+        self.assertIn(('viewer_warm', 'requests_per_second'), compared)
+        self.assertIn(('manifest_etag', 'ops'), compared)
+
+
+class AsyncPublicUrls:
+    """Rutas públicas con ASYNC_PUBLIC_VIEWS (yukiAR/urls.py y core/urls.py las eligen al importar)."""
+    urlpatterns = [
+        path('viewer/<int:id>/', views.viewer_view_async),
+        path('api/metrics/', views.metric_create_async),
+        path('api/metrics/batch/', views.metric_batch_async),
+        path('save_config/<int:id>/', views.save_config_async),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncPublicUrls)
+class AsyncPublicViewsTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.exp = Experience.objects.create(name='async', is_published=True)
+
+    async def test_viewer_requires_login_and_revalidates(self):
+        response = await self.async_client.get(f'/viewer/{self.exp.pk}/')
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/viewer/{self.exp.pk}/')
+        self.assertEqual(response.status_code, 200)
+        again = await self.async_client.get(f'/viewer/{self.exp.pk}/', headers={'if-none-match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(view_counter.pending(self.exp.pk), 2)
+        self.assertEqual((await self.async_client.get('/viewer/999/')).status_code, 404)
+
+    async def test_metrics_are_buffered_like_the_sync_endpoints(self):
+        body = {'detections': [{'experience': self.exp.pk}] * 5}
+        response = await self.async_client.post('/api/metrics/batch/', body, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['count']), (202, 5))
+        response = await self.async_client.post('/api/metrics/', {'experience': self.exp.pk},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(metric_buffer), 6)
+
+        bad = await self.async_client.post('/api/metrics/batch/', {'detections': [{'experience': 999}]},
+                                           content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+        self.assertIn('detections', bad.json())
+        bad = await self.async_client.post('/api/metrics/', {'experience': self.exp.pk, 'target': 999},
+                                           content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(len(metric_buffer), 6)
+
+        self.assertEqual(await sync_to_async(metric_buffer.flush)(), 6)
+        self.assertEqual(await DetectionMetric.objects.filter(experience=self.exp).acount(), 6)
+        # el listado (admin) sigue en el viewset síncrono
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.get('/api/metrics/')).status_code, 200)
+
+    async def test_save_config(self):
+        response = await self.async_client.patch(f'/save_config/{self.exp.pk}/', {'config_json': {'fog': True}},
+                                                 content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        exp = await Experience.objects.aget(pk=self.exp.pk)
+        self.assertEqual((exp.config_json, exp.version), ({'fog': True}, self.exp.version + 1))
+        bad = await self.async_client.patch(f'/save_config/{self.exp.pk}/', 'no json',
+                                            content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+        missing = await self.async_client.patch('/save_config/999/', {}, content_type='application/json')
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_save_config_invalidates_the_published_viewer(self):
+        await self.async_client.aforce_login(self.user)
+        before = await self.async_client.get(f'/viewer/{self.exp.pk}/')
+        self.assertTrue(viewer_cache.path_for(self.exp.pk).exists())
+        response = await self.async_client.patch(f'/save_config/{self.exp.pk}/', {'config_json': {'fog': True}},
+                                                 content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(viewer_cache.path_for(self.exp.pk).exists())   # post_save también con asave()
+        after = await self.async_client.get(f'/viewer/{self.exp.pk}/', headers={'if-none-match': before['ETag']})
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+
+    async def test_viewer_file_is_read_off_the_event_loop(self):
+        loop_thread, threads = threading.get_ident(), []
+        load = viewer_cache.load
+
+        def spy(exp_id):
+            threads.append(threading.get_ident())
+            return load(exp_id)
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(viewer_cache, 'load', side_effect=spy):
+            for _ in range(2):   # fallo (escribe el fichero) y acierto
+                self.assertEqual((await self.async_client.get(f'/viewer/{self.exp.pk}/')).status_code, 200)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+
+
+class IndexUsageTests(MediaTestCase):
+    """EXPLAIN de las consultas reales de la API y del mantenimiento: cada una debe ir por su índice."""
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')   # tablas de test diminutas
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, index, url=None, queryset=None, table=None):
+        if queryset is not None:
+            with connection.cursor() as cursor:   # parámetros ya interpolados por el backend
+                sql = connection.ops.last_executed_query(cursor, *queryset.query.sql_with_params())
+        else:
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            sql = next(q['sql'] for q in ctx.captured_queries if f'FROM "{table}"' in q['sql'])
+        plan = self.explain(sql)
+        self.assertIn(index, plan, f'{sql}\n→ {plan}')
+
+    def setUp(self):
+        super().setUp()
+        self.exp = Experience.objects.create(name='idx')
+        DetectionMetric.objects.bulk_create(DetectionMetric(experience=self.exp) for _ in range(3))
+
+    def test_api_listings(self):
+        self.assertUsesIndex('metric_exp_time_idx', f'/api/metrics/?experience={self.exp.pk}',
+                             table='core_detectionmetric')
+        self.assertUsesIndex('metric_time_idx', '/api/metrics/', table='core_detectionmetric')
+        self.assertUsesIndex('target_created_idx', '/api/targets/', table='core_target')
+        self.assertUsesIndex('asset_created_idx', '/api/assets/', table='core_asset')
+
+    def test_maintenance_queries(self):
+        now = timezone.now()
+        self.assertUsesIndex('metric_pending_idx',
+                             queryset=DetectionMetric.objects.filter(rolled_up=False).order_by('id')[:100])
+        self.assertUsesIndex('metric_time_idx', queryset=DetectionMetric.objects.filter(
+            rolled_up=True, detected_at__lt=now).order_by('detected_at', 'id')[:100])
+        self.assertUsesIndex('rollup_bucket_period_idx', queryset=DetectionRollup.objects.filter(
+            bucket='day', period_start__gte=now - timedelta(days=30), target__isnull=True))
+        self.assertUsesIndex('upload_updated_idx', queryset=UploadSession.objects.filter(updated_at__lt=now))
+
+
+class MetricArchiveTests(MediaTestCase):
+
+    def setUp(self):
+        self.exp = Experience.objects.create(name='archive')
+        months = [datetime(2026, m, 10, tzinfo=dt_timezone.utc) for m in (1, 2, 3)]
+        DetectionMetric.objects.bulk_create(
+            [DetectionMetric(experience=self.exp, detected_at=ts, rolled_up=True) for ts in months for _ in range(4)]
+            + [DetectionMetric(experience=self.exp, detected_at=months[0], rolled_up=False)]
+        )
+
+    def test_old_rolled_up_rows_move_to_monthly_tables(self):
+        moved = archive.archive(datetime(2026, 3, 1, tzinfo=dt_timezone.utc), chunk=3)
+        self.assertEqual(moved, {'2026-01': 4, '2026-02': 4})
+        self.assertEqual([(m, n) for m, _, n in archive.months()], [('2026-01', 4), ('2026-02', 4)])
+        # quedan las recientes y la no agregada (compact aún no la ha sumado)
+        self.assertEqual(DetectionMetric.objects.count(), 5)
+        self.assertEqual(DetectionMetric.objects.filter(rolled_up=False).count(), 1)
+
+        self.assertEqual(archive.drop(datetime(2026, 2, 1, tzinfo=dt_timezone.utc)), ['2026-01'])
+        self.assertEqual([m for m, _ in archive.tables()], ['2026-02'])
+
+    def test_command_folds_pending_rows_first(self):
+        out = io.StringIO()
+        call_command('archive_metrics', '--older-than-days', '0', stdout=out)
+        self.assertEqual(DetectionMetric.objects.count(), 0)
+        self.assertEqual(sum(n for _, _, n in archive.months()), 13)
+        self.assertIn('archivadas: 13', out.getvalue())
+
+
+@override_settings(JOBS_EAGER=False)
+class RenderTests(MediaTestCase):
+
+    def run_job(self, job_id):
+        self.assertTrue(jobs.claim_one(job_id))
+        self.assertEqual(jobs.run(job_id), Job.DONE)
+
+    def test_target_thumbnails_are_shared_and_served_immutable(self):
+        image, created = self.image_upload(), []
+        for i in range(2):
+            image.seek(0)
+            created.append(self.client.post('/api/targets/', {'name': f'thumb-{i}', 'image': image}).json())
+        for job in Job.objects.filter(kind='render').order_by('id'):
+            self.run_job(job.pk)
+
+        first, second = Target.objects.filter(pk__in=[t['id'] for t in created]).order_by('id')
+        self.assertEqual(set(first.renders['thumb']), {'160', '320'})
+        self.assertEqual(first.renders, second.renders)   # misma imagen, mismo juego
+        for size, url in first.renders['thumb'].items():
+            path = Path(self._media, url[len(settings.MEDIA_URL):])
+            with Image.open(path) as img:
+                self.assertEqual((img.format, max(img.size)), ('WEBP', int(size)))
+            self.assertLess(path.stat().st_size, 30 * 1024)
+
+        response = self.client.get(first.thumbnail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        listed = self.client.get('/api/targets/?fields=id,renders').json()['results']
+        self.assertEqual({t['id']: t['renders'] for t in listed}[first.pk], first.renders)
+
+        exp = Experience.objects.create(name='thumbs')
+        exp.targets.add(first)
+        page = self.client.get('/').content.decode()
+        self.assertIn(first.thumbnail_url, page)
+        self.assertNotIn(first.image.url, page)
+
+    def test_publish_queues_qr_in_several_sizes(self):
+        exp = Experience.objects.create(name='qr')
+        data = self.client.post(f'/api/experiences/{exp.pk}/publish/').json()
+        self.assertTrue(data['qr_job'])
+        self.assertEqual(set(data['qr']['png']), {'256', '512', '1024'})
+        self.assertFalse(Path(self._media, data['qr']['svg'][len(settings.MEDIA_URL):]).exists())
+        self.run_job(data['qr_job'])
+
+        for size, url in data['qr']['png'].items():
+            with Image.open(Path(self._media, url[len(settings.MEDIA_URL):])) as img:
+                self.assertEqual(img.size, (int(size), int(size)))
+        self.assertIn(b'<svg', b''.join(self.client.get(data['qr']['svg']).streaming_content))
+        self.assertEqual(self.client.get(f'/api/experiences/{exp.pk}/').json()['renders']['qr'], data['qr'])
+        again = self.client.post(f'/api/experiences/{exp.pk}/publish/').json()
+        self.assertEqual((again['qr'], again['qr_job'], again['rebuilt']), (data['qr'], None, False))
+
+
+def _failing_job(job):
+    raise RuntimeError('falla a propósito')
+
+
+@override_settings(JOBS_EAGER=False)
+class MarkerJobTests(MediaTestCase):
+    """El alta de un target responde al instante; el marcador lo genera el worker."""
+
+    def target(self, pk):
+        return self.client.get(f'/api/targets/{pk}/').json()
+
+    def test_upload_returns_a_job_and_exposes_its_progress(self):
+        with mock.patch.object(markers, 'generate_nft', side_effect=MarkerCacheTests.fake_creator) as creator, \
+                mock.patch.object(nft, 'analyse', return_value={}):
+            response = self.client.post('/api/targets/', {'name': 'art', 'image': self.image_upload('art.png', (64, 64))})
+            self.assertEqual(response.status_code, 201, response.content)
+            data = response.json()
+            creator.assert_not_called()   # node no corre dentro de la petición
+            self.assertEqual((data['marker_status'], data['marker_progress']), (Job.PENDING, 0))
+            job = Job.objects.get(pk=data['marker_job'])
+            self.assertEqual((job.kind, job.payload), ('marker', {'target_id': data['id']}))
+
+            self.assertTrue(jobs.claim_one(job.pk))
+            self.assertFalse(jobs.claim_one(job.pk))   # otro worker no lo vuelve a coger
+            jobs.set_progress(job, 40)
+            self.assertEqual(self.target(data['id'])['marker_status'], Job.RUNNING)
+            self.assertEqual(self.target(data['id'])['marker_progress'], 40)
+
+            self.assertEqual(jobs.run(job.pk), Job.DONE)
+        creator.assert_called_once()
+        done = self.target(data['id'])
+        self.assertEqual((done['marker_status'], done['marker_progress']), (Job.DONE, 100))
+        self.assertTrue(Target.objects.get(pk=data['id']).pattfile.name.startswith('markers/'))
+
+
+class _CrashingPool:
+    """ProcessPoolExecutor de pega: el primer pool «muere» con el primer trabajo."""
+    created = 0
+
+    def __init__(self, max_workers, initializer=None):
+        type(self).created += 1
+        self.broken = type(self).created == 1
+
+    def submit(self, fn, job_id):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool('proceso muerto'))
+        else:
+            future.set_result((job_id, jobs.run(job_id)))   # en el proceso del test
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@override_settings(JOBS_EAGER=False)
+@mock.patch.dict(jobs.HANDLERS, {'boom': 'core.tests._failing_job', 'noop': 'builtins.id'})
+class JobQueueTests(DiscardBuffersMixin, TestCase):
+
+    def test_claim_is_exclusive_and_ordered(self):
+        first, second, third = (jobs.enqueue('noop') for _ in range(3))
+        self.assertTrue(jobs.claim_one(first.pk))
+        self.assertFalse(jobs.claim_one(first.pk))   # otro worker ya lo tiene
+        self.assertEqual(jobs.claim(5, ids=[second.pk, third.pk]), [second.pk, third.pk])
+        self.assertEqual(jobs.claim(5), [])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (Job.RUNNING, 1))
+        with self.assertRaises(ValueError):
+            jobs.enqueue('desconocido')
+
+    def test_failures_are_retried_until_max_attempts(self):
+        job = jobs.enqueue('boom')
+        for attempt in range(1, job.max_attempts + 1):
+            self.assertTrue(jobs.claim_one(job.pk))
+            with self.assertLogs('core.jobs', 'ERROR'):
+                status = jobs.run(job.pk)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('falla a propósito', job.error)
+            if attempt < job.max_attempts:
+                self.assertEqual((status, job.finished_at), (Job.PENDING, None))
+        self.assertEqual((status, job.status), (Job.FAILED, Job.FAILED))
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(jobs.claim_one(job.pk))
+
+        ok = jobs.enqueue('noop')
+        jobs.claim_one(ok.pk)
+        self.assertEqual(jobs.run(ok.pk), Job.DONE)
+
+
+@override_settings(JOBS_EAGER=False)
+@mock.patch.dict(jobs.HANDLERS, {'noop': 'builtins.id'})
+class JobPoolCrashTests(DiscardBuffersMixin, TransactionTestCase):
+
+    def test_dead_pool_process_fails_its_job_and_the_pool_is_replaced(self):
+        crashed, other = jobs.enqueue('noop'), jobs.enqueue('noop')
+        Job.objects.filter(pk=crashed.pk).update(max_attempts=1)
+        _CrashingPool.created = 0
+        seen = []
+        with mock.patch.object(jobs, 'ProcessPoolExecutor', _CrashingPool), self.assertLogs('core.jobs', 'ERROR'):
+            results = jobs.drain(workers=1, ids=[crashed.pk, other.pk],
+                                 on_done=lambda pk, status: seen.append((pk, status)))
+        self.assertEqual(results, {crashed.pk: Job.FAILED, other.pk: Job.DONE})
+        self.assertEqual(seen, [(crashed.pk, Job.FAILED), (other.pk, Job.DONE)])
+        self.assertEqual(_CrashingPool.created, 2)
+        self.assertIn('BrokenProcessPool', Job.objects.get(pk=crashed.pk).error)
+
+    def test_run_jobs_once_drains_the_queue(self):
+        queued = [jobs.enqueue('noop').pk for _ in range(3)]
+        Job.objects.filter(pk=queued[0]).update(status=Job.RUNNING, started_at=timezone.now() - timedelta(days=1))
+        _CrashingPool.created = 1   # ningún pool se rompe
+        out = io.StringIO()
+        with mock.patch.object(jobs, 'ProcessPoolExecutor', _CrashingPool):
+            call_command('run_jobs', '--once', '--workers', '2', stdout=out)
+        self.assertIn('1 trabajo(s) huérfano(s) devueltos a la cola', out.getvalue())
+        self.assertEqual(sorted(re.findall(r'job (\d+): done', out.getvalue())), sorted(map(str, queued)))
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
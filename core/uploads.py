@@ -0,0 +1,160 @@
+# core/uploads.py
+"""
+Subidas por trozos reanudables (init → chunk… → complete).
+
+Cada trozo se copia del stream de la petición a
+MEDIA_ROOT/uploads/tmp/<id>.part en lecturas de READ_SIZE bytes, así que la
+memoria por subida no depende ni del tamaño del fichero ni del del trozo.
+Si la conexión se corta, el cliente consulta `offset` y sigue desde ahí.
+Los trozos de una misma sesión se serializan con un flock sobre el .part y
+el offset se comprueba de nuevo con el lock tomado, así que un trozo
+reenviado (o dos PUT en paralelo) nunca se escribe dos veces.
+"""
+import contextlib
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf       import settings
+from django.core.files import File
+from django.db         import transaction
+from django.utils      import timezone
+from PIL import Image
+
+from .         import renders
+from .markers  import enqueue_marker
+from .models   import Asset, Target, UploadSession
+from .optimize import enqueue_optimize
+
+try:
+    import fcntl
+except ImportError:   # Windows: sin lock entre procesos
+    fcntl = None
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Error de protocolo; `status` es el código HTTP a devolver."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _PartFile(File):
+    # FileSystemStorage mueve (rename) en lugar de copiar si existe este método
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def purge_expired():
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff):
+        abort(session)
+
+
+def abort(session: UploadSession):
+    session.part_path.unlink(missing_ok=True)
+    session.delete()
+
+
+@contextlib.contextmanager
+def _locked_part(session: UploadSession):
+    """Abre el .part en 'r+b' con flock exclusivo: un trozo a la vez por sesión."""
+    path = session.part_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield fh
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def append(session: UploadSession, stream, offset: int, length: int, sha256: str = '') -> int:
+    """Escribe un trozo en `offset` y devuelve el nuevo offset."""
+    if length <= 0 or length > settings.UPLOAD_CHUNK_MAX:
+        raise UploadError(f'Trozo inválido (máx. {settings.UPLOAD_CHUNK_MAX} bytes)')
+    if offset + length > session.size:
+        raise UploadError('El trozo excede el tamaño declarado')
+
+    with _locked_part(session) as fh:
+        # el offset se relee con el lock tomado: otra petición pudo escribir mientras esperábamos
+        current = UploadSession.objects.filter(pk=session.pk).values_list('offset', flat=True).first()
+        if current is None:
+            raise UploadError('Subida cancelada', status=404)
+        session.offset = current
+        if offset != current:
+            raise UploadError(f'Offset esperado {current}', status=409)
+
+        digest, written = hashlib.sha256(), 0
+        fh.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            fh.write(data)
+            digest.update(data)
+            written += len(data)
+        if written != length or (sha256 and digest.hexdigest() != sha256.lower()):
+            fh.truncate(offset)   # descarta lo escrito de este trozo
+            raise UploadError('Trozo incompleto' if written != length else 'Checksum del trozo no coincide')
+        fh.flush()
+
+        # UPDATE condicional como segunda barrera (p. ej. sin fcntl en Windows)
+        new_offset = offset + length
+        if not UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+                offset=new_offset, updated_at=timezone.now()):
+            raise UploadError('Trozo enviado dos veces en paralelo', status=409)
+    session.offset = new_offset
+    return new_offset
+
+
+def _file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def complete(session: UploadSession):
+    """Valida el fichero ensamblado y crea el Asset/Target correspondiente."""
+    path = session.part_path
+    if session.offset != session.size or not path.exists() or path.stat().st_size != session.size:
+        raise UploadError(f'Faltan bytes: {session.offset}/{session.size}', status=409)
+    if session.sha256 and _file_sha256(path) != session.sha256.lower():
+        abort(session)
+        raise UploadError('Checksum del fichero no coincide')
+
+    if session.kind == UploadSession.TARGET:
+        try:
+            with Image.open(path) as img:
+                img.verify()
+        except Exception:
+            abort(session)
+            raise UploadError('El target debe ser una imagen válida')
+
+    with transaction.atomic():
+        with open(path, 'rb') as fh:
+            upload = _PartFile(fh, name=session.filename)
+            if session.kind == UploadSession.TARGET:
+                obj = Target(name=session.fields['name'],
+                             marker_profile=session.fields.get('marker_profile', 'standard'))
+                obj.image.save(session.filename, upload, save=False)
+            else:
+                obj = Asset(name=session.fields['name'], type=session.fields['type'])
+                obj.file.save(session.filename, upload, save=False)
+            obj.save()
+        if session.kind == UploadSession.TARGET:
+            enqueue_marker(obj)
+        else:
+            enqueue_optimize(obj)
+        if renders.needs_render(obj):
+            renders.enqueue_render(obj)
+        session.delete()
+    if os.path.exists(path):   # si el storage copió en vez de mover
+        os.unlink(path)
+    return obj
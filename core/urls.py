@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     TargetViewSet, AssetViewSet, ExperienceViewSet,
-    ExperienceAssetViewSet, DetectionMetricViewSet
+    ExperienceAssetViewSet, DetectionMetricViewSet, UploadViewSet, marker_cache_stats, orm_cache_stats,
+    metric_batch_async, metric_create_async
 )
 
 app_name = 'api'
@@ -13,7 +15,17 @@ router.register(r'assets', AssetViewSet)
 router.register(r'experiences', ExperienceViewSet)
 router.register(r'exp-assets', ExperienceAssetViewSet)
 router.register(r'metrics', DetectionMetricViewSet)
+router.register(r'uploads', UploadViewSet, basename='upload')
+
+# En modo ASGI la ingesta del visor va por las vistas asíncronas (mismas rutas, antes del router)
+async_metrics = [
+    path('metrics/', metric_create_async),
+    path('metrics/batch/', metric_batch_async),
+] if settings.ASYNC_PUBLIC_VIEWS else []
 
 urlpatterns = [
+    *async_metrics,
+    path('markers/cache/', marker_cache_stats, name='marker-cache-stats'),
+    path('cache/', orm_cache_stats, name='orm-cache-stats'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,127 @@
+# core/viewer_cache.py
+"""
+Caché del visor publicado.
+
+El HTML se renderiza una sola vez (al publicar o tras una invalidación) y
+se guarda en MEDIA_ROOT/viewer_<id>.html; cada proceso además mantiene una
+copia en memoria validada por el mtime del fichero, de modo que servir el
+visor cuesta un `stat` y ninguna consulta al ORM. Las señales de
+`core.signals` borran el fichero cuando cambia algo de la experiencia, lo
+que invalida a la vez las copias en memoria de todos los workers.
+
+El HTML, el paquete offline y la huella de publicación se construyen
+siempre desde la BD, nunca desde core.cache: lo que se escribe a disco lo
+sirven todos los procesos y no puede salir de la copia local de uno.
+
+El HTML no lleva los contenidos: el visor los monta por target al
+detectar su marcador, desde el manifiesto embebido. `hints` elige por
+detecciones (core.rollups) qué contenidos precargar; como el HTML se
+cachea, la elección se refresca al republicar o invalidar.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf            import settings
+from django.template.loader import render_to_string
+
+from . import manifest, rollups
+
+_lock   = threading.Lock()
+_memory = {}   # exp_id → (mtime_ns, html, etag)
+
+
+def path_for(exp_id) -> Path:
+    return Path(settings.MEDIA_ROOT, f'viewer_{exp_id}.html')
+
+
+def _etag(html: str) -> str:
+    return '"%s"' % hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]
+
+
+def write_atomic(path: Path, data: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def hints(scene: dict, totals: dict) -> dict:
+    """
+    URLs de los contenidos a precargar: los de los VIEWER_PREFETCH_TARGETS
+    targets más detectados (empate: orden del manifiesto) que quepan en
+    VIEWER_PREFETCH_MB, más el presupuesto de MB montados del visor.
+    """
+    ranked = sorted(scene['targets'], key=lambda t: -totals.get(t['id'], 0))
+    prefetch, mb, n = [], 0, 0
+    for target in ranked:
+        if n >= settings.VIEWER_PREFETCH_TARGETS:
+            break
+        urls = [p['asset']['url'] for p in target['assets'] if p['asset']['url']]
+        size = sum(p['asset']['size_mb'] for p in target['assets'])
+        if not urls or mb + size > settings.VIEWER_PREFETCH_MB:
+            continue
+        prefetch += [url for url in urls if url not in prefetch]
+        mb, n = mb + size, n + 1
+    return {
+        'prefetch':  prefetch,
+        'budget_mb': settings.VIEWER_ASSET_BUDGET_MB,
+    }
+
+
+def viewer_context(exp) -> dict:
+    """
+    El visor se pinta desde el mismo manifiesto que consume el editor,
+    leído de la BD con un número fijo de consultas (ver core.manifest),
+    más una consulta a los agregados de detecciones.
+    """
+    scene = manifest.build(exp)
+    return {'experience': exp, 'manifest': scene, 'hints': hints(scene, rollups.target_totals(exp.pk))}
+
+
+def store(exp, context=None):
+    """Renderiza el visor de `exp`, lo escribe a disco y devuelve (html, etag)."""
+    html = render_to_string('viewer.html', context or viewer_context(exp))
+    path = path_for(exp.pk)
+    write_atomic(path, html)
+    entry = (path.stat().st_mtime_ns, html, _etag(html))
+    with _lock:
+        _memory[exp.pk] = entry
+    return entry[1:]
+
+
+def load(exp_id):
+    """(html, etag) del visor cacheado, o None si no hay versión vigente."""
+    path = path_for(exp_id)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        with _lock:
+            _memory.pop(exp_id, None)
+        return None
+
+    entry = _memory.get(exp_id)
+    if entry is None or entry[0] != mtime:
+        try:
+            html = path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        entry = (mtime, html, _etag(html))
+        with _lock:
+            _memory[exp_id] = entry
+    return entry[1:]
+
+
+def invalidate(*exp_ids):
+    for exp_id in exp_ids:
+        with _lock:
+            _memory.pop(exp_id, None)
+        path_for(exp_id).unlink(missing_ok=True)
@@ -1,28 +1,49 @@
 # core/views.py
-import os
-import subprocess
-from django.db.models import F 
+import json
+from datetime import timedelta
+from django.db.models import Count, F, Prefetch
 from pathlib import Path
 
-import qrcode
 from django.conf             import settings
+from django.core.exceptions  import SuspiciousFileOperation
+from django.http             import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts        import render, redirect, get_object_or_404
 from django.template.loader  import render_to_string
+from django.utils            import timezone
+from django.utils.cache      import patch_cache_control
+from django.utils.crypto     import constant_time_compare
+from django.utils._os        import safe_join
+from django.utils.http       import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib.auth     import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 
-from rest_framework import viewsets, status
+from asgiref.sync  import sync_to_async
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.parsers     import MultiPartParser, FormParser
 from rest_framework.response    import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from .            import (
+    bundle, cache, media, metrics, perf, publishing, renders, rollups, scene, storage, uploads, viewer_cache
+)
+from .authentication import CsrfExemptSessionAuthentication
+from .counters    import view_counter
 from .forms       import ExperienceForm
-from .models      import Target, Asset, Experience, ExperienceAsset, DetectionMetric
+from .markers     import enqueue_marker, cache_stats
+from .optimize    import enqueue_optimize
+from .cache       import CachedObjectMixin
+from .pagination  import CountMixin
+from .models      import Target, Asset, Experience, ExperienceAsset, DetectionMetric, Job, UploadSession
 from .serializers import (
     TargetSerializer, AssetSerializer, ExperienceSerializer,
-    ExperienceAssetSerializer, DetectionMetricSerializer
+    ExperienceAssetSerializer, DetectionMetricSerializer, DetectionBatchSerializer, DetectionItemSerializer,
+    RollupQuerySerializer, SceneOpsSerializer, UploadSessionSerializer, requested_fields,
+    check_detection_ids, detection_ids
 )
 
 
@@ -48,7 +69,12 @@ def logout_view(request):
 
 @login_required
 def dashboard_view(request):
-    exps = Experience.objects.all().order_by('-id')
+    exps = Experience.objects.annotate(
+        n_targets=Count('targets', distinct=True),
+        n_assets=Count('experienceasset', distinct=True),
+    ).prefetch_related(   # sólo las miniaturas: nunca la imagen original del target
+        Prefetch('targets', queryset=Target.objects.only('id', 'renders').order_by('id'))
+    ).order_by('-id')
     return render(request, 'dashboard.html', {'experiences': exps})
 
 
@@ -93,126 +119,351 @@ def editor_view(request, id):
 
 @login_required
 def viewer_view(request, id):
-    exp = get_object_or_404(Experience, pk=id, is_published=True)
-    exp.views = F('views') + 1
-    exp.save(update_fields=['views'])
-    return render(request, 'viewer.html', {'experience': exp})
+    cached = viewer_cache.load(id)
+    if cached is None:   # primera visita tras publicar o invalidar: de la BD, no de core.cache
+        exp = Experience.objects.filter(pk=id).first()
+        if exp is None or not exp.is_published:
+            raise Http404
+        cached = viewer_cache.store(exp)
+    view_counter.add(id)
+    return _viewer_response(request, *cached)
+
+
+def _viewer_response(request, html, etag):
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(html)
+    response['ETag'] = etag
+    patch_cache_control(response, max_age=settings.VIEWER_CACHE_MAX_AGE)
+    return response
+
+
+def viewer_sw_view(request, id):
+    """Service worker del visor: cachea el paquete de la última publicación."""
+    index = bundle.current(id)
+    if index is None:
+        raise Http404
+    urls = [p['url'] for p in index['precache']]
+    js = render_to_string('viewer_sw.js', {
+        'exp_id':  id,
+        'index':   index,
+        'urls':    json.dumps(urls),
+        'install': json.dumps(index.get('install', urls)),   # publicaciones anteriores: todo
+    })
+    response = HttpResponse(js, content_type='application/javascript')
+    response['Service-Worker-Allowed'] = f'/viewer/{id}/'
+    patch_cache_control(response, no_cache=True)   # el navegador comprueba versión en cada visita
+    return response
+
+
+def bundle_view(request, id, name):
+    """Zip de una publicación: el nombre lleva el hash, caché inmutable."""
+    path = bundle.bundle_dir(id) / name
+    if not name.endswith('.zip') or '/' in name or not path.is_file():
+        raise Http404
+    response = media.serve(request, path, etag=f'"{path.stem}"', immutable=True)
+    response['Content-Disposition'] = f'attachment; filename="experience-{id}.zip"'
+    return response
+
+
+def blob_view(request, name):
+    """Sirve un blob de Asset: el nombre es el hash, así que nunca cambia."""
+    name = f'{storage.BLOB_DIR}/{name}'
+    try:
+        path = Path(storage.blob_storage.path(name))   # rechaza rutas fuera de MEDIA_ROOT
+    except SuspiciousFileOperation:
+        raise Http404
+    if not path.is_file():
+        raise Http404
+    return media.serve(request, path, etag=f'"{storage.digest_of(name)}"', immutable=True)
+
+
+def render_view(request, name):
+    """QR y miniaturas de core.renders: la ruta lleva el hash, caché inmutable."""
+    try:
+        path = Path(safe_join(settings.MEDIA_ROOT, renders.RENDER_DIR, name))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not path.is_file() or any(p.startswith('.') for p in Path(name).parts):
+        raise Http404
+    return media.serve(request, path, etag=f'"{path.parent.name[:16]}-{path.stem}"', immutable=True)
+
+
+def media_view(request, path):
+    """Resto de MEDIA_ROOT (marcadores, visores): rangos, .br/.gz y ETag."""
+    try:
+        full = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    parts = Path(path).parts
+    if not full.is_file() or parts[0] in media.PRIVATE_DIRS or any(p.startswith('.') for p in parts):
+        raise Http404
+    return media.serve(request, full)
+
+
+def prometheus_view(request):
+    """Métricas de core.perf (todos los procesos) en formato de texto Prometheus."""
+    token = settings.PERF_METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponse(status=401 if token else 403)
+    response = HttpResponse(perf.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_cache_control(response, no_store=True)
+    return response
 
 
 # ---------- API REST ----------
-class TargetViewSet(viewsets.ModelViewSet):
-    queryset         = Target.objects.all().order_by('-created_at')
+class TargetViewSet(CachedObjectMixin, CountMixin, viewsets.ModelViewSet):
+    queryset         = Target.objects.select_related('marker_job').order_by('-created_at')
+    cache_namespace  = 'target'
+    cache_depends    = (Job,)   # marker_status / marker_progress
     serializer_class = TargetSerializer
     parser_classes   = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated]
     filter_backends  = [DjangoFilterBackend]
     filterset_fields = [
         'experience__id',            # ✅  → /api/targets/?experience__id=1
-        'experienceasset__experience'
+        'ea_set__experience'
     ]
 
-    # --- helpers -------------------------------------------------
-    def _generate_nft(self, image_path: str) -> Path:
-        """
-        Ejecuta @webarkit/nft-marker-creator-app y devuelve el prefijo (Path sin extensión).
-        """
-        out_dir = Path(image_path).parent
-        base    = Path(image_path).stem
-        script  = Path(
-            settings.BASE_DIR,
-            'tools', 'nft-marker',
-            'node_modules', '@webarkit',
-            'nft-marker-creator-app', 'src', 'NFTMarkerCreator.js'
-        )
-
-        subprocess.run(
-            ['node', str(script),
-             '-i', str(image_path),
-             '-o', str(out_dir),
-             '-noConf'],
-            check=True,
-            stdout=subprocess.DEVNULL
-        )
-        return out_dir / base
-
     # -------------------------------------------------------------
+    # La generación del marcador NFT tarda decenas de segundos: se encola
+    # y la atiende `manage.py run_jobs`; el cliente sigue el progreso con
+    # marker_status / marker_progress. Las miniaturas van en otro trabajo.
     def perform_create(self, serializer):
         target = serializer.save()
-        marker_prefix = self._generate_nft(target.image.path)
-        target.pattfile.name = os.path.relpath(marker_prefix, settings.MEDIA_ROOT)
-        target.save(update_fields=['pattfile'])
+        enqueue_marker(target)
+        renders.enqueue_render(target)
 
     def perform_update(self, serializer):
-        instance = serializer.save()
-        if 'image' in serializer.validated_data:   # regenera sólo si cambió img
-            self.perform_create(serializer)
-
-
-class AssetViewSet(viewsets.ModelViewSet):
-    queryset         = Asset.objects.all().order_by('-created_at')
+        changed = serializer.validated_data.keys()
+        # las miniaturas eran de la imagen anterior
+        instance = serializer.save(**({'renders': {}} if 'image' in changed else {}))
+        # regenera sólo si cambió la imagen o el perfil
+        if {'image', 'marker_profile'} & changed:
+            enqueue_marker(instance)
+        if 'image' in changed:
+            renders.enqueue_render(instance)
+
+
+class AssetViewSet(CachedObjectMixin, CountMixin, viewsets.ModelViewSet):
+    queryset         = Asset.objects.select_related('process_job').order_by('-created_at')
+    cache_namespace  = 'asset'
+    cache_depends    = (Job,)   # processing_status
     serializer_class = AssetSerializer
     parser_classes   = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated]
 
+    # El derivado optimizado (imagen/GLB/vídeo) y las miniaturas los genera run_jobs.
+    def perform_create(self, serializer):
+        asset = serializer.save()
+        enqueue_optimize(asset)
+        if renders.needs_render(asset):
+            renders.enqueue_render(asset)
 
-class ExperienceViewSet(viewsets.ModelViewSet):
+    def perform_update(self, serializer):
+        rerender = bool({'file', 'type'} & serializer.validated_data.keys())
+        instance = serializer.save(**({'renders': {}} if rerender else {}))
+        if 'file' in serializer.validated_data:
+            if instance.optimized:   # el derivado era del fichero anterior
+                instance.optimized.delete(save=False)
+                instance.optimized_size_mb = 0
+                instance.save(update_fields=['optimized', 'optimized_size_mb'])
+            enqueue_optimize(instance)
+        if rerender and renders.needs_render(instance):
+            renders.enqueue_render(instance)
+
+
+class ExperienceViewSet(CachedObjectMixin, CountMixin, viewsets.ModelViewSet):
     queryset         = Experience.objects.all().order_by('-id')
+    cache_namespace  = 'experience'
+    cursor_ordering  = ('-id',)
     serializer_class = ExperienceSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        fields = requested_fields(self.request)
+        if (self.action in ('list', 'retrieve', 'create', 'update', 'partial_update')
+                and (fields is None or 'targets' in fields)):
+            qs = qs.prefetch_related('targets')
+        return qs
+
+    @action(detail=True, methods=['GET'])
+    def manifest(self, request, pk=None):
+        """Escena completa en una petición; 304 si el ETag no ha cambiado."""
+        data, etag = cache.scene_manifest(int(pk), self.get_object)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)   # revalidar siempre
+        return response
+
     @action(detail=True, methods=['PATCH'])
     def save_config(self, request, pk=None):
-        exp = self.get_object()
-        exp.config_json = request.data.get('config_json', {})
-        exp.save(update_fields=['config_json'])
+        exp = self.get_object()   # permisos; la escritura no parte de esta lectura
+        scene.replace_config(exp.pk, request.data.get('config_json', {}))
         return Response({'status': 'config saved'})
 
+    @action(detail=True, methods=['POST'])
+    def ops(self, request, pk=None):
+        """Lote de altas/cambios/bajas de contenidos + JSON Patch de config_json (ver core.scene)."""
+        exp  = self.get_object()
+        body = SceneOpsSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        try:
+            result = scene.apply_ops(exp, **body.validated_data)
+        except scene.Conflict as e:
+            return Response({'detail': str(e), 'version': e.version}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:   # OpError / PatchError
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
     @action(detail=True, methods=['POST'])
     def publish(self, request, pk=None):
         exp = self.get_object()
+        try:
+            result = publishing.publish(exp, request.build_absolute_uri(f'/viewer/{exp.id}/'))
+        except publishing.PublishError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(result)
 
-        total_size = sum(ea.asset.file.size for ea in exp.experienceasset_set.all())
-        if total_size > 50 * 1024 * 1024:
-            return Response({'error': 'Contenido demasiado grande'}, status=400)
-
-        exp.is_published = True
-        exp.save(update_fields=['is_published'])
 
-        # Render estático del visor
-        html = render_to_string('viewer.html', {'experience': exp}, request=request)
-        out  = Path(settings.MEDIA_ROOT, f'viewer_{exp.id}.html')
-        out.write_text(html, encoding='utf-8')
+class ExperienceAssetViewSet(CountMixin, viewsets.ModelViewSet):
+    queryset         = ExperienceAsset.objects.all()
+    cursor_ordering  = ('id',)
+    serializer_class = ExperienceAssetSerializer
+    permission_classes = [IsAuthenticated]
 
-        # QR corto
-        qr = qrcode.make(request.build_absolute_uri(f'/viewer/{exp.id}/'))
-        qr.save(Path(settings.MEDIA_ROOT, f'qr_exp_{exp.id}.png'))
+    # las escrituras sueltas también cuentan para el control de versión de /ops/
+    def _bump(self, experience_id):
+        Experience.objects.filter(pk=experience_id).update(version=F('version') + 1)
+        cache.touch(Experience, experience_id)
 
-        return Response({'viewer_url': f'{settings.MEDIA_URL}{out.name}'})
+    def perform_create(self, serializer):
+        self._bump(serializer.save().experience_id)
 
+    def perform_update(self, serializer):
+        self._bump(serializer.save().experience_id)
 
-class ExperienceAssetViewSet(viewsets.ModelViewSet):
-    queryset         = ExperienceAsset.objects.all()
-    serializer_class = ExperienceAssetSerializer
-    permission_classes = [IsAuthenticated]
+    def perform_destroy(self, instance):
+        instance.delete()
+        self._bump(instance.experience_id)
 
 
-class DetectionMetricViewSet(viewsets.ModelViewSet):
+class DetectionMetricViewSet(CountMixin, viewsets.ModelViewSet):
     queryset         = DetectionMetric.objects.all()
+    cursor_ordering  = ('-detected_at', '-id')
+    filterset_fields = ['experience', 'target']   # ?experience= va por metric_exp_time_idx
     serializer_class = DetectionMetricSerializer
     permission_classes = [AllowAny]  # se permite desde el visor público
+    authentication_classes = [CsrfExemptSessionAuthentication]
 
     def create(self, request, *args, **kwargs):
-        super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data.get('target')
+        metrics.record(serializer.validated_data['experience'].pk, target.pk if target else None)
         return Response({'status': 'metric saved'}, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['POST'])
+    def batch(self, request):
+        """{"detections": [{"experience": 1, "detected_at": "..."}, ...]} → un solo INSERT por lote."""
+        serializer = DetectionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        detections = serializer.validated_data['detections']
+        metrics.record_many(detections)
+        return Response({'status': 'metrics queued', 'count': len(detections)},
+                        status=status.HTTP_202_ACCEPTED)
+
+    # --- analítica: sólo lee DetectionRollup --------------------
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
+    def weekly(self, request):
+        """Detecciones por día de los últimos 7 días (formato del gráfico del dashboard)."""
+        end    = rollups.period_start(timezone.now(), 'day') + timedelta(days=1)
+        points = rollups.series('day', end - timedelta(days=7), end,
+                                experience_id=request.query_params.get('experience'))
+        return Response({
+            'labels': [p.strftime('%d/%m') for p, _ in points],
+            'values': [n for _, n in points],
+        })
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
+    def series(self, request):
+        """?bucket=hour|day&start=&end=&experience=&target="""
+        query = RollupQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        q = query.validated_data
+        points = rollups.series(q['bucket'], q['start'], q['end'],
+                                experience_id=q.get('experience'), target_id=q.get('target'))
+        return Response({
+            'bucket': q['bucket'],
+            'points': [{'period_start': p.isoformat(), 'count': n} for p, n in points],
+        })
+
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Subida reanudable:
+      POST   /api/uploads/                    {kind, filename, size, name, type?, sha256?}
+      PUT    /api/uploads/<id>/chunk/         cuerpo binario, cabecera Upload-Offset
+      GET    /api/uploads/<id>/               → offset para reanudar
+      POST   /api/uploads/<id>/complete/      → Target o Asset creado
+      DELETE /api/uploads/<id>/
+    """
+    serializer_class   = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        uploads.purge_expired()
+        serializer.save(owner=self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        uploads.abort(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['PUT'])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'detail': 'Upload-Offset inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            new_offset = uploads.append(session, request.stream, offset, length,
+                                        request.headers.get('X-Chunk-SHA256', ''))
+        except uploads.UploadError as e:
+            return Response({'detail': str(e), 'offset': session.offset}, status=e.status)
+        return Response({'offset': new_offset, 'size': session.size})
+
+    @action(detail=True, methods=['POST'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        try:
+            obj = uploads.complete(session)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=e.status)
+        serializer = TargetSerializer if isinstance(obj, Target) else AssetSerializer
+        return Response(serializer(obj, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
 
 # ---------- Aux endpoints (sin auth porque vienen del visor público) ----------
 @api_view(['PATCH'])
 @permission_classes([AllowAny])
 def save_config(request, id):
-    exp = get_object_or_404(Experience, pk=id)
-    exp.config_json = request.data.get('config_json', {})
-    exp.save(update_fields=['config_json'])
+    if not scene.replace_config(id, request.data.get('config_json', {})):
+        raise Http404
     return Response({'status': 'config updated'})
 
 
@@ -220,14 +471,106 @@ def save_config(request, id):
 @permission_classes([AllowAny])
 def publish_experience(request, id):
     exp = get_object_or_404(Experience, pk=id)
-    if exp.is_published:
-        return Response({'error': 'Ya publicada'}, status=400)
+    try:
+        result = publishing.publish(exp, request.build_absolute_uri(f'/viewer/{exp.id}/'))
+    except publishing.PublishError as e:
+        return Response({'error': str(e)}, status=400)
+    return Response(result)
+
+
+# ---------- Camino público asíncrono (SERVER_MODE=asgi) ----------
+# Mismo contrato que viewer_view, DetectionMetricViewSet.create/batch y
+# save_config, pero sin ocupar un hilo por petición: el visor cacheado y
+# la ingesta de métricas no tocan la BD (caché + buffers) y lo que sí la
+# toca va por el ORM async. yukiAR/urls.py y core/urls.py las montan en
+# las mismas rutas con ASYNC_PUBLIC_VIEWS.
+def _json_body(request):
+    """Cuerpo JSON de la petición (objeto) o None si no lo es."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
 
-    exp.is_published = True
-    exp.save(update_fields=['is_published'])
 
-    html = render_to_string('viewer.html', {'experience': exp}, request=request)
-    out  = Path(settings.MEDIA_ROOT, f'viewer_{exp.id}.html')
-    out.write_text(html, encoding='utf-8')
-
-    return Response({'viewer_url': f'{settings.MEDIA_URL}{out.name}'})
+@login_required
+async def viewer_view_async(request, id):
+    # stat + lectura del fichero: fuera del bucle de eventos, como cualquier E/S de disco
+    cached = await sync_to_async(viewer_cache.load, thread_sensitive=False)(id)
+    if cached is None:
+        exp = await Experience.objects.filter(pk=id).afirst()   # como viewer_view: sin core.cache
+        if exp is None or not exp.is_published:
+            raise Http404
+        cached = await sync_to_async(viewer_cache.store)(exp)   # manifiesto + plantilla
+    await view_counter.aadd(id)
+    return _viewer_response(request, *cached)
+
+
+async def _check_detections(items):
+    """check_detection_ids() contra la caché de objetos (ORM async sólo en un fallo)."""
+    ids, tids = detection_ids(items)
+    experiences = {pk for pk in ids
+                   if await cache.aget_object('experience', Experience.objects, pk) is not None}
+    targets     = {pk for pk in tids
+                   if await cache.aget_object('target', Target.objects, pk, variant='exists') is not None}
+    check_detection_ids(items, experiences, targets)
+
+
+_metric_list = DetectionMetricViewSet.as_view({'get': 'list'})
+
+
+@csrf_exempt   # como CsrfExemptSessionAuthentication: el visor llama con sendBeacon
+async def metric_create_async(request):
+    """POST /api/metrics/ asíncrono; el resto de métodos siguen en DetectionMetricViewSet."""
+    if request.method != 'POST':
+        return await sync_to_async(_metric_list)(request)
+    item = DetectionItemSerializer(data=_json_body(request))
+    if not item.is_valid():
+        return JsonResponse(item.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        await _check_detections([item.validated_data])
+    except ValidationError as e:
+        return JsonResponse({'non_field_errors': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+    await metrics.arecord_many([item.validated_data])
+    return JsonResponse({'status': 'metric saved'}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def metric_batch_async(request):
+    body = DetectionBatchSerializer(data=_json_body(request))
+    body.check_ids = False
+    if not body.is_valid():
+        return JsonResponse(body.errors, status=status.HTTP_400_BAD_REQUEST)
+    detections = body.validated_data['detections']
+    try:
+        await _check_detections(detections)
+    except ValidationError as e:
+        return JsonResponse({'detections': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+    await metrics.arecord_many(detections)
+    return JsonResponse({'status': 'metrics queued', 'count': len(detections)},
+                        status=status.HTTP_202_ACCEPTED)
+
+
+@csrf_exempt   # AllowAny: cualquiera puede llamarlo sin cookie, CSRF no protege nada aquí
+@require_http_methods(['PATCH'])
+async def save_config_async(request, id):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'detail': 'Se esperaba un objeto JSON'}, status=status.HTTP_400_BAD_REQUEST)
+    if not await scene.areplace_config(id, data.get('config_json', {})):
+        raise Http404
+    return JsonResponse({'status': 'config updated'})
+
+
+# ---------- Endpoints de administración ----------
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def marker_cache_stats(request):
+    return Response(cache_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def orm_cache_stats(request):
+    return Response(cache.stats())
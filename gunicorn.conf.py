@@ -0,0 +1,18 @@
+# gunicorn.conf.py — gunicorn lo carga automáticamente desde el directorio de trabajo
+import os
+
+# SERVER_MODE (ver yukiAR/settings.py): 'wsgi' workers síncronos, 'asgi' workers uvicorn
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app     = 'yukiAR.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'yukiAR.wsgi:application'
+
+
+def worker_exit(server, worker):
+    # vuelca métricas/contadores pendientes en memoria antes de que el worker muera;
+    # su registro pasa a PERF_DIR/_total.json en lugar de dejar un <pid>.json huérfano
+    from core.buffers import flush_all
+    from core.perf    import registry
+    flush_all()
+    registry.retire()
@@ -1,4 +1,6 @@
 import os
+import tempfile
+
 import dj_database_url
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,11 +26,15 @@ LOGIN_URL = '/login/'
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
 }
+API_PAGE_SIZE     = int(os.environ.get('API_PAGE_SIZE', '50'))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', '500'))
 
 MIDDLEWARE = [
+    'core.perf.PerfMiddleware',   # primero: mide también al resto de middlewares
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.WhiteNoiseMiddleware',   # whitenoise, también asíncrono (ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,3 +102,99 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # Confianza CSRF para dominios trycloudflare
 CSRF_TRUSTED_ORIGINS = ['https://*.trycloudflare.com']
 WHITENOISE_MIMETYPES = {'.glb': 'model/gltf-binary'}
+
+# Cola de trabajos en segundo plano (manage.py run_jobs)
+JOBS_WORKERS     = int(os.environ.get('JOBS_WORKERS', '0')) or None   # None → nº de CPUs
+JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER', '900'))     # seg. antes de re-encolar
+JOBS_EAGER       = os.environ.get('JOBS_EAGER', '') == 'True'         # ejecuta en el request (dev)
+
+# Caché de marcadores NFT compartidos (MEDIA_ROOT/markers/)
+MARKER_CACHE_MAX_BYTES = int(os.environ.get('MARKER_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# Visor publicado: segundos que el navegador puede reutilizarlo sin revalidar
+VIEWER_CACHE_MAX_AGE = int(os.environ.get('VIEWER_CACHE_MAX_AGE', '60'))
+# Carga perezosa de contenidos por target (viewer.html): precarga de los más detectados
+# y presupuesto de MB montados antes de descargar los menos recientes
+VIEWER_PREFETCH_TARGETS = int(os.environ.get('VIEWER_PREFETCH_TARGETS', '2'))
+VIEWER_PREFETCH_MB      = float(os.environ.get('VIEWER_PREFETCH_MB', '20'))
+VIEWER_ASSET_BUDGET_MB  = float(os.environ.get('VIEWER_ASSET_BUDGET_MB', '150'))
+
+# Ingesta de métricas del visor: volcado por lotes (1 → inserción inmediata)
+METRICS_BUFFER_SIZE        = int(os.environ.get('METRICS_BUFFER_SIZE', '500'))
+METRICS_FLUSH_INTERVAL     = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_BULK_BATCH_SIZE    = 500
+METRICS_BATCH_MAX          = 1000   # detecciones por petición a /api/metrics/batch/
+METRICS_ARCHIVE_AFTER_DAYS = int(os.environ.get('METRICS_ARCHIVE_AFTER_DAYS', '90'))   # archive_metrics
+
+# Contador de visitas del visor: deltas en memoria volcados periódicamente
+VIEWS_BUFFER_SIZE    = int(os.environ.get('VIEWS_BUFFER_SIZE', '1000'))
+VIEWS_FLUSH_INTERVAL = float(os.environ.get('VIEWS_FLUSH_INTERVAL', '5'))
+
+# Derivados optimizados de Asset (core/optimize.py, trabajo 'asset')
+ASSET_IMAGE_MAX_PX   = 2048
+ASSET_TEXTURE_MAX_PX = 1024
+ASSET_IMAGE_QUALITY  = 82
+ASSET_MESH_RATIO     = float(os.environ.get('ASSET_MESH_RATIO', '0') or 0) or None   # requiere gltf-transform
+ASSET_VIDEO_MAX_PX   = 1280
+ASSET_VIDEO_MAXRATE  = '1500k'
+ASSET_AUDIO_BITRATE  = '96k'
+
+# Derivados de presentación (core/renders.py, trabajo 'render')
+RENDER_QR_SIZES      = (256, 512, 1024)   # px de los PNG; el SVG escala solo
+RENDER_THUMB_SIZES   = (160, 320)         # lado mayor; 320 = 160 a 2x
+RENDER_THUMB_QUALITY = 75
+
+# Subidas por trozos reanudables (/api/uploads/)
+UPLOAD_CHUNK_SIZE  = 4 * 1024 ** 2        # tamaño recomendado al cliente
+UPLOAD_CHUNK_MAX   = 16 * 1024 ** 2       # máximo aceptado por PUT
+UPLOAD_MAX_SIZE    = 500 * 1024 ** 2
+UPLOAD_SESSION_TTL = 24 * 3600            # seg. sin actividad antes de descartar
+
+# Blobs de assets (MEDIA_ROOT/blobs/): caché del navegador/CDN y gracia antes del GC
+BLOB_CACHE_MAX_AGE = int(os.environ.get('BLOB_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+BLOB_GC_GRACE      = int(os.environ.get('BLOB_GC_GRACE', str(24 * 3600)))   # seg.
+
+# Escrituras por lotes de la escena (/api/experiences/<id>/ops/)
+SCENE_OPS_MAX = int(os.environ.get('SCENE_OPS_MAX', '1000'))
+
+# Servicio de MEDIA_ROOT (core/media.py): caché de lo que no va por hash y,
+# detrás de nginx, prefijo `internal` para X-Accel-Redirect (vacío → sendfile de gunicorn)
+MEDIA_CACHE_MAX_AGE  = int(os.environ.get('MEDIA_CACHE_MAX_AGE', '3600'))
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+
+# Caché (core/cache.py): memoria local por proceso; con CACHE_REDIS_URL
+# (redis://127.0.0.1:6379/1, Redis o compatible; requiere el paquete `redis`)
+# la comparten todos los workers y las invalidaciones llegan a todos. En
+# memoria local otro proceso (otro worker, run_jobs) sólo ve los cambios al
+# caducar la entrada, de ahí el TTL corto por defecto
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND':  'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND':  'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yukiar',
+        'OPTIONS':  {'MAX_ENTRIES': 10000},
+    }
+}
+ORM_CACHE_TTL = int(os.environ.get('ORM_CACHE_TTL', '300' if CACHE_REDIS_URL else '15'))   # seg.
+
+# Instrumentación (core/perf.py): /metrics en formato Prometheus (con
+# PERF_METRICS_TOKEN se exige "Authorization: Bearer <token>"; sin él, staff)
+PERF_DIR             = os.environ.get('PERF_DIR', os.path.join(tempfile.gettempdir(), 'yukiar-perf'))
+PERF_DUMP_INTERVAL   = float(os.environ.get('PERF_DUMP_INTERVAL', '10'))   # seg. entre volcados por proceso
+PERF_METRICS_TOKEN   = os.environ.get('PERF_METRICS_TOKEN', '')
+PERF_SERVER_TIMING   = os.environ.get('PERF_SERVER_TIMING', str(DEBUG)) == 'True'
+PERF_PROFILE_RATE    = float(os.environ.get('PERF_PROFILE_RATE', '0'))     # fracción de peticiones bajo cProfile
+PERF_PROFILE_SLOW_MS = float(os.environ.get('PERF_PROFILE_SLOW_MS', '500'))
+PERF_PROFILE_DIR     = os.environ.get('PERF_PROFILE_DIR', os.path.join(PERF_DIR, 'profiles'))
+PERF_PROFILE_KEEP    = 50
+
+# Modo de servidor (gunicorn.conf.py elige worker y aplicación): 'wsgi' =
+# workers síncronos, un hilo por petición; 'asgi' = workers uvicorn sobre
+# yukiAR.asgi. ASYNC_PUBLIC_VIEWS monta las vistas asíncronas del visor
+# público, la ingesta de métricas y save_config (activadas con 'asgi'; bajo
+# WSGI cada vista async necesitaría su propio bucle y sería más lenta)
+SERVER_MODE        = os.environ.get('SERVER_MODE', 'wsgi')
+ASYNC_PUBLIC_VIEWS = os.environ.get('ASYNC_PUBLIC_VIEWS', str(SERVER_MODE == 'asgi')) == 'True'
@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from core import views as core_views
 
@@ -14,7 +13,10 @@ urlpatterns = [
 
     # Editor y visor
     path('editor/<int:id>/', core_views.editor_view, name='editor'),
-    path('viewer/<int:id>/', core_views.viewer_view, name='viewer'),
+    path('viewer/<int:id>/',
+         core_views.viewer_view_async if settings.ASYNC_PUBLIC_VIEWS else core_views.viewer_view,
+         name='viewer'),
+    path('viewer/<int:id>/sw.js', core_views.viewer_sw_view, name='viewer_sw'),
 
     # Autenticación
     path('login/', core_views.login_view, name='login'),
@@ -27,10 +29,19 @@ urlpatterns = [
     path('api/', include(('core.urls', 'api'), namespace='api')),
 
     # Endpoints auxiliares
-    path('save_config/<int:id>/', core_views.save_config, name='save_config'),
+    path('save_config/<int:id>/',
+         core_views.save_config_async if settings.ASYNC_PUBLIC_VIEWS else core_views.save_config,
+         name='save_config'),
     path('publish/<int:id>/', core_views.publish_experience, name='publish_experience'),
     path('test-ar/', TemplateView.as_view(template_name='test_ar.html'), name='test_ar'),
-]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Métricas Prometheus (core.perf)
+    path('metrics', core_views.prometheus_view, name='metrics'),
+
+    # Blobs de assets (direccionados por hash, caché inmutable también en producción)
+    path(f"{settings.MEDIA_URL.strip('/')}/blobs/<path:name>", core_views.blob_view, name='blob'),
+    path(f"{settings.MEDIA_URL.strip('/')}/bundles/<int:id>/<str:name>", core_views.bundle_view, name='bundle'),
+    path(f"{settings.MEDIA_URL.strip('/')}/renders/<path:name>", core_views.render_view, name='render'),
+    # Resto de media con rangos y variantes .br/.gz (con MEDIA_ACCEL_REDIRECT lo entrega nginx)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", core_views.media_view, name='media'),
+]